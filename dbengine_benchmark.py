@@ -0,0 +1,95 @@
+import argparse
+import json
+import logging
+import time
+
+from lib.dbengine import BACKEND_RECORDS, BACKEND_SQLITE3, DB_MODE_DISK, DB_MODE_MEMORY, DB_MODE_MMAP, DBEngine
+from wikisql_eval import evaluate_predictions, load_predictions_from_file
+
+
+# (backend, mode) pairs, the first one being the baseline of the speedups
+CONFIGURATIONS = [
+    (BACKEND_RECORDS, DB_MODE_DISK),
+    (BACKEND_SQLITE3, DB_MODE_DISK),
+    (BACKEND_SQLITE3, DB_MODE_MMAP),
+    (BACKEND_SQLITE3, DB_MODE_MEMORY),
+]
+
+
+class DBEngineBenchmark:
+    @staticmethod
+    def run(db_path, test_data, predictions, backend, mode, repeat):
+        start_time = time.perf_counter()
+        engine = DBEngine(db_path, preload_schemas=True, backend=backend, mode=mode)
+        setup_seconds = time.perf_counter() - start_time
+
+        # the fastest of the repeats, the first one also warming up the page cache
+        seconds = None
+        for _ in range(repeat):
+            start_time = time.perf_counter()
+            metrics = evaluate_predictions(test_data, predictions, engine, verbose=False)
+            elapsed_seconds = time.perf_counter() - start_time
+            seconds = elapsed_seconds if seconds is None else min(seconds, elapsed_seconds)
+
+        return {
+            'backend': backend,
+            'mode': mode,
+            'rows': len(test_data),
+            'setup_seconds': setup_seconds,
+            'seconds': seconds,
+            'rows_per_second': len(test_data) / seconds if seconds else 0.0,
+            'ex_accuracy': metrics['full_ex_accuracy'],
+            'lf_accuracy': metrics['full_lf_accuracy'],
+        }
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)s : %(name)s - %(levelname)s : %(message)s')
+    logger = logging.getLogger('root')
+    logger.setLevel(logging.INFO)
+
+    parser = argparse.ArgumentParser(
+        prog='Text-to-SQL DBEngine Benchmark',
+        description='Compares the WikiSQL evaluation throughput of each database backend and mode',
+    )
+
+    parser.add_argument('--predictions-path', type=str, default=None, help='Specify the location of the model predictions (the gold queries are evaluated by default)')
+    parser.add_argument('--limit', type=int, default=None, help='Specify how many rows of the WikiSQL test split to use (all of them by default)')
+    parser.add_argument('--repeat', type=int, default=3, help='Specify how many times the rows are evaluated in each mode, the fastest run being reported')
+    parser.add_argument('--db-path', type=str, default='data/test.db', help='Specify the path to the WikiSQL test database')
+    parser.add_argument('--output-path', type=str, default=None, help='Specify a file where to store the results as JSON')
+    args = parser.parse_args()
+
+    from datasets import load_dataset
+
+    test_data = load_dataset('wikisql', split='test')
+    if args.limit is not None:
+        test_data = test_data.select(range(min(args.limit, len(test_data))))
+
+    if args.predictions_path:
+        predictions = load_predictions_from_file(args.predictions_path)
+    else:
+        predictions = [row['sql']['human_readable'] for row in test_data]
+
+    results = []
+    for backend, mode in CONFIGURATIONS:
+        logger.info('Benchmarking the \'%s\' backend in the \'%s\' mode on %d rows.', backend, mode, len(test_data))
+        result = DBEngineBenchmark.run(args.db_path, test_data, predictions, backend, mode, args.repeat)
+        logger.info('Results: %s', result)
+        results.append(result)
+
+    # every mode runs the same queries, so a difference in the metrics is a bug
+    for result in results[1:]:
+        if (result['ex_accuracy'], result['lf_accuracy']) != (results[0]['ex_accuracy'], results[0]['lf_accuracy']):
+            logger.warning('The \'%s\' backend in the \'%s\' mode computed different metrics than the baseline.', result['backend'], result['mode'])
+
+    print('\n{:<10}{:<10}{:>12}{:>14}{:>10}{:>10}{:>10}'.format('backend', 'mode', 'setup_s', 'rows/s', 'speedup', 'acc_ex', 'acc_lf'))
+    for result in results:
+        print('{:<10}{:<10}{:>12.3f}{:>14.1f}{:>10.2f}{:>10.4f}{:>10.4f}'.format(
+            result['backend'], result['mode'], result['setup_seconds'], result['rows_per_second'],
+            result['rows_per_second'] / results[0]['rows_per_second'] if results[0]['rows_per_second'] else 0.0,
+            result['ex_accuracy'], result['lf_accuracy']))
+
+    if args.output_path:
+        with open(args.output_path, 'w') as file:
+            json.dump(results, file, indent=4)
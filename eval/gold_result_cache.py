@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+
+
+# gold results are stored next to the database they were executed on
+GOLD_CACHE_SUFFIX = '.gold.jsonl'
+
+HASH_CHUNK_SIZE = 2 ** 20
+
+
+def get_default_gold_cache_path(db_file):
+    return db_file + GOLD_CACHE_SUFFIX
+
+
+def hash_file(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_gold_result_key(table_id, query):
+    # the gold queries are executed lowercased, and the order of their conditions does not change their result
+    conditions = sorted([col, op, str(cond).lower()] for col, op, cond in query.conditions)
+    return table_id, json.dumps([query.sel_index, query.agg_index, conditions])
+
+
+class GoldResultCache:
+    def __init__(self, path, db_file):
+        self.__path = path
+        self.__db_hash = hash_file(db_file)
+
+        self.__results = {}
+        self.__new_keys = []
+        # the file is rewritten instead of appended to when it belongs to another database or is damaged
+        self.__rewrite = True
+
+        if os.path.exists(path):
+            self.__load()
+
+    @property
+    def path(self):
+        return self.__path
+
+    @property
+    def db_hash(self):
+        return self.__db_hash
+
+    @property
+    def new_results(self):
+        return len(self.__new_keys)
+
+    def __len__(self):
+        return len(self.__results)
+
+    def __contains__(self, key):
+        return key in self.__results
+
+    def __getitem__(self, key):
+        return self.__results[key]
+
+    def __setitem__(self, key, result):
+        if key not in self.__results:
+            self.__new_keys.append(key)
+        self.__results[key] = result
+
+    def save(self):
+        if self.__rewrite:
+            temp_path = self.__path + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as file:
+                file.write(json.dumps({'db_hash': self.__db_hash}) + '\n')
+                for key, result in self.__results.items():
+                    self.__write_entry(file, key, result)
+            os.replace(temp_path, self.__path)
+            self.__rewrite = False
+        elif self.__new_keys:
+            with open(self.__path, 'a', encoding='utf-8') as file:
+                for key in self.__new_keys:
+                    self.__write_entry(file, key, self.__results[key])
+
+        self.__new_keys = []
+
+    @staticmethod
+    def __write_entry(file, key, result):
+        file.write(json.dumps({'table_id': key[0], 'query': key[1], 'result': result}) + '\n')
+
+    def __load(self):
+        # the entries are streamed, so that only the results are kept in memory
+        with open(self.__path, 'r', encoding='utf-8') as file:
+            try:
+                header = json.loads(file.readline())
+            except json.JSONDecodeError:
+                return
+            if header.get('db_hash') != self.__db_hash:
+                return
+
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # an interrupted save leaves a partial last entry behind
+                    return
+                self.__results[(entry['table_id'], entry['query'])] = entry['result']
+
+        self.__rewrite = False
@@ -1,8 +1,7 @@
-from datasets import load_metric
-
-
 class RougeMetrics:
     def __init__(self, tokenizer):
+        from datasets import load_metric
+
         self.__rouge = load_metric("rouge")
         self.__tokenizer = tokenizer
 
@@ -0,0 +1,118 @@
+import copy
+import os
+import shutil
+import tempfile
+import unittest
+
+import records
+
+from eval.gold_result_cache import GoldResultCache, get_default_gold_cache_path, get_gold_result_key
+from eval.tests.test_wikisql_eval import GOLD_QUERIES, TABLES, create_test_data
+from lib.dbengine import DBEngine
+from lib.query import Query
+from wikisql_eval import evaluate_predictions, evaluate_predictions_parallel
+
+
+class TestGoldResultCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_file = os.path.join(self.temp_dir, 'test.db')
+        self.cache_path = get_default_gold_cache_path(self.db_file)
+
+        db = records.Database('sqlite:///{}'.format(self.db_file))
+        with db.transaction() as connection:
+            for table in TABLES:
+                table.create_table(connection)
+        db.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def count_executed_queries(self, engine):
+        executed_queries = []
+        execute_query = engine.execute_query
+
+        def counting_execute_query(table_id, query, *args, **kwargs):
+            executed_queries.append(query)
+            return execute_query(table_id, query, *args, **kwargs)
+
+        engine.execute_query = counting_execute_query
+        return executed_queries
+
+    def test_gold_queries_are_executed_once(self):
+        test_data, predictions = create_test_data()
+        expected_metrics = evaluate_predictions(copy.deepcopy(test_data), predictions, DBEngine(self.db_file), verbose=False)
+
+        gold_results = GoldResultCache(self.cache_path, self.db_file)
+        assert len(gold_results) == 0
+        assert evaluate_predictions(copy.deepcopy(test_data), predictions, DBEngine(self.db_file), verbose=False, gold_results=gold_results) == expected_metrics
+        assert gold_results.new_results == len(GOLD_QUERIES)
+        gold_results.save()
+
+        # a later run only executes the predicted queries that parse
+        gold_results = GoldResultCache(self.cache_path, self.db_file)
+        assert len(gold_results) == len(GOLD_QUERIES)
+
+        engine = DBEngine(self.db_file)
+        executed_queries = self.count_executed_queries(engine)
+        assert evaluate_predictions(copy.deepcopy(test_data), predictions, engine, verbose=False, gold_results=gold_results) == expected_metrics
+        assert len(executed_queries) == len(test_data) - expected_metrics['all_exceptions']
+        assert gold_results.new_results == 0
+
+    def test_parallel_evaluation_fills_the_cache(self):
+        test_data, predictions = create_test_data()
+        expected_metrics = evaluate_predictions(copy.deepcopy(test_data), predictions, DBEngine(self.db_file), verbose=False)
+
+        gold_results = GoldResultCache(self.cache_path, self.db_file)
+        assert evaluate_predictions_parallel(copy.deepcopy(test_data), predictions, self.db_file, 2, verbose=False, gold_results=gold_results) == expected_metrics
+        assert gold_results.new_results == len(GOLD_QUERIES)
+        gold_results.save()
+
+        gold_results = GoldResultCache(self.cache_path, self.db_file)
+        assert evaluate_predictions_parallel(copy.deepcopy(test_data), predictions, self.db_file, 2, verbose=False, gold_results=gold_results) == expected_metrics
+        assert gold_results.new_results == 0
+
+    def test_cache_of_another_database_is_discarded(self):
+        key = get_gold_result_key('table_2_12345_1', Query(2, 0, [[0, 0, 'Raptors']]))
+        gold_results = GoldResultCache(self.cache_path, self.db_file)
+        gold_results[key] = ['toronto']
+        gold_results.save()
+        assert key in GoldResultCache(self.cache_path, self.db_file)
+
+        db = records.Database('sqlite:///{}'.format(self.db_file))
+        with db.transaction() as connection:
+            TABLES[1].create_table(connection, replace_existing=True)
+        db.close()
+
+        gold_results = GoldResultCache(self.cache_path, self.db_file)
+        assert key not in gold_results
+
+        gold_results[key] = ['toronto']
+        gold_results.save()
+        assert GoldResultCache(self.cache_path, self.db_file)[key] == ['toronto']
+
+    def test_partially_written_cache(self):
+        first_key = get_gold_result_key('table_2_12345_1', Query(2, 0, [[0, 0, 'Raptors']]))
+        second_key = get_gold_result_key('table_2_12345_1', Query(1, 1, [[2, 0, 'Boston']]))
+
+        gold_results = GoldResultCache(self.cache_path, self.db_file)
+        gold_results[first_key] = ['toronto']
+        gold_results.save()
+        with open(self.cache_path, 'a', encoding='utf-8') as file:
+            file.write('{"table_id": "table_2_12345_1", "que')
+
+        gold_results = GoldResultCache(self.cache_path, self.db_file)
+        assert gold_results[first_key] == ['toronto']
+
+        # the damaged entry is dropped when the cache is saved again
+        gold_results[second_key] = [25.0]
+        gold_results.save()
+        gold_results = GoldResultCache(self.cache_path, self.db_file)
+        assert len(gold_results) == 2
+        assert gold_results[second_key] == [25.0]
+
+    def test_equivalent_gold_queries_share_a_key(self):
+        key = get_gold_result_key('table_1', Query(0, 0, [[1, 0, 'Guard'], [2, 1, '10']]))
+        assert get_gold_result_key('table_1', Query(0, 0, [[2, 1, 10], [1, 0, 'guard']], ordered=True)) == key
+        assert get_gold_result_key('table_1', Query(0, 3, [[1, 0, 'Guard'], [2, 1, '10']])) != key
+        assert get_gold_result_key('table_2', Query(0, 0, [[1, 0, 'Guard'], [2, 1, '10']])) != key
@@ -0,0 +1,144 @@
+import copy
+import os
+import shutil
+import tempfile
+import unittest
+
+import records
+
+from lib.dbengine import BACKEND_SQLITE3, DB_MODE_MEMORY, DB_MODES, DBEngine
+from lib.table import Table
+from wikisql_eval import evaluate_predictions, evaluate_predictions_parallel
+
+
+TABLES = [
+    Table('1-10015132-11', ['Player', 'No.', 'Position', 'Years'], ['text', 'real', 'text', 'text'], [
+        ['Terrence Ross', 31, 'Guard', '2012-present'],
+        ['Kyle Lowry', 7, 'Guard', '2012-present'],
+        ['Jonas Valanciunas', 17, 'Center', '2012-present'],
+        ['Chris Bosh', 4, 'Forward', '2003-2010'],
+    ]),
+    Table('2-12345-1', ['Team', 'Wins', 'City'], ['text', 'real', 'text'], [
+        ['Raptors', 48, 'Toronto'],
+        ['Celtics', 25, 'Boston'],
+        ['Lakers', 45, 'Los Angeles'],
+    ]),
+]
+
+# (table, select index, aggregation index, conditions, human readable query)
+GOLD_QUERIES = [
+    (0, 2, 0, [[0, 0, 'Terrence Ross']], 'SELECT Position FROM table WHERE Player = Terrence Ross'),
+    (0, 0, 0, [[2, 0, 'Guard']], 'SELECT Player FROM table WHERE Position = Guard'),
+    (0, 1, 3, [[2, 0, 'Center']], 'SELECT COUNT No. FROM table WHERE Position = Center'),
+    (0, 0, 0, [[1, 1, '10']], 'SELECT Player FROM table WHERE No. > 10'),
+    (1, 2, 0, [[0, 0, 'Raptors']], 'SELECT City FROM table WHERE Team = Raptors'),
+    (1, 1, 1, [[2, 0, 'Boston']], 'SELECT MAX Wins FROM table WHERE City = Boston'),
+    (1, 0, 0, [[1, 2, '46']], 'SELECT Team FROM table WHERE Wins < 46'),
+]
+
+# predictions that differ from the gold query, but give the same result
+EQUIVALENT_PREDICTIONS = {
+    2: 'SELECT COUNT Player FROM table WHERE Position = Center',
+    5: 'SELECT MIN Wins FROM table WHERE City = Boston',
+}
+
+WRONG_PREDICTIONS = [
+    'SELECT Player FROM table WHERE Position = Center',
+    'SELECT Team FROM table WHERE City = Toronto',
+    'SELECT Height FROM table WHERE Player = Kyle Lowry',
+    'not a query at all',
+]
+
+
+def create_test_data():
+    test_data, predictions = [], []
+    for index in range(60):
+        table_index, select_index, aggregation_index, conditions, human_readable = GOLD_QUERIES[index % len(GOLD_QUERIES)]
+        table = TABLES[table_index]
+        test_data.append({
+            'question': 'Question {}'.format(index),
+            'table': {'id': table.table_id, 'header': table.header, 'types': table.types},
+            'sql': {
+                'human_readable': human_readable,
+                'sel': select_index,
+                'agg': aggregation_index,
+                'conds': {
+                    'column_index': [condition[0] for condition in conditions],
+                    'operator_index': [condition[1] for condition in conditions],
+                    'condition': [condition[2] for condition in conditions]
+                }
+            }
+        })
+
+        # a mix of exact, executionally correct, wrong and unparsable predictions
+        if index % 3 == 0:
+            predictions.append(human_readable)
+        elif index % 3 == 1:
+            predictions.append(EQUIVALENT_PREDICTIONS.get(index % len(GOLD_QUERIES), human_readable.lower()))
+        else:
+            predictions.append(WRONG_PREDICTIONS[index % len(WRONG_PREDICTIONS)])
+
+    return test_data, predictions
+
+
+class TestWikiSQLEval(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.temp_dir = tempfile.mkdtemp()
+        cls.db_file = os.path.join(cls.temp_dir, 'test.db')
+
+        db = records.Database('sqlite:///{}'.format(cls.db_file))
+        with db.transaction() as connection:
+            for table in TABLES:
+                table.create_table(connection)
+        db.close()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.temp_dir)
+
+    def test_parallel_evaluation_matches_the_serial_evaluation(self):
+        test_data, predictions = create_test_data()
+        serial_metrics = evaluate_predictions(copy.deepcopy(test_data), predictions, DBEngine(self.db_file), verbose=False)
+
+        assert 0 < serial_metrics['ex_accuracy'] < 1
+        assert 0 < serial_metrics['lf_accuracy'] < serial_metrics['ex_accuracy']
+        assert serial_metrics['all_exceptions'] > 0
+
+        for workers in [1, 2, 3]:
+            parallel_metrics = evaluate_predictions_parallel(copy.deepcopy(test_data), predictions, self.db_file, workers, verbose=False)
+            assert parallel_metrics == serial_metrics, workers
+
+    def test_sqlite3_backend_matches_the_records_backend(self):
+        test_data, predictions = create_test_data()
+        records_metrics = evaluate_predictions(copy.deepcopy(test_data), predictions, DBEngine(self.db_file), verbose=False)
+
+        sqlite3_metrics = evaluate_predictions(copy.deepcopy(test_data), predictions, DBEngine(self.db_file, backend=BACKEND_SQLITE3), verbose=False)
+        assert sqlite3_metrics == records_metrics
+
+        parallel_metrics = evaluate_predictions_parallel(copy.deepcopy(test_data), predictions, self.db_file, 2, verbose=False, db_backend=BACKEND_SQLITE3)
+        assert parallel_metrics == records_metrics
+
+    def test_database_modes_match_the_disk_mode(self):
+        test_data, predictions = create_test_data()
+        disk_metrics = evaluate_predictions(copy.deepcopy(test_data), predictions, DBEngine(self.db_file), verbose=False)
+
+        for mode in DB_MODES:
+            engine = DBEngine(self.db_file, preload_schemas=True, backend=BACKEND_SQLITE3, mode=mode)
+            assert evaluate_predictions(copy.deepcopy(test_data), predictions, engine, verbose=False) == disk_metrics, mode
+
+        parallel_metrics = evaluate_predictions_parallel(copy.deepcopy(test_data), predictions, self.db_file, 2, verbose=False,
+                                                         db_backend=BACKEND_SQLITE3, db_mode=DB_MODE_MEMORY)
+        assert parallel_metrics == disk_metrics
+
+    def test_read_only_engine(self):
+        engine = DBEngine(self.db_file, read_only=True)
+        assert engine.execute_from_sql('1-10015132-11', 'SELECT col0 FROM table WHERE col2 = \'center\'') == ['jonas valanciunas']
+
+        with self.assertRaises(Exception):
+            engine.conn.query('DROP TABLE {}'.format(TABLES[0].name))
+
+    def test_missing_predictions(self):
+        test_data, predictions = create_test_data()
+        with self.assertRaises(Exception):
+            evaluate_predictions_parallel(test_data, predictions[:-1], self.db_file, 2, verbose=False)
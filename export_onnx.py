@@ -0,0 +1,22 @@
+import argparse
+import logging
+
+from loader.onnx_export import DEFAULT_OPSET_VERSION, export_to_onnx
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)s : %(name)s - %(levelname)s : %(message)s')
+    logger = logging.getLogger('root')
+    logger.setLevel(logging.INFO)
+
+    parser = argparse.ArgumentParser(
+        prog='Text-to-SQL ONNX Export',
+        description='Exports a pretrained model to ONNX encoder and decoder graphs, served by the onnxruntime backend',
+    )
+
+    parser.add_argument('--pretrained-path', type=str, required=True, help='Specify the path to the pretrained model to export')
+    parser.add_argument('--opset', type=int, default=DEFAULT_OPSET_VERSION, help='Specify the ONNX opset version')
+    args = parser.parse_args()
+
+    onnx_path = export_to_onnx(args.pretrained_path, args.opset)
+    logger.info('Exported the ONNX graphs to {}'.format(onnx_path))
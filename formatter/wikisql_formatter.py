@@ -1,10 +1,7 @@
-import torch
 import logging
 import re
 import difflib
 
-from datasets import load_dataset
-
 
 AGGREGATORS = ['MAX', 'MIN', 'COUNT', 'SUM', 'AVG']
 COND_OPS = ['=', '>', '<']
@@ -115,6 +112,8 @@ if __name__ == '__main__':
     logger = logging.getLogger('root')
     logger.setLevel(logging.INFO)
 
+    from datasets import load_dataset
+
     # load test dataset split
     test_data = load_dataset('wikisql', split='test')
 
@@ -0,0 +1,89 @@
+import argparse
+import logging
+import os
+import subprocess
+import sys
+
+
+REPO_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# modules that only inference, training or evaluation runs should pay for
+HEAVY_MODULES = ['torch', 'transformers', 'datasets', 'numpy', 'onnx', 'onnxruntime', 'records']
+
+# modules imported when the web server or a non-inference tool starts
+STARTUP_MODULES = [
+    'web.sqlgen_server.app',
+    'loader.pretrained_loader',
+    'formatter.wikisql_formatter',
+    'lib.dbengine',
+    'schema_parser.json_schema_parser',
+    'wikisql_eval'
+]
+
+
+class ImportTimeBenchmark:
+    @staticmethod
+    def measure_import_times(module_name):
+        # a fresh interpreter is used, so that the modules already imported by the caller are measured too
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get('PYTHONPATH')])))
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import {}'.format(module_name)], cwd=REPO_ROOT, env=env, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise Exception('Could not import {}: {}'.format(module_name, result.stderr.strip().splitlines()[-1]))
+
+        # lines look like 'import time: <self us> | <cumulative us> | <module name indented by its import depth>'
+        imports = []
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            _, cumulative_time, name = line[len('import time:'):].split('|')
+            imports.append((name.strip(), len(name) - len(name.lstrip()), int(cumulative_time)))
+
+        # a module is listed right after its nested imports; what comes before was imported by the interpreter startup
+        end = max(index for index, (name, _, _) in enumerate(imports) if name == module_name)
+        start = end
+        while start > 0 and imports[start - 1][1] > imports[end][1]:
+            start -= 1
+        return {name: cumulative_time for name, _, cumulative_time in imports[start:end + 1]}
+
+    @staticmethod
+    def get_heavy_modules(import_times):
+        return sorted(name for name in import_times if name in HEAVY_MODULES)
+
+    @staticmethod
+    def run(module_names, top):
+        results = {}
+        for module_name in module_names:
+            import_times = ImportTimeBenchmark.measure_import_times(module_name)
+            slowest_imports = sorted(import_times.items(), key=lambda item: -item[1])[:top]
+
+            results[module_name] = {
+                'import_seconds': import_times[module_name] / 1e6,
+                'slowest_imports': [(name, cumulative_time / 1e6) for name, cumulative_time in slowest_imports],
+                'heavy_modules': ImportTimeBenchmark.get_heavy_modules(import_times)
+            }
+        return results
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)s : %(name)s - %(levelname)s : %(message)s')
+    logger = logging.getLogger('root')
+    logger.setLevel(logging.INFO)
+
+    parser = argparse.ArgumentParser(
+        prog='Text-to-SQL Import Time Benchmark',
+        description='Measures the import time of the startup modules and fails if one of them imports a heavy machine learning module',
+    )
+
+    parser.add_argument('--modules', type=str, nargs='+', default=STARTUP_MODULES, help='Specify the modules to import')
+    parser.add_argument('--top', type=int, default=5, help='Specify how many of the slowest imports are logged for each module')
+    args = parser.parse_args()
+
+    results = ImportTimeBenchmark.run(args.modules, args.top)
+    for module_name, result in results.items():
+        logger.info('{}: {:.3f}s'.format(module_name, result['import_seconds']))
+        for name, cumulative_seconds in result['slowest_imports']:
+            logger.info('    {}: {:.3f}s'.format(name, cumulative_seconds))
+        if result['heavy_modules']:
+            logger.error('{} imports {} at startup'.format(module_name, ', '.join(result['heavy_modules'])))
+
+    sys.exit(1 if any(result['heavy_modules'] for result in results.values()) else 0)
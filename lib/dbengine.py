@@ -1,5 +1,6 @@
-import records
 import re
+import sqlite3
+import weakref
 from babel.numbers import parse_decimal, NumberFormatError
 from lib.query import Query
 
@@ -7,12 +8,124 @@ from lib.query import Query
 schema_re = re.compile(r'\((.+)\)')
 num_re = re.compile(r'[-+]?\d*\.\d+|\d+')
 
+# records goes through SQLAlchemy, sqlite3 runs parameterized statements on a read-only connection of the standard library
+BACKEND_RECORDS = 'records'
+BACKEND_SQLITE3 = 'sqlite3'
+
+# how the sqlite3 backend opens the database: from disk, memory-mapped and never locked, or copied into memory at startup
+DB_MODE_DISK = 'disk'
+DB_MODE_MMAP = 'mmap'
+DB_MODE_MEMORY = 'memory'
+DB_MODES = (DB_MODE_DISK, DB_MODE_MMAP, DB_MODE_MEMORY)
+
+# large enough to map the whole WikiSQL test database
+DEFAULT_MMAP_SIZE = 2 ** 30
+
+# every live engine, so that recreating a table drops its cached schema from all of them
+engines = weakref.WeakSet()
+
+
+def get_table_id(table_id):
+    if not table_id.startswith('table'):
+        table_id = 'table_{}'.format(table_id.replace('-', '_'))
+    return table_id
+
+
+def parse_schema(table_info):
+    schema_str = schema_re.findall(table_info)[0]
+    schema = {}
+    for tup in schema_str.split(', '):
+        c, t = tup.split()
+        schema[c] = t
+    return schema
+
+
+def invalidate_table_schema(table_id):
+    for engine in list(engines):
+        engine.invalidate_schema(table_id)
+
 
 class DBEngine:
 
-    def __init__(self, fdb):
-        self.db = records.Database('sqlite:///{}'.format(fdb))
-        self.conn = self.db.get_connection()
+    def __init__(self, fdb, read_only=False, preload_schemas=False, backend=BACKEND_RECORDS, mode=DB_MODE_DISK):
+        self.backend = backend
+        self.mode = mode
+        if mode not in DB_MODES:
+            raise Exception('Unknown database mode: {}'.format(mode))
+        if mode != DB_MODE_DISK and backend != BACKEND_SQLITE3:
+            raise Exception('The {} database mode is only supported by the {} backend'.format(mode, BACKEND_SQLITE3))
+
+        if backend == BACKEND_SQLITE3:
+            # the engine only reads, so the sqlite3 connection is always read-only
+            self.db = None
+            self.conn = self.__connect_sqlite3(fdb, mode)
+        elif backend == BACKEND_RECORDS:
+            import records
+            if read_only:
+                # sqlite rejects every write through this connection, so that evaluation workers can share the database file
+                self.db = records.Database('sqlite:///file:{}?mode=ro&uri=true'.format(fdb))
+            else:
+                self.db = records.Database('sqlite:///{}'.format(fdb))
+            self.conn = self.db.get_connection()
+        else:
+            raise Exception('Unknown database backend: {}'.format(backend))
+
+        # parsed column name to type schemas, by table id
+        self.schemas = {}
+        if preload_schemas:
+            self.preload_schemas()
+        engines.add(self)
+
+    @staticmethod
+    def __connect_sqlite3(fdb, mode):
+        if mode == DB_MODE_MEMORY:
+            # a single copy of every page through the backup api, after which no query touches the file
+            source = sqlite3.connect('file:{}?mode=ro'.format(fdb), uri=True)
+            conn = sqlite3.connect(':memory:')
+            try:
+                source.backup(conn)
+            finally:
+                source.close()
+        elif mode == DB_MODE_MMAP:
+            # immutable skips the file locks and change checks, so the file must not be written while it is open
+            conn = sqlite3.connect('file:{}?mode=ro&immutable=1'.format(fdb), uri=True)
+            conn.execute('PRAGMA mmap_size = {}'.format(DEFAULT_MMAP_SIZE))
+        else:
+            return sqlite3.connect('file:{}?mode=ro'.format(fdb), uri=True)
+
+        conn.execute('PRAGMA query_only = ON')
+        return conn
+
+    def preload_schemas(self):
+        # a single scan of sqlite_master, instead of one query per table
+        for table_info in self.query_all('SELECT tbl_name, sql from sqlite_master WHERE type = \'table\''):
+            try:
+                self.schemas[table_info[0]] = parse_schema(table_info[1])
+            except (IndexError, ValueError):
+                # tables that are not WikiSQL tables are left out
+                continue
+
+    def get_schema(self, table_id):
+        table_id = get_table_id(table_id)
+
+        schema = self.schemas.get(table_id)
+        if schema is None:
+            if self.backend == BACKEND_SQLITE3:
+                table_info = self.query_all('SELECT sql from sqlite_master WHERE tbl_name = ?', (table_id,))
+            else:
+                table_info = self.query_all('SELECT sql from sqlite_master WHERE tbl_name = \'{}\''.format(table_id))
+            schema = parse_schema(table_info[0][0])
+            self.schemas[table_id] = schema
+        return schema
+
+    def invalidate_schema(self, table_id):
+        self.schemas.pop(get_table_id(table_id), None)
+
+    def query_all(self, query, parameters=()):
+        # plain tuples from sqlite3, records otherwise, both indexable by column
+        if self.backend == BACKEND_SQLITE3:
+            return self.conn.execute(query, parameters).fetchall()
+        return self.conn.query(query).all()
 
     def execute_query_from_sql(self, table_id, query):
         return self.execute_from_sql(table_id, query)
@@ -21,33 +134,23 @@ class DBEngine:
         return self.execute(table_id, query.sel_index, query.agg_index, query.conditions, *args, **kwargs)
 
     def execute_from_sql(self, table_id, query):
-        if not table_id.startswith('table'):
-            table_id = 'table_{}'.format(table_id.replace('-', '_'))
+        table_id = get_table_id(table_id)
 
         query = query.replace("table", table_id)
 
-        out = self.conn.query(query)
+        out = self.query_all(query)
         return [o[0] for o in out]
 
     def execute(self, table_id, select_index, aggregation_index, conditions, lower=True):
-        if not table_id.startswith('table'):
-            table_id = 'table_{}'.format(table_id.replace('-', '_'))
-
-        # table_info = self.conn.query('SELECT sql from sqlite_master WHERE tbl_name = :name', name=table_id).all()[0].sql
-        table_info = self.conn.query('SELECT sql from sqlite_master WHERE tbl_name = \'{}\''.format(table_id)).all()
-        table_info = table_info[0][0]
-
-        schema_str = schema_re.findall(table_info)[0]
-        schema = {}
-        for tup in schema_str.split(', '):
-            c, t = tup.split()
-            schema[c] = t
+        table_id = get_table_id(table_id)
+        schema = self.get_schema(table_id)
+
         select = 'col{}'.format(select_index)
         agg = Query.agg_ops[aggregation_index]
         if agg:
             select = '{}({})'.format(agg, select)
         where_clause = []
-        where_map = {}
+        where_values = []
 
         # if len(conditions[0]) > 0:
         try:
@@ -62,8 +165,11 @@ class DBEngine:
                     except TypeError as e:
                         continue
 
-                # where_clause.append('col{} {} :col{}'.format(col_index, Query.cond_ops[op], col_index))
-                # where_map['col{}'.format(col_index)] = val
+                # bound values keep the statement text the same across rows, so that the sqlite3 statement cache is hit
+                if self.backend == BACKEND_SQLITE3:
+                    where_clause.append('col{} {} ?'.format(col_index, Query.cond_ops[op]))
+                    where_values.append(val)
+                    continue
 
                 val = val.replace("'", "''") if isinstance(val, str) else val
                 where_clause.append('col{} {} \'{}\''.format(col_index, Query.cond_ops[op], val))
@@ -75,7 +181,6 @@ class DBEngine:
             where_str = 'WHERE ' + ' AND '.join(where_clause)
         query = 'SELECT {} AS result FROM {} {}'.format(select, table_id, where_str)
 
-        # out = self.conn.query(query, **where_map)
-        out = self.conn.query(query)
+        out = self.query_all(query, where_values)
 
         return [o[0] for o in out]
@@ -0,0 +1,87 @@
+import threading
+import time
+
+from collections import OrderedDict
+
+
+class LRUCache:
+    def __init__(self, max_entries, ttl_seconds=None, clock=time.monotonic, on_remove=None):
+        self.__max_entries = max_entries
+        self.__ttl_seconds = ttl_seconds
+        self.__clock = clock
+        # called with the key and the value of every entry dropped by the cache itself, i.e. evicted or expired
+        self.__on_remove = on_remove
+
+        # least recently used entries come first, each stored with the time it was put
+        self.__entries = OrderedDict()
+        self.__lock = threading.RLock()
+
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+        self.__expirations = 0
+        self.__invalidations = 0
+
+    def __len__(self):
+        with self.__lock:
+            return len(self.__entries)
+
+    def __contains__(self, key):
+        with self.__lock:
+            return key in self.__entries
+
+    def get(self, key, default=None):
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None and self.__ttl_seconds is not None and self.__clock() - entry[1] > self.__ttl_seconds:
+                self.__remove(key)
+                self.__expirations += 1
+                entry = None
+
+            if entry is None:
+                self.__misses += 1
+                return default
+
+            self.__hits += 1
+            self.__entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value):
+        with self.__lock:
+            self.__entries[key] = (value, self.__clock())
+            self.__entries.move_to_end(key)
+
+            while len(self.__entries) > self.__max_entries:
+                self.__remove(next(iter(self.__entries)))
+                self.__evictions += 1
+
+    def invalidate(self, key):
+        with self.__lock:
+            if self.__entries.pop(key, None) is None:
+                return False
+            self.__invalidations += 1
+            return True
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+
+    def stats(self):
+        with self.__lock:
+            lookups = self.__hits + self.__misses
+            return {
+                'entries': len(self.__entries),
+                'max_entries': self.__max_entries,
+                'ttl_seconds': self.__ttl_seconds,
+                'hits': self.__hits,
+                'misses': self.__misses,
+                'hit_rate': self.__hits / lookups if lookups else 0.0,
+                'evictions': self.__evictions,
+                'expirations': self.__expirations,
+                'invalidations': self.__invalidations,
+            }
+
+    def __remove(self, key):
+        value, _ = self.__entries.pop(key)
+        if self.__on_remove is not None:
+            self.__on_remove(key, value)
@@ -1,5 +1,6 @@
 import re
 from tabulate import tabulate
+from lib.dbengine import invalidate_table_schema
 from lib.query import Query
 import random
 
@@ -62,6 +63,7 @@ class Table:
                 return
         type_str = ', '.join(['col{} {}'.format(i, t) for i, t in enumerate(self.types)])
         db.query('CREATE TABLE {name} ({types})'.format(name=self.name, types=type_str))
+        invalidate_table_schema(self.name)
         for row in self.rows:
             value_str = ', '.join([':val{}'.format(j) for j, c in enumerate(row)])
             value_dict = {'val{}'.format(j): c for j, c in enumerate(row)}
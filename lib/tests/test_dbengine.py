@@ -0,0 +1,152 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import records
+
+from lib.dbengine import BACKEND_SQLITE3, DB_MODE_MEMORY, DB_MODE_MMAP, DB_MODES, DBEngine
+from lib.query import Query
+from lib.table import Table
+
+
+PLAYERS_TABLE = Table('1-10015132-11', ['Player', 'No.', 'Position'], ['text', 'real', 'text'], [
+    ['Terrence Ross', 31, 'Guard'],
+    ['Kyle Lowry', 7, 'Guard'],
+    ['Jonas Valanciunas', 17, 'Center'],
+])
+
+ROSTER_TABLE = Table('1-10015132-12', ['Player', 'No.', 'Position'], ['text', 'real', 'text'], [
+    ['Terrence Ross', 31, 'Guard'],
+    ['Shaquille O\'Neal', 32.5, 'Center'],
+    ['1996', 1996, 'Guard'],
+])
+
+# (table, select index, aggregation index, conditions)
+QUERIES = [
+    (ROSTER_TABLE, 0, 0, [[1, 1, '10']]),
+    (ROSTER_TABLE, 0, 0, [[1, 0, '32.5']]),
+    (ROSTER_TABLE, 0, 0, [[1, 2, '1,000']]),
+    (ROSTER_TABLE, 0, 0, [[1, 1, 'no. 30']]),
+    (ROSTER_TABLE, 0, 0, [[1, 0, 17]]),
+    (ROSTER_TABLE, 2, 0, [[0, 0, 'Shaquille O\'Neal']]),
+    (ROSTER_TABLE, 2, 0, [[0, 0, 1996]]),
+    (ROSTER_TABLE, 1, 1, [[2, 0, 'Center']]),
+    (ROSTER_TABLE, 1, 3, [[2, 0, 'Guard'], [1, 2, '20']]),
+    (ROSTER_TABLE, 1, 5, []),
+    (ROSTER_TABLE, 0, 0, [[2, 0, 'Forward']]),
+    (ROSTER_TABLE, 0, 0, [[2, 1, 'F']]),
+]
+
+TEAMS_TABLE = Table('2-12345-1', ['Team', 'City'], ['text', 'text'], [
+    ['Raptors', 'Toronto'],
+    ['Celtics', 'Boston'],
+])
+
+
+class TestDBEngine(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_file = os.path.join(self.temp_dir, 'test.db')
+
+        self.db = records.Database('sqlite:///{}'.format(self.db_file))
+        with self.db.transaction() as connection:
+            PLAYERS_TABLE.create_table(connection)
+            TEAMS_TABLE.create_table(connection)
+            ROSTER_TABLE.create_table(connection)
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.temp_dir)
+
+    def count_metadata_queries(self, engine):
+        metadata_queries = []
+        query = engine.conn.query
+
+        def counting_query(sql, *args, **kwargs):
+            if 'sqlite_master' in sql:
+                metadata_queries.append(sql)
+            return query(sql, *args, **kwargs)
+
+        engine.conn.query = counting_query
+        return metadata_queries
+
+    def test_schemas_are_parsed_once_per_table(self):
+        engine = DBEngine(self.db_file)
+        metadata_queries = self.count_metadata_queries(engine)
+
+        for _ in range(3):
+            assert engine.execute_query(PLAYERS_TABLE.table_id, Query(0, 0, [[1, 1, '10']])) == ['terrence ross', 'jonas valanciunas']
+            assert engine.execute_query(TEAMS_TABLE.table_id, Query(1, 0, [[0, 0, 'Celtics']])) == ['boston']
+
+        assert len(metadata_queries) == 2
+        assert engine.schemas[PLAYERS_TABLE.name] == {'col0': 'text', 'col1': 'real', 'col2': 'text'}
+
+    def test_preloaded_schemas(self):
+        engine = DBEngine(self.db_file, preload_schemas=True)
+        metadata_queries = self.count_metadata_queries(engine)
+
+        assert set(engine.schemas) == {PLAYERS_TABLE.name, TEAMS_TABLE.name, ROSTER_TABLE.name}
+        assert engine.execute_query(PLAYERS_TABLE.table_id, Query(2, 0, [[0, 0, 'Kyle Lowry']])) == ['guard']
+        assert metadata_queries == []
+
+    def test_recreated_tables_drop_their_cached_schema(self):
+        engine = DBEngine(self.db_file, preload_schemas=True)
+        assert engine.get_schema(PLAYERS_TABLE.table_id)['col1'] == 'real'
+
+        # the number column becomes a text column
+        recreated_table = Table(PLAYERS_TABLE.table_id, PLAYERS_TABLE.header, ['text', 'text', 'text'], [['Chris Bosh', '4', 'Forward']])
+        with self.db.transaction() as connection:
+            recreated_table.create_table(connection, replace_existing=True)
+
+        assert PLAYERS_TABLE.name not in engine.schemas
+        assert TEAMS_TABLE.name in engine.schemas
+        assert engine.get_schema(PLAYERS_TABLE.table_id)['col1'] == 'text'
+        assert engine.execute_query(PLAYERS_TABLE.table_id, Query(0, 0, [[1, 0, '4']])) == ['chris bosh']
+
+    def test_sqlite3_backend_matches_the_records_backend(self):
+        records_engine = DBEngine(self.db_file)
+        sqlite3_engine = DBEngine(self.db_file, backend=BACKEND_SQLITE3)
+
+        for table, select_index, aggregation_index, conditions in QUERIES:
+            query = Query(select_index, aggregation_index, conditions)
+            expected = records_engine.execute_query(table.table_id, query)
+            assert sqlite3_engine.execute_query(table.table_id, query) == expected, conditions
+
+        sql = 'SELECT col0 FROM table WHERE col2 = \'center\''
+        assert sqlite3_engine.execute_from_sql(ROSTER_TABLE.table_id, sql) == records_engine.execute_from_sql(ROSTER_TABLE.table_id, sql)
+
+    def test_sqlite3_backend_is_read_only(self):
+        engine = DBEngine(self.db_file, preload_schemas=True, backend=BACKEND_SQLITE3)
+        assert set(engine.schemas) == {PLAYERS_TABLE.name, TEAMS_TABLE.name, ROSTER_TABLE.name}
+
+        with self.assertRaises(Exception):
+            engine.query_all('DROP TABLE {}'.format(TEAMS_TABLE.name))
+
+    def test_database_modes_match_the_disk_mode(self):
+        records_engine = DBEngine(self.db_file)
+
+        for mode in DB_MODES:
+            engine = DBEngine(self.db_file, preload_schemas=True, backend=BACKEND_SQLITE3, mode=mode)
+            assert set(engine.schemas) == {PLAYERS_TABLE.name, TEAMS_TABLE.name, ROSTER_TABLE.name}, mode
+
+            for table, select_index, aggregation_index, conditions in QUERIES:
+                query = Query(select_index, aggregation_index, conditions)
+                assert engine.execute_query(table.table_id, query) == records_engine.execute_query(table.table_id, query), (mode, conditions)
+
+            with self.assertRaises(Exception):
+                engine.query_all('DROP TABLE {}'.format(TEAMS_TABLE.name))
+
+    def test_memory_mode_copies_the_database(self):
+        engine = DBEngine(self.db_file, backend=BACKEND_SQLITE3, mode=DB_MODE_MEMORY)
+
+        # the copy outlives the file
+        self.db.close()
+        os.remove(self.db_file)
+        assert engine.execute_query(TEAMS_TABLE.table_id, Query(1, 0, [[0, 0, 'Celtics']])) == ['boston']
+
+    def test_database_modes_need_the_sqlite3_backend(self):
+        with self.assertRaises(Exception):
+            DBEngine(self.db_file, mode=DB_MODE_MMAP)
+        with self.assertRaises(Exception):
+            DBEngine(self.db_file, backend=BACKEND_SQLITE3, mode='network')
@@ -0,0 +1,70 @@
+from unittest import TestCase
+
+from lib.lru_cache import LRUCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.time = 0.0
+
+    def __call__(self):
+        return self.time
+
+
+class TestLRUCache(TestCase):
+    def test_least_recently_used_entries_are_evicted(self):
+        removed = []
+        cache = LRUCache(2, on_remove=lambda key, value: removed.append((key, value)))
+        cache.put('k1', 'v1')
+        cache.put('k2', 'v2')
+        assert cache.get('k1') == 'v1'
+        cache.put('k3', 'v3')
+
+        assert 'k2' not in cache and len(cache) == 2
+        assert cache.get('k1') == 'v1' and cache.get('k3') == 'v3'
+        assert removed == [('k2', 'v2')]
+        assert cache.stats()['evictions'] == 1
+
+    def test_entries_expire(self):
+        clock = FakeClock()
+        removed = []
+        cache = LRUCache(2, ttl_seconds=10, clock=clock, on_remove=lambda key, value: removed.append(key))
+        cache.put('k1', 'v1')
+
+        clock.time = 10
+        assert cache.get('k1') == 'v1'
+        clock.time = 11
+        assert cache.get('k1', 'missing') == 'missing'
+
+        assert removed == ['k1'] and len(cache) == 0
+        assert cache.stats()['expirations'] == 1
+
+    def test_invalidate(self):
+        removed = []
+        cache = LRUCache(2, on_remove=lambda key, value: removed.append(key))
+        cache.put('k1', 'v1')
+
+        assert cache.invalidate('k1')
+        assert not cache.invalidate('k1')
+        assert cache.get('k1') is None
+        assert removed == []
+        assert cache.stats()['invalidations'] == 1
+
+    def test_stats(self):
+        cache = LRUCache(4)
+        cache.put('k1', [])
+        cache.get('k1')
+        cache.get('k2')
+        cache.clear()
+
+        assert cache.stats() == {
+            'entries': 0,
+            'max_entries': 4,
+            'ttl_seconds': None,
+            'hits': 1,
+            'misses': 1,
+            'hit_rate': 0.5,
+            'evictions': 0,
+            'expirations': 0,
+            'invalidations': 0,
+        }
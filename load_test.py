@@ -0,0 +1,75 @@
+import argparse
+import json
+import logging
+import os
+import tempfile
+
+from load_testing.replay import DEFAULT_CONCURRENCY, HttpTarget, ReplayLoadTest, TestClientTarget, read_request_log, serve_app, set_up_stub_model, \
+    use_stub_model
+
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_LOG_PATH = os.path.join(CURRENT_DIR, 'load_testing/sample_requests.jsonl')
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)s : %(name)s - %(levelname)s : %(message)s')
+    logger = logging.getLogger('root')
+    logger.setLevel(logging.INFO)
+
+    parser = argparse.ArgumentParser(
+        prog='Text-to-SQL Load Test',
+        description='Replays a JSONL request log against the web server and reports the throughput, latency percentiles and error rate of each endpoint',
+    )
+
+    parser.add_argument('--log-path', type=str, default=DEFAULT_LOG_PATH, help='Specify the JSONL request log to replay')
+    parser.add_argument('--repeat', type=int, default=1, help='Specify how many times the request log is replayed')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, help='Specify the number of requests sent concurrently')
+    parser.add_argument('--rate', type=float, default=None, help='Specify an open-loop arrival rate in requests per second (closed loop by default)')
+    parser.add_argument('--target-url', type=str, default=None, help='Specify the URL of a running server (the app is served in-process by default)')
+    parser.add_argument('--port', type=int, default=None, help='Specify a local port where to serve the app in-process, instead of using the Flask test client')
+    parser.add_argument('--stub-model', action='store_true', help='Serve a tiny randomly initialized model instead of the pretrained models, so that no download is needed')
+    parser.add_argument('--output-path', type=str, default=None, help='Specify a file where to store the report as JSON')
+    args = parser.parse_args()
+
+    if args.target_url and (args.port is not None or args.stub_model):
+        raise Exception('A running server can neither be served on a port nor use the stub model.')
+
+    entries, skipped = read_request_log(args.log_path)
+    if skipped:
+        logger.info('Skipped %d lines of the request log that are not requests.', skipped)
+    if not entries:
+        raise Exception('The request log {} contains no requests.'.format(args.log_path))
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if args.stub_model:
+            set_up_stub_model(os.path.join(temp_dir, 'pretrained'))
+            entries = use_stub_model(entries)
+
+        server = None
+        if args.target_url:
+            target = HttpTarget(args.target_url)
+        else:
+            from web.sqlgen_server.app import app
+
+            if args.port is not None:
+                server = serve_app(app, args.port)
+                target = HttpTarget('http://127.0.0.1:{}'.format(server.server_port))
+            else:
+                target = TestClientTarget(app)
+
+        logger.info('Replaying %d requests %d times.', len(entries), args.repeat)
+        try:
+            report = ReplayLoadTest(target, args.concurrency, args.rate).run(entries * args.repeat)
+        finally:
+            if server is not None:
+                server.shutdown()
+
+    print('\n{:<40}{:>10}{:>10}{:>12}{:>12}{:>10}{:>10}{:>10}'.format('endpoint', 'requests', 'errors', 'error_rate', 'throughput', 'p50_ms', 'p95_ms', 'p99_ms'))
+    for endpoint, summary in report.items():
+        print('{:<40}{:>10}{:>10}{:>12.4f}{:>12.2f}{:>10.2f}{:>10.2f}{:>10.2f}'.format(endpoint, summary['requests'], summary['errors'], summary['error_rate'],
+                                                                                    summary['throughput'], summary['p50_ms'], summary['p95_ms'], summary['p99_ms']))
+
+    if args.output_path:
+        with open(args.output_path, 'w') as file:
+            json.dump(report, file, indent=4)
@@ -0,0 +1,211 @@
+import io
+import json
+import math
+import os
+import queue
+import threading
+import time
+
+from werkzeug.serving import make_server
+
+from loader import pretrained_loader
+from loader.stub_model import create_stub_pretrained_model
+
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_TIMEOUT_SECONDS = 60.0
+PERCENTILES = (50, 95, 99)
+
+STUB_MODEL_DIR = 'stub'
+PRETRAINED_MODEL_FIELD = 'pretrained_model'
+TOTAL_ENDPOINT = 'total'
+
+
+def read_request_log(path):
+    # each line is a request like {"method": "POST", "path": "/submit/guest_query", "form": {...}, "files": {"file": "schema.json"}, "json": {...}},
+    # the files being relative to the log
+    log_dir = os.path.dirname(os.path.abspath(path))
+
+    entries = []
+    skipped = 0
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            if not line.strip():
+                continue
+
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                skipped += 1
+                continue
+
+            # lines that are not HTTP requests, e.g. the change requests of the backlog, are skipped
+            if not isinstance(entry, dict) or 'path' not in entry:
+                skipped += 1
+                continue
+
+            files = {}
+            for field_name, file_path in entry.get('files', {}).items():
+                with open(os.path.join(log_dir, file_path), 'rb') as request_file:
+                    files[field_name] = (os.path.basename(file_path), request_file.read())
+
+            entries.append({
+                'method': entry.get('method', 'GET').upper(),
+                'path': entry['path'],
+                'form': entry.get('form', {}),
+                'files': files,
+                'json': entry.get('json')
+            })
+
+    return entries, skipped
+
+
+def set_up_stub_model(pretrained_path):
+    # a tiny randomly initialized model, so that the replay runs offline
+    create_stub_pretrained_model(os.path.join(pretrained_path, STUB_MODEL_DIR))
+    pretrained_loader.PRETRAINED_MODELS_PATH = pretrained_path
+    pretrained_loader.refresh_pretrained_models_metadata(force=True)
+    pretrained_loader.warm_up_pretrained_models([STUB_MODEL_DIR])
+
+
+def use_stub_model(entries):
+    stub_entries = []
+    for entry in entries:
+        if PRETRAINED_MODEL_FIELD in entry['form']:
+            entry = dict(entry, form=dict(entry['form'], **{PRETRAINED_MODEL_FIELD: STUB_MODEL_DIR}))
+        stub_entries.append(entry)
+    return stub_entries
+
+
+def serve_app(app, port, host='127.0.0.1'):
+    server = make_server(host, port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class TestClientTarget:
+    def __init__(self, app):
+        self.__app = app
+        self.__local = threading.local()
+
+    def send(self, entry):
+        # the test client keeps cookies between requests, so every replay thread gets its own
+        if not hasattr(self.__local, 'client'):
+            self.__local.client = self.__app.test_client()
+
+        if entry['json'] is not None:
+            response = self.__local.client.open(entry['path'], method=entry['method'], json=entry['json'])
+        else:
+            data = dict(entry['form'])
+            for field_name, (file_name, content) in entry['files'].items():
+                data[field_name] = (io.BytesIO(content), file_name)
+            response = self.__local.client.open(entry['path'], method=entry['method'], data=data)
+
+        # streamed responses are only generated while they are read
+        response.get_data()
+        return response.status_code
+
+
+class HttpTarget:
+    def __init__(self, base_url, timeout_seconds=DEFAULT_TIMEOUT_SECONDS):
+        self.__base_url = base_url.rstrip('/')
+        self.__timeout_seconds = timeout_seconds
+        self.__local = threading.local()
+
+    def send(self, entry):
+        import requests
+
+        if not hasattr(self.__local, 'session'):
+            self.__local.session = requests.Session()
+
+        response = self.__local.session.request(entry['method'], self.__base_url + entry['path'], data=entry['form'] or None, files=entry['files'] or None,
+                                                json=entry['json'], timeout=self.__timeout_seconds)
+        response.content
+        return response.status_code
+
+
+class ReplayLoadTest:
+    def __init__(self, target, concurrency=DEFAULT_CONCURRENCY, rate=None):
+        if concurrency < 1:
+            raise Exception('The concurrency must be at least 1.')
+        if rate is not None and rate <= 0:
+            raise Exception('The arrival rate must be positive.')
+
+        self.__target = target
+        self.__concurrency = concurrency
+        self.__rate = rate
+
+    def run(self, entries):
+        # without a rate the replay is closed loop, each thread sending its next request once the previous one is answered; with a rate the requests
+        # arrive on a fixed schedule, and their latency also counts the time they waited for a free thread
+        tasks = queue.Queue()
+        start_time = time.perf_counter()
+        for index, entry in enumerate(entries):
+            tasks.put((entry, start_time + index / self.__rate if self.__rate else None))
+
+        results = []
+        results_lock = threading.Lock()
+
+        def replay():
+            while True:
+                try:
+                    entry, arrival_time = tasks.get_nowait()
+                except queue.Empty:
+                    return
+
+                if arrival_time is not None:
+                    time.sleep(max(0.0, arrival_time - time.perf_counter()))
+                else:
+                    arrival_time = time.perf_counter()
+
+                try:
+                    status_code = self.__target.send(entry)
+                except Exception:
+                    status_code = None
+
+                with results_lock:
+                    results.append(('{} {}'.format(entry['method'], entry['path']), time.perf_counter() - arrival_time, status_code))
+
+        threads = [threading.Thread(target=replay) for _ in range(min(self.__concurrency, max(len(entries), 1)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return summarize_results(results, time.perf_counter() - start_time)
+
+
+def get_percentile(sorted_values, percent):
+    # nearest rank percentile
+    return sorted_values[max(0, math.ceil(percent / 100 * len(sorted_values)) - 1)]
+
+
+def summarize_latencies(latencies, errors, elapsed_seconds):
+    sorted_latencies = sorted(latencies)
+    summary = {
+        'requests': len(latencies),
+        'errors': errors,
+        'error_rate': errors / len(latencies),
+        'throughput': len(latencies) / elapsed_seconds if elapsed_seconds > 0 else 0.0
+    }
+    for percent in PERCENTILES:
+        summary['p{}_ms'.format(percent)] = get_percentile(sorted_latencies, percent) * 1000
+    return summary
+
+
+def summarize_results(results, elapsed_seconds):
+    # requests without a status code raised, the others failed with a 4xx or 5xx status
+    endpoint_results = {}
+    for endpoint, latency, status_code in results:
+        latencies, failed = endpoint_results.setdefault(endpoint, ([], []))
+        latencies.append(latency)
+        failed.append(status_code is None or status_code >= 400)
+
+    report = {}
+    for endpoint, (latencies, failed) in sorted(endpoint_results.items()):
+        report[endpoint] = summarize_latencies(latencies, sum(failed), elapsed_seconds)
+
+    if results:
+        report[TOTAL_ENDPOINT] = summarize_latencies([latency for _, latency, _ in results],
+                                                     sum(sum(failed) for _, failed in endpoint_results.values()), elapsed_seconds)
+    return report
@@ -0,0 +1,97 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from loader import pretrained_loader
+from load_testing.replay import STUB_MODEL_DIR, TOTAL_ENDPOINT, HttpTarget, ReplayLoadTest, TestClientTarget, read_request_log, serve_app, \
+    set_up_stub_model, summarize_results, use_stub_model
+from web.sqlgen_server.app import app
+
+
+SCHEMA_FILE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../table_schemas/swe_employees.json')
+
+REQUEST_LOG = [
+    {'request_id': 'user-001', 'title': 'Not a request', 'body': 'Lines without a path are skipped.'},
+    {'method': 'GET', 'path': '/pretrained_models_metadata'},
+    {'method': 'POST', 'path': '/submit/guest_query', 'form': {'natural_language_query': 'How old is the oldest employee?', 'pretrained_model': 't5'},
+     'files': {'file': SCHEMA_FILE_PATH}},
+    {'method': 'POST', 'path': '/submit/guest_query/stream', 'form': {'natural_language_query': 'Who works at Company X?', 'pretrained_model': 't5'},
+     'files': {'file': SCHEMA_FILE_PATH}},
+    {'method': 'POST', 'path': '/submit/guest_query', 'form': {'natural_language_query': 'Missing the model and the schema.'}},
+]
+
+
+class TestReplay(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.temp_dir = tempfile.mkdtemp()
+        cls.original_pretrained_path = pretrained_loader.PRETRAINED_MODELS_PATH
+        set_up_stub_model(os.path.join(cls.temp_dir, 'pretrained'))
+
+        cls.log_path = os.path.join(cls.temp_dir, 'requests.jsonl')
+        with open(cls.log_path, 'w') as file:
+            file.write('\n'.join(json.dumps(entry) for entry in REQUEST_LOG) + '\n\nnot json\n')
+
+    @classmethod
+    def tearDownClass(cls):
+        pretrained_loader.PRETRAINED_MODELS_PATH = cls.original_pretrained_path
+        pretrained_loader.refresh_pretrained_models_metadata(force=True)
+        shutil.rmtree(cls.temp_dir)
+
+    def setUp(self):
+        app.testing = True
+        self.entries, self.skipped = read_request_log(self.log_path)
+        self.entries = use_stub_model(self.entries)
+
+    def check_report(self, report, repeat):
+        assert report['GET /pretrained_models_metadata']['requests'] == repeat
+        assert report['POST /submit/guest_query/stream']['errors'] == 0
+
+        # the request without a model and a schema is rejected
+        guest_query_report = report['POST /submit/guest_query']
+        assert guest_query_report['requests'] == 2 * repeat
+        assert guest_query_report['errors'] == repeat
+        assert guest_query_report['error_rate'] == 0.5
+
+        assert report[TOTAL_ENDPOINT]['requests'] == 4 * repeat
+        for summary in report.values():
+            assert 0 <= summary['p50_ms'] <= summary['p95_ms'] <= summary['p99_ms']
+            assert summary['throughput'] > 0
+
+    def test_read_request_log(self):
+        assert self.skipped == 2
+        assert [entry['path'] for entry in self.entries] == ['/pretrained_models_metadata', '/submit/guest_query', '/submit/guest_query/stream', '/submit/guest_query']
+        assert self.entries[1]['files']['file'][0] == 'swe_employees.json'
+        assert self.entries[1]['form']['pretrained_model'] == STUB_MODEL_DIR
+        assert 'pretrained_model' not in self.entries[3]['form']
+
+    def test_closed_loop_replay_with_the_test_client(self):
+        report = ReplayLoadTest(TestClientTarget(app), concurrency=3).run(self.entries * 2)
+        self.check_report(report, 2)
+
+    def test_open_loop_replay_over_http(self):
+        server = serve_app(app, 0)
+        try:
+            report = ReplayLoadTest(HttpTarget('http://127.0.0.1:{}'.format(server.server_port)), concurrency=2, rate=50).run(self.entries)
+        finally:
+            server.shutdown()
+        self.check_report(report, 1)
+
+    def test_summarize_results(self):
+        results = [('GET /health', latency / 1000, 200) for latency in range(1, 101)] + [('GET /health', 0.5, 503), ('GET /metrics', 0.01, None)]
+        report = summarize_results(results, 2.0)
+
+        assert report['GET /health']['requests'] == 101
+        assert report['GET /health']['errors'] == 1
+        assert report['GET /health']['p50_ms'] == 51
+        assert report['GET /health']['p99_ms'] == 100
+        assert report['GET /metrics']['error_rate'] == 1.0
+        assert report[TOTAL_ENDPOINT]['throughput'] == 51.0
+
+    def test_invalid_load(self):
+        with self.assertRaises(Exception):
+            ReplayLoadTest(TestClientTarget(app), concurrency=0)
+        with self.assertRaises(Exception):
+            ReplayLoadTest(TestClientTarget(app), rate=0)
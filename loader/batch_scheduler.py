@@ -0,0 +1,211 @@
+import math
+import threading
+import time
+
+from collections import deque
+from concurrent.futures import Future, InvalidStateError
+
+from monitoring.metrics import Histogram
+
+
+DEFAULT_MAX_BATCH_SIZE = 8
+DEFAULT_MAX_WAIT_MS = 5.0
+DEFAULT_MAX_QUEUE_DEPTH = 64
+
+# share of the queue that only high priority requests can fill
+DEFAULT_HIGH_PRIORITY_RESERVED_FRACTION = 0.25
+
+# weight of the latest batch in the running estimate of the batch duration
+BATCH_SECONDS_SMOOTHING = 0.2
+
+PRIORITY_HIGH = 'high'
+PRIORITY_LOW = 'low'
+PRIORITIES = (PRIORITY_HIGH, PRIORITY_LOW)
+
+SHED_QUEUE_FULL = 'queue_full'
+SHED_DEADLINE = 'deadline'
+SHED_EXPIRED = 'expired'
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+QUEUE_WAIT_MS_BUCKETS = (0.5, 1, 2, 5, 10, 25, 50, 100, 250, 1000)
+
+
+class OverloadedError(Exception):
+    def __init__(self, message, reason, retry_after_seconds):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after_seconds = retry_after_seconds
+
+    def __reduce__(self):
+        # raised again in the web process when a translation is shed by an inference worker
+        return OverloadedError, (str(self), self.reason, self.retry_after_seconds)
+
+
+def resolve_future(future, result=None, exception=None):
+    # a future cancelled by its caller is skipped, so that it cannot stop the thread resolving the others
+    if future.done():
+        return
+    try:
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+    except InvalidStateError:
+        pass
+
+
+class BatchScheduler:
+    def __init__(self, run_batch, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait_ms=DEFAULT_MAX_WAIT_MS, max_queue_depth=None,
+                 high_priority_reserved_fraction=DEFAULT_HIGH_PRIORITY_RESERVED_FRACTION):
+        if max_batch_size < 1:
+            raise ValueError('The maximum batch size must be at least 1.')
+        if max_wait_ms < 0:
+            raise ValueError('The maximum batch wait time cannot be negative.')
+        if max_queue_depth is not None and max_queue_depth < 1:
+            raise ValueError('The maximum queue depth must be at least 1.')
+
+        self.__run_batch = run_batch
+        self.__max_batch_size = max_batch_size
+        self.__max_wait_ms = max_wait_ms
+        self.__max_queue_depth = max_queue_depth
+        self.__max_low_priority_queue_depth = None if max_queue_depth is None else max(1, int(max_queue_depth * (1 - high_priority_reserved_fraction)))
+
+        # high priority requests are batched first, each priority in arrival order
+        self.__pending = {priority: deque() for priority in PRIORITIES}
+        self.__condition = threading.Condition()
+        self.__worker = None
+
+        self.__batch_seconds = None
+        self.__shed_counts = {SHED_QUEUE_FULL: 0, SHED_DEADLINE: 0, SHED_EXPIRED: 0}
+
+        self.__batch_size_histogram = Histogram(BATCH_SIZE_BUCKETS)
+        self.__queue_wait_histogram = Histogram(QUEUE_WAIT_MS_BUCKETS)
+
+    @property
+    def max_batch_size(self):
+        return self.__max_batch_size
+
+    @property
+    def max_wait_ms(self):
+        return self.__max_wait_ms
+
+    @property
+    def max_queue_depth(self):
+        return self.__max_queue_depth
+
+    def submit(self, item, priority=PRIORITY_LOW, deadline=None):
+        return self.enqueue(item, priority, deadline).result()
+
+    def enqueue(self, item, priority=PRIORITY_LOW, deadline=None):
+        # the deadline is a time.perf_counter() timestamp, requests that cannot be translated in time are rejected right away
+        future = Future()
+
+        with self.__condition:
+            queue_depth = self.__get_queue_depth()
+            max_queue_depth = self.__max_queue_depth if priority == PRIORITY_HIGH else self.__max_low_priority_queue_depth
+            if max_queue_depth is not None and queue_depth >= max_queue_depth:
+                self.__shed_counts[SHED_QUEUE_FULL] += 1
+                raise OverloadedError('The translation queue is full.', SHED_QUEUE_FULL, self.__estimate_wait_seconds(queue_depth))
+
+            requests_ahead = len(self.__pending[PRIORITY_HIGH]) if priority == PRIORITY_HIGH else queue_depth
+            estimated_wait_seconds = self.__estimate_wait_seconds(requests_ahead + 1)
+            if deadline is not None and time.perf_counter() + estimated_wait_seconds > deadline:
+                self.__shed_counts[SHED_DEADLINE] += 1
+                raise OverloadedError('The translation cannot be done before its deadline.', SHED_DEADLINE, estimated_wait_seconds)
+
+            self.__pending[priority].append((item, future, time.perf_counter(), deadline))
+            self.__ensure_worker()
+            self.__condition.notify()
+
+        return future
+
+    def stats(self):
+        with self.__condition:
+            queue_depths = {priority: len(pending) for priority, pending in self.__pending.items()}
+            shed_counts = dict(self.__shed_counts)
+            batch_seconds = self.__batch_seconds
+
+        return {
+            'max_batch_size': self.__max_batch_size,
+            'max_wait_ms': self.__max_wait_ms,
+            'max_queue_depth': self.__max_queue_depth,
+            'queue_depth': sum(queue_depths.values()),
+            'queue_depths': queue_depths,
+            'shed': shed_counts,
+            'batch_seconds': batch_seconds,
+            'batch_size': self.__batch_size_histogram.snapshot(),
+            'queue_wait_ms': self.__queue_wait_histogram.snapshot(),
+        }
+
+    def __get_queue_depth(self):
+        return sum(len(pending) for pending in self.__pending.values())
+
+    def __estimate_wait_seconds(self, num_requests):
+        # nothing is known about the batch duration before the first batch
+        if self.__batch_seconds is None:
+            return 0.0
+        return math.ceil(num_requests / self.__max_batch_size) * self.__batch_seconds
+
+    def __ensure_worker(self):
+        if self.__worker is None:
+            self.__worker = threading.Thread(target=self.__process_batches, daemon=True)
+            self.__worker.start()
+
+    def __next_batch(self):
+        with self.__condition:
+            while not self.__get_queue_depth():
+                self.__condition.wait()
+
+            # the batch is flushed once it is full, or once its oldest request has waited long enough
+            flush_deadline = min(pending[0][2] for pending in self.__pending.values() if pending) + self.__max_wait_ms / 1000
+            while self.__get_queue_depth() < self.__max_batch_size:
+                remaining = flush_deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self.__condition.wait(remaining)
+
+            # requests cancelled by their callers are dropped, as are those whose deadline passed while they were queued
+            batch, expired = [], []
+            flush_time = time.perf_counter()
+            for priority in PRIORITIES:
+                pending = self.__pending[priority]
+                while pending and len(batch) < self.__max_batch_size:
+                    entry = pending.popleft()
+                    if not entry[1].set_running_or_notify_cancel():
+                        continue
+                    (expired if entry[3] is not None and entry[3] < flush_time else batch).append(entry)
+
+            self.__shed_counts[SHED_EXPIRED] += len(expired)
+            retry_after_seconds = self.__estimate_wait_seconds(self.__get_queue_depth())
+
+        for _, future, _, _ in expired:
+            resolve_future(future, exception=OverloadedError('The translation deadline passed while it was queued.', SHED_EXPIRED, retry_after_seconds))
+        return batch
+
+    def __process_batches(self):
+        while True:
+            batch = self.__next_batch()
+            if not batch:
+                continue
+
+            flush_time = time.perf_counter()
+            self.__batch_size_histogram.observe(len(batch))
+            for _, _, enqueue_time, _ in batch:
+                self.__queue_wait_histogram.observe((flush_time - enqueue_time) * 1000)
+
+            try:
+                results = self.__run_batch([item for item, _, _, _ in batch])
+            except Exception as e:
+                for _, future, _, _ in batch:
+                    resolve_future(future, exception=e)
+                continue
+            finally:
+                batch_seconds = time.perf_counter() - flush_time
+                with self.__condition:
+                    if self.__batch_seconds is None:
+                        self.__batch_seconds = batch_seconds
+                    else:
+                        self.__batch_seconds += BATCH_SECONDS_SMOOTHING * (batch_seconds - self.__batch_seconds)
+
+            for (_, future, _, _), result in zip(batch, results):
+                resolve_future(future, result)
@@ -0,0 +1,122 @@
+import importlib
+import json
+import logging
+import os
+import threading
+import time
+
+
+# files whose changes mean a changed checkpoint, in the model directory or below it
+WEIGHT_FILE_EXTENSIONS = ('.bin', '.safetensors', '.onnx', '.pt', '.pth')
+
+
+class MetadataIndex:
+    def __init__(self, pretrained_models_path, metadata_file_name, model_inputs_module_name, refresh_interval_seconds=5.0):
+        self.__pretrained_models_path = pretrained_models_path
+        self.__metadata_file_name = metadata_file_name
+        self.__model_inputs_module_name = model_inputs_module_name
+        self.__refresh_interval_seconds = refresh_interval_seconds
+
+        self.__entries = {}
+        self.__last_refresh_time = None
+        self.__last_check_times = {}
+        self.__lock = threading.RLock()
+        self.__logger = logging.getLogger('root')
+
+    def refresh(self):
+        with self.__lock:
+            dir_names = []
+            if os.path.isdir(self.__pretrained_models_path):
+                dir_names = [name for name in os.listdir(self.__pretrained_models_path) if os.path.isdir(os.path.join(self.__pretrained_models_path, name))]
+
+            changed_dir_names = [dir_name for dir_name in self.__entries if dir_name not in dir_names]
+            for dir_name in changed_dir_names:
+                del self.__entries[dir_name]
+                self.__last_check_times.pop(dir_name, None)
+
+            for dir_name in dir_names:
+                # a broken model directory is skipped, keeping its last good entry if it had one, so that it does not hide the other models
+                try:
+                    if self.refresh_entry(dir_name):
+                        changed_dir_names.append(dir_name)
+                except Exception as exception:
+                    self.__logger.warning('Skipped the pretrained model directory \'{}\': {}: {}'.format(dir_name, type(exception).__name__, exception))
+
+            self.__last_refresh_time = time.monotonic()
+            return changed_dir_names
+
+    def refresh_entry(self, dir_name):
+        with self.__lock:
+            signature = self.__get_signature(dir_name)
+            self.__last_check_times[dir_name] = time.monotonic()
+            entry = self.__entries.get(dir_name)
+            if entry is not None and entry['signature'] == signature:
+                return False
+
+            # only the entries whose directory, metadata file or weight files changed are read again
+            metadata_path = os.path.join(self.__pretrained_models_path, dir_name, self.__metadata_file_name)
+            with open(metadata_path, 'r') as file:
+                metadata = json.load(file)
+
+            module = importlib.import_module(self.__model_inputs_module_name)
+            self.__entries[dir_name] = {
+                'signature': signature,
+                'metadata': metadata,
+                'model_class': getattr(module, metadata['class_name']),
+            }
+            return entry is not None
+
+    def refresh_if_stale(self):
+        with self.__lock:
+            if self.__last_refresh_time is None or time.monotonic() - self.__last_refresh_time >= self.__refresh_interval_seconds:
+                return self.refresh()
+            return []
+
+    def refresh_entry_if_stale(self, dir_name):
+        # called on every translation, so an indexed model is checked at most once per refresh interval, and the others not at all
+        last_check_time = self.__last_check_times.get(dir_name)
+        if last_check_time is None or time.monotonic() - last_check_time < self.__refresh_interval_seconds:
+            return False
+
+        with self.__lock:
+            try:
+                return self.refresh_entry(dir_name)
+            except Exception as exception:
+                self.__last_check_times[dir_name] = time.monotonic()
+                self.__logger.warning('Kept the last entry of the model directory \'{}\': {}: {}'.format(dir_name, type(exception).__name__, exception))
+                return False
+
+    def contains(self, dir_name):
+        return dir_name in self.__entries
+
+    def get_metadata(self, dir_name):
+        return self.__get_entry(dir_name)['metadata']
+
+    def get_model_class(self, dir_name):
+        return self.__get_entry(dir_name)['model_class']
+
+    def get_all_metadata(self):
+        with self.__lock:
+            return {dir_name: entry['metadata'] for dir_name, entry in self.__entries.items()}
+
+    def __get_entry(self, dir_name):
+        entry = self.__entries.get(dir_name)
+        if entry is None:
+            # models that were never seen are indexed on first use
+            with self.__lock:
+                self.refresh_entry(dir_name)
+                entry = self.__entries[dir_name]
+        return entry
+
+    def __get_signature(self, dir_name):
+        model_path = os.path.join(self.__pretrained_models_path, dir_name)
+        metadata_path = os.path.join(model_path, self.__metadata_file_name)
+
+        # a checkpoint overwritten in place does not change the directory mtime, so the weight files are part of the signature
+        weight_files = []
+        for dir_path, _, file_names in os.walk(model_path):
+            for file_name in file_names:
+                if file_name.endswith(WEIGHT_FILE_EXTENSIONS):
+                    file_stat = os.stat(os.path.join(dir_path, file_name))
+                    weight_files.append((os.path.relpath(os.path.join(dir_path, file_name), model_path), file_stat.st_mtime_ns, file_stat.st_size))
+        return os.stat(model_path).st_mtime_ns, os.stat(metadata_path).st_mtime_ns, tuple(sorted(weight_files))
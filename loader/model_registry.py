@@ -0,0 +1,138 @@
+import threading
+import time
+
+from collections import OrderedDict
+
+
+def get_model_size_bytes(loaded_model):
+    _, model = loaded_model
+    if hasattr(model, 'get_size_bytes'):
+        return model.get_size_bytes()
+
+    # the state dict also holds the packed weights of quantized layers, which are not parameters; tied weights are counted once
+    tensor_sizes = {}
+    pending = list(model.state_dict().values())
+    while pending:
+        value = pending.pop()
+        if isinstance(value, (tuple, list)):
+            pending.extend(value)
+        elif hasattr(value, 'element_size'):
+            tensor_sizes[value.data_ptr()] = value.numel() * value.element_size()
+
+    return sum(tensor_sizes.values())
+
+
+class ModelRegistry:
+    def __init__(self, load_model, memory_budget_bytes=None, model_size=get_model_size_bytes):
+        self.__load_model = load_model
+        self.__model_size = model_size
+        self.__memory_budget_bytes = memory_budget_bytes
+
+        # least recently used models come first
+        self.__entries = OrderedDict()
+        self.__pinned = set()
+        self.__load_locks = {}
+        self.__lock = threading.Lock()
+
+        self.__hits = 0
+        self.__misses = 0
+        self.__loads = 0
+        self.__load_seconds = 0.0
+        self.__evictions = 0
+
+    @property
+    def memory_budget_bytes(self):
+        return self.__memory_budget_bytes
+
+    @memory_budget_bytes.setter
+    def memory_budget_bytes(self, memory_budget_bytes):
+        with self.__lock:
+            self.__memory_budget_bytes = memory_budget_bytes
+            self.__evict_over_budget()
+
+    def get(self, key):
+        with self.__lock:
+            if key in self.__entries:
+                self.__hits += 1
+                return self.__touch(key)
+
+            self.__misses += 1
+            load_lock = self.__load_locks.setdefault(key, threading.Lock())
+
+        # concurrent first requests for the same model wait here, so that the model is loaded only once
+        with load_lock:
+            with self.__lock:
+                if key in self.__entries:
+                    return self.__touch(key)
+
+            start = time.perf_counter()
+            loaded_model = self.__load_model(key)
+            load_seconds = time.perf_counter() - start
+            size = self.__model_size(loaded_model)
+
+            with self.__lock:
+                self.__entries[key] = {'model': loaded_model, 'size': size}
+                self.__loads += 1
+                self.__load_seconds += load_seconds
+                self.__evict_over_budget(keep=key)
+
+        return loaded_model
+
+    def contains(self, key):
+        with self.__lock:
+            return key in self.__entries
+
+    def pin(self, key):
+        with self.__lock:
+            self.__pinned.add(key)
+
+    def unpin(self, key):
+        with self.__lock:
+            self.__pinned.discard(key)
+            self.__evict_over_budget()
+
+    def evict(self, key):
+        with self.__lock:
+            if self.__entries.pop(key, None) is None:
+                return False
+            self.__evictions += 1
+            return True
+
+    def resident_bytes(self):
+        with self.__lock:
+            return self.__resident_bytes()
+
+    def stats(self):
+        with self.__lock:
+            return {
+                'hits': self.__hits,
+                'misses': self.__misses,
+                'loads': self.__loads,
+                'load_seconds': self.__load_seconds,
+                'evictions': self.__evictions,
+                'resident_models': list(self.__entries.keys()),
+                'pinned_models': sorted(self.__pinned),
+                'resident_bytes': self.__resident_bytes(),
+                'memory_budget_bytes': self.__memory_budget_bytes,
+            }
+
+    def __touch(self, key):
+        self.__entries.move_to_end(key)
+        return self.__entries[key]['model']
+
+    def __resident_bytes(self):
+        return sum(entry['size'] for entry in self.__entries.values())
+
+    def __evict_over_budget(self, keep=None):
+        if self.__memory_budget_bytes is None:
+            return
+
+        # the model that was just loaded is kept even if it does not fit the budget on its own
+        for key in list(self.__entries.keys()):
+            if self.__resident_bytes() <= self.__memory_budget_bytes:
+                break
+            if key in self.__pinned or key == keep:
+                continue
+
+            del self.__entries[key]
+            self.__evictions += 1
@@ -0,0 +1,220 @@
+import json
+import os
+
+from types import SimpleNamespace
+
+import numpy as np
+
+
+ONNX_DIR_NAME = 'onnx'
+ENCODER_FILE_NAME = 'encoder.onnx'
+DECODER_FILE_NAME = 'decoder.onnx'
+DECODER_WITH_PAST_FILE_NAME = 'decoder_with_past.onnx'
+
+CONFIG_FILE_NAME = 'config.json'
+GENERATION_CONFIG_FILE_NAME = 'generation_config.json'
+
+
+def log_softmax(scores):
+    shifted_scores = scores - scores.max(axis=-1, keepdims=True)
+    return shifted_scores - np.log(np.exp(shifted_scores).sum(axis=-1, keepdims=True))
+
+
+class OnnxSeq2SeqModel:
+    # drop-in replacement for T5ForConditionalGeneration.generate, running the graphs written by loader.onnx_export
+    def __init__(self, pretrained_path, num_threads=None):
+        # onnxruntime is an optional dependency, only imported when an onnx model is loaded
+        import onnxruntime
+
+        with open(os.path.join(pretrained_path, CONFIG_FILE_NAME), 'r') as file:
+            config = json.load(file)
+
+        generation_config = {}
+        generation_config_path = os.path.join(pretrained_path, GENERATION_CONFIG_FILE_NAME)
+        if os.path.isfile(generation_config_path):
+            with open(generation_config_path, 'r') as file:
+                generation_config = json.load(file)
+
+        self.__decoder_start_token_id = config['decoder_start_token_id']
+        self.__eos_token_id = config['eos_token_id']
+        self.__pad_token_id = config['pad_token_id']
+        self.generation_config = SimpleNamespace(num_beams=generation_config.get('num_beams', 1), length_penalty=generation_config.get('length_penalty', 1.0))
+
+        session_options = onnxruntime.SessionOptions()
+        if num_threads is not None:
+            session_options.intra_op_num_threads = num_threads
+
+        self.__onnx_path = os.path.join(pretrained_path, ONNX_DIR_NAME)
+        self.__encoder = self.__create_session(ENCODER_FILE_NAME, session_options)
+        self.__decoder = self.__create_session(DECODER_FILE_NAME, session_options)
+        self.__decoder_with_past = self.__create_session(DECODER_WITH_PAST_FILE_NAME, session_options)
+
+        self.__decoder_input_names = {session_input.name for session_input in self.__decoder.get_inputs()}
+        self.__decoder_with_past_input_names = [session_input.name for session_input in self.__decoder_with_past.get_inputs()]
+        self.__past_names = [name for name in self.__decoder_with_past_input_names if name.startswith('past_key_values.')]
+
+    def get_size_bytes(self):
+        return sum(os.path.getsize(os.path.join(self.__onnx_path, file_name)) for file_name in [ENCODER_FILE_NAME, DECODER_FILE_NAME, DECODER_WITH_PAST_FILE_NAME])
+
+    def to(self, device):
+        return self
+
+    def eval(self):
+        return self
+
+    def generate(self, input_ids, attention_mask=None, max_length=64, num_beams=None, logits_processor=None, stopping_criteria=None, streamer=None, **kwargs):
+        input_ids = self.__to_numpy(input_ids)
+        attention_mask = np.ones_like(input_ids) if attention_mask is None else self.__to_numpy(attention_mask)
+        num_beams = num_beams or self.generation_config.num_beams
+
+        encoder_hidden_states = self.__encoder.run(None, {'input_ids': input_ids, 'attention_mask': attention_mask})[0]
+
+        if num_beams > 1:
+            if streamer is not None:
+                raise Exception('Streaming is not supported with beam search')
+
+            # every beam gets its own copy of the encoder outputs
+            encoder_hidden_states = np.repeat(encoder_hidden_states, num_beams, axis=0)
+            attention_mask = np.repeat(attention_mask, num_beams, axis=0)
+            return self.__beam_search(encoder_hidden_states, attention_mask, input_ids.shape[0], num_beams, max_length, logits_processor)
+        return self.__greedy_search(encoder_hidden_states, attention_mask, max_length, logits_processor, stopping_criteria, streamer)
+
+    def __create_session(self, file_name, session_options):
+        import onnxruntime
+        return onnxruntime.InferenceSession(os.path.join(self.__onnx_path, file_name), session_options, providers=['CPUExecutionProvider'])
+
+    @staticmethod
+    def __to_numpy(tensor):
+        if hasattr(tensor, 'cpu'):
+            tensor = tensor.cpu().numpy()
+        return np.asarray(tensor, dtype=np.int64)
+
+    def __decode_step(self, decoder_input_ids, encoder_hidden_states, attention_mask, past):
+        if past is None:
+            feed = {'decoder_input_ids': decoder_input_ids, 'encoder_hidden_states': encoder_hidden_states, 'encoder_attention_mask': attention_mask}
+            outputs = self.__decoder.run(None, {name: value for name, value in feed.items() if name in self.__decoder_input_names})
+
+            # the cross attention keys and values are computed once, at the first step
+            past = dict(zip(self.__past_names, outputs[1:]))
+            return outputs[0][:, -1, :], past
+
+        feed = {'decoder_input_ids': decoder_input_ids[:, -1:], 'encoder_hidden_states': encoder_hidden_states, 'encoder_attention_mask': attention_mask}
+        feed.update(past)
+        outputs = self.__decoder_with_past.run(None, {name: feed[name] for name in self.__decoder_with_past_input_names})
+
+        self_attention_names = [name for name in self.__past_names if '.decoder.' in name]
+        past = dict(past, **dict(zip(self_attention_names, outputs[1:])))
+        return outputs[0][:, -1, :], past
+
+    def __process_logits(self, logits_processor, decoder_input_ids, scores):
+        if not logits_processor:
+            return scores
+
+        # logits processors work on torch tensors, torch is only needed when they are used
+        import torch
+        return logits_processor(torch.from_numpy(decoder_input_ids), torch.from_numpy(scores)).numpy()
+
+    @staticmethod
+    def __stop(stopping_criteria, decoder_input_ids, scores):
+        import torch
+        return stopping_criteria(torch.from_numpy(decoder_input_ids), torch.from_numpy(scores)).numpy()
+
+    def __greedy_search(self, encoder_hidden_states, attention_mask, max_length, logits_processor, stopping_criteria, streamer):
+        batch_size = encoder_hidden_states.shape[0]
+        decoder_input_ids = np.full((batch_size, 1), self.__decoder_start_token_id, dtype=np.int64)
+        finished = np.zeros(batch_size, dtype=bool)
+        past = None
+
+        if streamer is not None:
+            streamer.put(decoder_input_ids)
+
+        while decoder_input_ids.shape[1] < max_length and not finished.all():
+            scores, past = self.__decode_step(decoder_input_ids, encoder_hidden_states, attention_mask, past)
+            scores = self.__process_logits(logits_processor, decoder_input_ids, scores.astype(np.float32))
+
+            next_token_ids = np.where(finished, self.__pad_token_id, scores.argmax(axis=-1))
+            decoder_input_ids = np.concatenate([decoder_input_ids, next_token_ids[:, None]], axis=1)
+            finished |= next_token_ids == self.__eos_token_id
+
+            if streamer is not None:
+                streamer.put(next_token_ids)
+            if stopping_criteria:
+                finished |= self.__stop(stopping_criteria, decoder_input_ids, scores)
+
+        if streamer is not None:
+            streamer.end()
+        return decoder_input_ids
+
+    def __beam_search(self, encoder_hidden_states, attention_mask, batch_size, num_beams, max_length, logits_processor):
+        length_penalty = self.generation_config.length_penalty
+        decoder_input_ids = np.full((batch_size * num_beams, 1), self.__decoder_start_token_id, dtype=np.int64)
+
+        # only the first beam is alive at the start, so that the same token is not picked num_beams times
+        beam_scores = np.full((batch_size, num_beams), -1e9, dtype=np.float32)
+        beam_scores[:, 0] = 0
+        beam_scores = beam_scores.reshape(-1)
+
+        finished_hypotheses = [[] for _ in range(batch_size)]
+        done = np.zeros(batch_size, dtype=bool)
+        past = None
+
+        while decoder_input_ids.shape[1] < max_length and not done.all():
+            scores, past = self.__decode_step(decoder_input_ids, encoder_hidden_states, attention_mask, past)
+            scores = log_softmax(scores.astype(np.float32))
+            scores = self.__process_logits(logits_processor, decoder_input_ids, scores)
+
+            vocab_size = scores.shape[-1]
+            next_scores = (scores + beam_scores[:, None]).reshape(batch_size, num_beams * vocab_size)
+            top_indices = np.argsort(-next_scores, axis=1)[:, :2 * num_beams]
+
+            next_beam_scores = np.zeros((batch_size, num_beams), dtype=np.float32)
+            next_beam_tokens = np.full((batch_size, num_beams), self.__pad_token_id, dtype=np.int64)
+            next_beam_indices = np.zeros((batch_size, num_beams), dtype=np.int64)
+            current_length = decoder_input_ids.shape[1]
+
+            for batch_index in range(batch_size):
+                if done[batch_index]:
+                    next_beam_scores[batch_index] = -1e9
+                    next_beam_indices[batch_index] = batch_index * num_beams
+                    continue
+
+                beam = 0
+                for index in top_indices[batch_index]:
+                    score = next_scores[batch_index, index]
+                    beam_index = batch_index * num_beams + index // vocab_size
+                    token_id = index % vocab_size
+
+                    if token_id == self.__eos_token_id:
+                        hypothesis = np.append(decoder_input_ids[beam_index], token_id)
+                        finished_hypotheses[batch_index].append((score / (current_length ** length_penalty), hypothesis))
+                        finished_hypotheses[batch_index] = sorted(finished_hypotheses[batch_index], key=lambda item: -item[0])[:num_beams]
+                        continue
+
+                    next_beam_scores[batch_index, beam] = score
+                    next_beam_tokens[batch_index, beam] = token_id
+                    next_beam_indices[batch_index, beam] = beam_index
+                    beam += 1
+                    if beam == num_beams:
+                        break
+
+                # no running beam can beat the worst finished hypothesis anymore
+                if len(finished_hypotheses[batch_index]) == num_beams:
+                    best_running_score = next_beam_scores[batch_index].max() / (current_length ** length_penalty)
+                    done[batch_index] = finished_hypotheses[batch_index][-1][0] >= best_running_score
+
+            beam_indices = next_beam_indices.reshape(-1)
+            beam_scores = next_beam_scores.reshape(-1)
+            decoder_input_ids = np.concatenate([decoder_input_ids[beam_indices], next_beam_tokens.reshape(-1, 1)], axis=1)
+            past = {name: value[beam_indices] for name, value in past.items()}
+
+        output = []
+        for batch_index in range(batch_size):
+            hypotheses = list(finished_hypotheses[batch_index])
+            if not done[batch_index]:
+                for beam in range(num_beams):
+                    beam_index = batch_index * num_beams + beam
+                    hypotheses.append((beam_scores[beam_index] / (decoder_input_ids.shape[1] ** length_penalty), decoder_input_ids[beam_index]))
+            output.append(max(hypotheses, key=lambda item: item[0])[1])
+
+        output_length = max(len(hypothesis) for hypothesis in output)
+        return np.array([np.pad(hypothesis, (0, output_length - len(hypothesis)), constant_values=self.__pad_token_id) for hypothesis in output], dtype=np.int64)
@@ -0,0 +1,118 @@
+import os
+
+import torch
+
+from transformers import AutoTokenizer, T5ForConditionalGeneration
+
+from loader.onnx_backend import ONNX_DIR_NAME, ENCODER_FILE_NAME, DECODER_FILE_NAME, DECODER_WITH_PAST_FILE_NAME
+
+
+DEFAULT_OPSET_VERSION = 17
+
+
+def get_past_names(prefix, num_layers):
+    names = []
+    for layer in range(num_layers):
+        names += ['{}.{}.{}'.format(prefix, layer, name) for name in ['decoder.key', 'decoder.value', 'encoder.key', 'encoder.value']]
+    return names
+
+
+def to_legacy_cache(past_key_values):
+    # newer transformers versions return a cache object instead of the per-layer (self key, self value, cross key, cross value) tuples
+    if hasattr(past_key_values, 'to_legacy_cache'):
+        return past_key_values.to_legacy_cache()
+    return past_key_values
+
+
+def from_legacy_cache(past_key_values):
+    try:
+        from transformers.cache_utils import EncoderDecoderCache
+    except ImportError:
+        return past_key_values
+    return EncoderDecoderCache.from_legacy_cache(past_key_values)
+
+
+class EncoderWrapper(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.encoder = model.get_encoder()
+
+    def forward(self, input_ids, attention_mask):
+        return self.encoder(input_ids=input_ids, attention_mask=attention_mask, return_dict=True).last_hidden_state
+
+
+class DecoderWrapper(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, decoder_input_ids, encoder_hidden_states, encoder_attention_mask, *past_key_values):
+        past = None
+        if past_key_values:
+            past = from_legacy_cache(tuple(tuple(past_key_values[index:index + 4]) for index in range(0, len(past_key_values), 4)))
+
+        outputs = self.model.decoder(input_ids=decoder_input_ids, encoder_hidden_states=encoder_hidden_states, encoder_attention_mask=encoder_attention_mask,
+                                     past_key_values=past, use_cache=True, return_dict=True)
+
+        hidden_states = outputs.last_hidden_state
+        if self.model.config.tie_word_embeddings:
+            hidden_states = hidden_states * (self.model.model_dim ** -0.5)
+        logits = self.model.lm_head(hidden_states)
+
+        present = [tensor for layer in to_legacy_cache(outputs.past_key_values) for tensor in layer]
+        if past_key_values:
+            # the cross attention keys and values never change after the first step, only the self attention ones are returned
+            present = [tensor for index, tensor in enumerate(present) if index % 4 < 2]
+        return (logits, *present)
+
+
+def export_to_onnx(pretrained_path, opset_version=DEFAULT_OPSET_VERSION):
+    tokenizer = AutoTokenizer.from_pretrained(pretrained_path)
+    model = T5ForConditionalGeneration.from_pretrained(pretrained_path)
+    model.eval()
+
+    onnx_path = os.path.join(pretrained_path, ONNX_DIR_NAME)
+    os.makedirs(onnx_path, exist_ok=True)
+
+    num_layers = model.config.num_decoder_layers
+    batch_axis, encoder_axis, decoder_axis, past_axis = 'batch_size', 'encoder_sequence_length', 'decoder_sequence_length', 'past_sequence_length'
+
+    inputs = tokenizer(['translate to SQL the following natural language query', 'example'], padding='longest', return_tensors='pt')
+    decoder_input_ids = torch.full((2, 1), model.config.decoder_start_token_id, dtype=torch.long)
+
+    with torch.no_grad():
+        encoder = EncoderWrapper(model)
+        torch.onnx.export(
+            encoder, (inputs.input_ids, inputs.attention_mask), os.path.join(onnx_path, ENCODER_FILE_NAME),
+            input_names=['input_ids', 'attention_mask'], output_names=['encoder_hidden_states'],
+            dynamic_axes={'input_ids': {0: batch_axis, 1: encoder_axis}, 'attention_mask': {0: batch_axis, 1: encoder_axis},
+                          'encoder_hidden_states': {0: batch_axis, 1: encoder_axis}},
+            opset_version=opset_version, dynamo=False
+        )
+        encoder_hidden_states = encoder(inputs.input_ids, inputs.attention_mask)
+
+        decoder = DecoderWrapper(model)
+        present_names = get_past_names('present', num_layers)
+        torch.onnx.export(
+            decoder, (decoder_input_ids, encoder_hidden_states, inputs.attention_mask), os.path.join(onnx_path, DECODER_FILE_NAME),
+            input_names=['decoder_input_ids', 'encoder_hidden_states', 'encoder_attention_mask'], output_names=['logits'] + present_names,
+            dynamic_axes=dict({'decoder_input_ids': {0: batch_axis, 1: decoder_axis}, 'encoder_hidden_states': {0: batch_axis, 1: encoder_axis},
+                               'encoder_attention_mask': {0: batch_axis, 1: encoder_axis}, 'logits': {0: batch_axis, 1: decoder_axis}},
+                              **{name: {0: batch_axis, 2: decoder_axis if '.decoder.' in name else encoder_axis} for name in present_names}),
+            opset_version=opset_version, dynamo=False
+        )
+        first_step = decoder(decoder_input_ids, encoder_hidden_states, inputs.attention_mask)
+
+        past_names = get_past_names('past_key_values', num_layers)
+        self_present_names = [name for name in present_names if '.decoder.' in name]
+        torch.onnx.export(
+            decoder, (decoder_input_ids, encoder_hidden_states, inputs.attention_mask, *first_step[1:]), os.path.join(onnx_path, DECODER_WITH_PAST_FILE_NAME),
+            input_names=['decoder_input_ids', 'encoder_hidden_states', 'encoder_attention_mask'] + past_names, output_names=['logits'] + self_present_names,
+            dynamic_axes=dict({'decoder_input_ids': {0: batch_axis}, 'encoder_hidden_states': {0: batch_axis, 1: encoder_axis},
+                               'encoder_attention_mask': {0: batch_axis, 1: encoder_axis}, 'logits': {0: batch_axis}},
+                              **{name: {0: batch_axis, 2: past_axis if '.decoder.' in name else encoder_axis} for name in past_names},
+                              **{name: {0: batch_axis, 2: decoder_axis} for name in self_present_names}),
+            opset_version=opset_version, dynamo=False
+        )
+
+    return onnx_path
@@ -0,0 +1,19 @@
+PRECISION_FP32 = 'fp32'
+PRECISION_BF16 = 'bf16'
+PRECISION_INT8_DYNAMIC = 'int8-dynamic'
+
+PRECISIONS = [PRECISION_FP32, PRECISION_BF16, PRECISION_INT8_DYNAMIC]
+
+
+def apply_precision(model, precision):
+    import torch
+
+    if precision == PRECISION_FP32:
+        return model
+    if precision == PRECISION_BF16:
+        return model.to(torch.bfloat16)
+    if precision == PRECISION_INT8_DYNAMIC:
+        # the linear layers get int8 weights, their activations are quantized on the fly
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    raise Exception('Unknown precision \'{}\', expected one of: {}.'.format(precision, ', '.join(PRECISIONS)))
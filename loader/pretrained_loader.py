@@ -1,10 +1,23 @@
 import os
 import json
-import importlib
+import asyncio
 import inspect
+import threading
+import time
 
+from collections import deque
+from concurrent.futures import Future
 
-from transformers import AutoTokenizer, T5ForConditionalGeneration
+from loader.batch_scheduler import BatchScheduler, DEFAULT_MAX_BATCH_SIZE, DEFAULT_MAX_QUEUE_DEPTH, DEFAULT_MAX_WAIT_MS, PRIORITY_LOW
+from loader.metadata_index import MetadataIndex
+from loader.model_registry import ModelRegistry
+from loader.precision import PRECISION_FP32, apply_precision
+from loader.translation_cache import TranslationCache
+from loader.translation_stream import TranslationStream
+from loader.worker_pool import DEFAULT_THREADS_PER_WORKER, InferenceWorkerPool
+from monitoring.serving_metrics import MODEL_LABEL_UNKNOWN, STAGE_MODEL_LOAD, formatter_failures, metrics_registry, model_loads, observe_stage, \
+    translation_cache_hits, translation_cache_misses
+from schema_parser.json_schema_parser import get_table_schema_from_json
 
 
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -13,8 +26,51 @@ PRETRAINED_MODELS_PATH = os.path.join(CURRENT_DIR, '../pretrained/')
 METADATA_FILE_NAME = 'metadata.json'
 MODEL_INPUTS_MODULE_NAME = 'model_inputs.model_inputs'
 
+# inference backends selectable through the 'backend' field of a model's metadata
+BACKEND_TORCH = 'torch'
+BACKEND_ONNX = 'onnx'
 
-pretrained_models_dict = {}
+
+# resident parameter bytes above which the least recently used models are unloaded, None meaning unlimited
+MODEL_MEMORY_BUDGET_BYTES = None
+
+# translations cached in front of generation, the entries never expire if the TTL is None
+TRANSLATION_CACHE_MAX_ENTRIES = 4096
+TRANSLATION_CACHE_TTL_SECONDS = None
+
+# translations of a single batch request queued at once, in batches of the batch scheduler, so that a large batch request does not fill the queue
+MANY_TRANSLATIONS_WINDOW_BATCHES = 2
+
+# synthetic translations run by every preloaded model, so that the first real request does not pay for the kernels warmup
+WARMUP_SCHEMA_PATH = os.path.join(CURRENT_DIR, '../table_schemas/swe_employees.json')
+WARMUP_QUERIES = [
+    'How many employees are older than 30?',
+    'What is the salary of the employee with the last name Smith?',
+    'Which company does the youngest employee work for?'
+]
+
+WARMUP_NOT_STARTED = 'not_started'
+WARMUP_IN_PROGRESS = 'warming_up'
+WARMUP_READY = 'ready'
+
+# minimum time between two scans of the pretrained models directory when listing the models metadata, and between two checks of the
+# checkpoint of a model when translating with it
+METADATA_REFRESH_INTERVAL_SECONDS = 5.0
+
+
+metadata_indices = {}
+metadata_indices_lock = threading.Lock()
+
+translation_cache = TranslationCache(TRANSLATION_CACHE_MAX_ENTRIES, TRANSLATION_CACHE_TTL_SECONDS)
+
+batching_config = {'max_batch_size': DEFAULT_MAX_BATCH_SIZE, 'max_wait_ms': DEFAULT_MAX_WAIT_MS, 'max_queue_depth': DEFAULT_MAX_QUEUE_DEPTH}
+batch_schedulers = {}
+batch_schedulers_lock = threading.Lock()
+
+warmup_status = {'status': WARMUP_NOT_STARTED, 'models': {}}
+
+# translations run in the calling process unless a pool of inference worker processes is started
+worker_pool = None
 
 
 def get_all_pretrained_models_dir_names():
@@ -33,37 +89,388 @@ def get_pretrained_model_metadata_from_dir(pretrained_model_dir_name):
     return json_data
 
 
-def get_all_pretrained_models_metadata():
-    pretrained_dir_names = get_all_pretrained_models_dir_names()
-    json_data_dict = {}
+def get_metadata_index():
+    with metadata_indices_lock:
+        if PRETRAINED_MODELS_PATH not in metadata_indices:
+            metadata_indices[PRETRAINED_MODELS_PATH] = MetadataIndex(PRETRAINED_MODELS_PATH, METADATA_FILE_NAME, MODEL_INPUTS_MODULE_NAME,
+                                                                     METADATA_REFRESH_INTERVAL_SECONDS)
+        return metadata_indices[PRETRAINED_MODELS_PATH]
 
-    for dir in pretrained_dir_names:
-        json_data_dict[dir] = get_pretrained_model_metadata_from_dir(dir)
-    return json_data_dict
 
+def refresh_pretrained_models_metadata(force=False):
+    metadata_index = get_metadata_index()
+    changed_dir_names = metadata_index.refresh() if force else metadata_index.refresh_if_stale()
+
+    for dir_name in changed_dir_names:
+        evict_pretrained_model(dir_name)
+    return changed_dir_names
 
-def get_pretrained_model_class_from_dir(pretrained_model_dir_name):
-    metadata = get_pretrained_model_metadata_from_dir(pretrained_model_dir_name)
-    module = importlib.import_module(MODEL_INPUTS_MODULE_NAME)
-    class_name = metadata['class_name']
 
-    return getattr(module, class_name)
+def refresh_pretrained_model_metadata(pretrained_model_dir):
+    # checked on the translation path, so that a checkpoint replaced while serving is picked up without listing the models metadata
+    changed = get_metadata_index().refresh_entry_if_stale(pretrained_model_dir)
+    if changed:
+        evict_pretrained_model(pretrained_model_dir)
+    return changed
+
+
+def evict_pretrained_model(pretrained_model_dir):
+    # a changed model directory means a changed checkpoint, so the resident copy and its translations are dropped
+    model_registry.evict(pretrained_model_dir)
+    translation_cache.invalidate_model(pretrained_model_dir)
+
+
+def get_model_label(pretrained_model_dir):
+    # the model of a request comes from the client, so the models that are not indexed share a label, which keeps the metrics bounded
+    return pretrained_model_dir if get_metadata_index().contains(pretrained_model_dir) else MODEL_LABEL_UNKNOWN
+
+
+def get_all_pretrained_models_metadata():
+    refresh_pretrained_models_metadata()
+    return get_metadata_index().get_all_metadata()
+
+
+def get_pretrained_model_class_from_dir(pretrained_model_dir_name):
+    return get_metadata_index().get_model_class(pretrained_model_dir_name)
 
 
 def get_pretrained_model_path(model_dir):
     return os.path.join(PRETRAINED_MODELS_PATH, model_dir)
 
 
-def translate_to_sql(query, pretrained_model_dir, column_data_dict):
+def configure_batching(max_batch_size=None, max_wait_ms=None, max_queue_depth=None):
+    # only schedulers created after this call pick up the new limits
+    if max_batch_size is not None:
+        batching_config['max_batch_size'] = max_batch_size
+    if max_wait_ms is not None:
+        batching_config['max_wait_ms'] = max_wait_ms
+    if max_queue_depth is not None:
+        batching_config['max_queue_depth'] = max_queue_depth
+
+
+def get_batch_scheduler(pretrained_model_dir):
+    with batch_schedulers_lock:
+        if pretrained_model_dir not in batch_schedulers:
+            # the model comes from the request, a scheduler is only started for the models that exist
+            get_metadata_index().get_metadata(pretrained_model_dir)
+            batch_schedulers[pretrained_model_dir] = BatchScheduler(
+                lambda items: translate_batch_to_sql(pretrained_model_dir, items),
+                max_batch_size=batching_config['max_batch_size'],
+                max_wait_ms=batching_config['max_wait_ms'],
+                max_queue_depth=batching_config['max_queue_depth']
+            )
+        return batch_schedulers[pretrained_model_dir]
+
+
+def get_batching_stats():
+    with batch_schedulers_lock:
+        schedulers = dict(batch_schedulers)
+    return {model_dir: scheduler.stats() for model_dir, scheduler in schedulers.items()}
+
+
+def load_pretrained_model_from_disk(pretrained_model_dir):
+    # torch and transformers are only imported once a model is needed, so that the web server and the tools start fast
+    import torch
+    from transformers import AutoTokenizer, T5ForConditionalGeneration
+
     path_to_pretrained_model = get_pretrained_model_path(pretrained_model_dir)
+    metadata = get_metadata_index().get_metadata(pretrained_model_dir)
+    precision = metadata.get('precision', PRECISION_FP32)
+    backend = metadata.get('backend', BACKEND_TORCH)
 
-    if pretrained_model_dir in pretrained_models_dict:
-        tokenizer = pretrained_models_dict[pretrained_model_dir]['tokenizer']
-        model = pretrained_models_dict[pretrained_model_dir]['model']
-    else:
-        tokenizer = AutoTokenizer.from_pretrained(path_to_pretrained_model)
-        model = T5ForConditionalGeneration.from_pretrained(path_to_pretrained_model)
-        pretrained_models_dict[pretrained_model_dir] = {'tokenizer': tokenizer, 'model': model}
+    model_loads.labels(model=pretrained_model_dir).inc()
+    tokenizer = AutoTokenizer.from_pretrained(path_to_pretrained_model)
+    if backend == BACKEND_ONNX:
+        if precision != PRECISION_FP32:
+            raise Exception('The onnx backend only supports the {} precision'.format(PRECISION_FP32))
+
+        # onnxruntime is an optional dependency, only needed by the models exported with export_onnx.py
+        from loader.onnx_backend import OnnxSeq2SeqModel
+        return tokenizer, OnnxSeq2SeqModel(path_to_pretrained_model, num_threads=torch.get_num_threads())
+
+    if backend != BACKEND_TORCH:
+        raise Exception('Unknown inference backend: {}'.format(backend))
+
+    model = T5ForConditionalGeneration.from_pretrained(path_to_pretrained_model)
+    model = apply_precision(model, precision)
+    return tokenizer, model
+
+
+model_registry = ModelRegistry(load_pretrained_model_from_disk, memory_budget_bytes=MODEL_MEMORY_BUDGET_BYTES)
+
+
+def load_pretrained_model(pretrained_model_dir):
+    return model_registry.get(pretrained_model_dir)
+
+
+def pin_pretrained_model(pretrained_model_dir):
+    model_registry.pin(pretrained_model_dir)
+
+
+def unpin_pretrained_model(pretrained_model_dir):
+    model_registry.unpin(pretrained_model_dir)
+
+
+def configure_model_memory_budget(memory_budget_bytes):
+    model_registry.memory_budget_bytes = memory_budget_bytes
+
+
+def get_model_registry_stats():
+    return model_registry.stats()
+
+
+def translate_batch_to_sql(pretrained_model_dir, items):
+    start_time = time.perf_counter()
+    tokenizer, model = load_pretrained_model(pretrained_model_dir)
+    stage_timings = {STAGE_MODEL_LOAD: time.perf_counter() - start_time}
 
     model_class = get_pretrained_model_class_from_dir(pretrained_model_dir)
-    return model_class.translate_to_sql(model, tokenizer, query, column_data_dict)
+
+    metadata = get_metadata_index().get_metadata(pretrained_model_dir)
+    constrained = metadata.get('constrained_decoding', False)
+    speculative = metadata.get('speculative_decoding', False)
+
+    # streamed translations are generated one at a time, before the others so that their first fragments are not held back by the batch
+    streamed_indices = [index for index, item in enumerate(items) if item[3] is not None]
+    batched_indices = [index for index, item in enumerate(items) if item[3] is None]
+    translations = [None] * len(items)
+
+    try:
+        for index in streamed_indices:
+            query, column_data_dict, endpoint, stream = items[index]
+            translations[index] = generate_streamed_translation(model_class, model, tokenizer, query, column_data_dict, constrained, stream)
+            observe_stage(get_model_label(pretrained_model_dir), endpoint, STAGE_MODEL_LOAD, stage_timings[STAGE_MODEL_LOAD])
+
+        if batched_indices:
+            queries = [items[index][0] for index in batched_indices]
+            column_data_dicts = [items[index][1] for index in batched_indices]
+            batch_translations = model_class.translate_to_sql_batch(model, tokenizer, queries, column_data_dicts, batch_size=len(batched_indices),
+                                                                    constrained=constrained, speculative=speculative, stage_timings=stage_timings)
+            for index, translation in zip(batched_indices, batch_translations):
+                translations[index] = translation
+    except Exception:
+        count_prompt_formatting_failures(model_class, tokenizer, items)
+        raise
+
+    # every request of the batch waited for the whole of each stage
+    for index in batched_indices:
+        for stage, seconds in stage_timings.items():
+            observe_stage(get_model_label(pretrained_model_dir), items[index][2], stage, seconds)
+    return translations
+
+
+def generate_streamed_translation(model_class, model, tokenizer, query, column_data_dict, constrained, stream):
+    # a stream cancelled while it was queued is not generated at all
+    if stream.cancel_event.is_set():
+        return ''
+
+    fragments = []
+    model_stream = model_class.translate_to_sql_stream(model, tokenizer, query, column_data_dict, constrained=constrained, cancel_event=stream.cancel_event)
+    try:
+        for fragment in model_stream:
+            fragments.append(fragment)
+            stream.put(fragment)
+    finally:
+        model_stream.close()
+    return ''.join(fragments)
+
+
+def count_prompt_formatting_failures(model_class, tokenizer, items):
+    # only a failed translation formats its prompts a second time, one at a time, to find the ones that cannot be formatted
+    for query, column_data_dict, endpoint, _ in items:
+        try:
+            model_class.get_input_ids(tokenizer, query, column_data_dict)
+        except Exception:
+            formatter_failures.labels(formatter='prompt', endpoint=endpoint).inc()
+
+
+def configure_translation_cache(max_entries=TRANSLATION_CACHE_MAX_ENTRIES, ttl_seconds=TRANSLATION_CACHE_TTL_SECONDS):
+    global translation_cache
+    translation_cache = TranslationCache(max_entries, ttl_seconds)
+
+
+def get_translation_cache_stats():
+    return translation_cache.stats()
+
+
+def start_worker_pool(num_workers, cores=None, threads_per_worker=DEFAULT_THREADS_PER_WORKER, warmup_model_dirs=()):
+    global worker_pool
+    stop_worker_pool()
+    worker_pool = InferenceWorkerPool(num_workers, PRETRAINED_MODELS_PATH, dict(batching_config), cores, threads_per_worker, list(warmup_model_dirs))
+
+
+def stop_worker_pool():
+    global worker_pool
+    if worker_pool is not None:
+        worker_pool.close()
+        worker_pool = None
+
+
+def get_worker_pool_stats():
+    return worker_pool.stats() if worker_pool is not None else None
+
+
+def warm_up_pretrained_model(pretrained_model_dir):
+    start_time = time.perf_counter()
+    tokenizer, model = load_pretrained_model(pretrained_model_dir)
+    load_seconds = time.perf_counter() - start_time
+
+    model_class = get_pretrained_model_class_from_dir(pretrained_model_dir)
+    constrained = get_metadata_index().get_metadata(pretrained_model_dir).get('constrained_decoding', False)
+
+    with open(WARMUP_SCHEMA_PATH, 'r') as file:
+        column_data_dicts = [get_table_schema_from_json(file)] * len(WARMUP_QUERIES)
+
+    # the warmup goes around the translation cache, once with single queries and once with a whole batch
+    start_time = time.perf_counter()
+    model_class.translate_to_sql_batch(model, tokenizer, WARMUP_QUERIES, column_data_dicts, batch_size=1, constrained=constrained)
+    model_class.translate_to_sql_batch(model, tokenizer, WARMUP_QUERIES, column_data_dicts, batch_size=len(WARMUP_QUERIES), constrained=constrained)
+    warmup_seconds = time.perf_counter() - start_time
+
+    return {'load_seconds': load_seconds, 'warmup_seconds': warmup_seconds}
+
+
+def warm_up_pretrained_models(pretrained_model_dirs=None):
+    if pretrained_model_dirs is None:
+        pretrained_model_dirs = get_all_pretrained_models_dir_names()
+
+    warmup_status.update(status=WARMUP_IN_PROGRESS, models={})
+    if worker_pool is not None:
+        # the workers warm up the models given to start_worker_pool on their own, in their own processes
+        for worker_warmup_results in worker_pool.wait_until_ready():
+            for pretrained_model_dir, warmup_result in worker_warmup_results.items():
+                warmup_status['models'].setdefault(pretrained_model_dir, {'workers': []})['workers'].append(warmup_result)
+    else:
+        for pretrained_model_dir in pretrained_model_dirs:
+            try:
+                warmup_status['models'][pretrained_model_dir] = warm_up_pretrained_model(pretrained_model_dir)
+            except Exception as exception:
+                warmup_status['models'][pretrained_model_dir] = {'error': str(exception)}
+
+    warmup_status['status'] = WARMUP_READY
+    return warmup_status
+
+
+def get_warmup_status():
+    return {'status': warmup_status['status'], 'models': dict(warmup_status['models'])}
+
+
+def get_cached_translation(query, pretrained_model_dir, column_data_dict, endpoint):
+    refresh_pretrained_model_metadata(pretrained_model_dir)
+    cached_translation = translation_cache.get(pretrained_model_dir, query, column_data_dict)
+    if cached_translation is not None:
+        translation_cache_hits.labels(model=get_model_label(pretrained_model_dir), endpoint=endpoint).inc()
+    else:
+        translation_cache_misses.labels(model=get_model_label(pretrained_model_dir), endpoint=endpoint).inc()
+    return cached_translation
+
+
+def translate_to_sql(query, pretrained_model_dir, column_data_dict, endpoint='', priority=PRIORITY_LOW, deadline=None):
+    cached_translation = get_cached_translation(query, pretrained_model_dir, column_data_dict, endpoint)
+    if cached_translation is not None:
+        return cached_translation
+    return generate_translation(query, pretrained_model_dir, column_data_dict, endpoint, priority, deadline)
+
+
+def submit_translation(query, pretrained_model_dir, column_data_dict, endpoint='', priority=PRIORITY_LOW, deadline=None, stream=None):
+    # raises an OverloadedError if the batch scheduler, or the queue of the worker pool, sheds the translation, the fragments of a streamed
+    # translation are put into its TranslationStream as they are generated
+    if worker_pool is not None:
+        return worker_pool.submit(query, pretrained_model_dir, column_data_dict, priority, deadline, endpoint, stream)
+    return get_batch_scheduler(pretrained_model_dir).enqueue((query, column_data_dict, endpoint, stream), priority, deadline)
+
+
+def generate_translation(query, pretrained_model_dir, column_data_dict, endpoint='', priority=PRIORITY_LOW, deadline=None):
+    translation = submit_translation(query, pretrained_model_dir, column_data_dict, endpoint, priority, deadline).result()
+    translation_cache.put(pretrained_model_dir, query, column_data_dict, translation)
+    return translation
+
+
+def translate_many_to_sql(queries, pretrained_model_dir, column_data_dict, endpoint=''):
+    # a window of translations is kept submitted so that the batch scheduler batches them, they are yielded in input order as
+    # (translation, None) or (None, exception) pairs, so that a failed translation does not fail the others
+    window_size = MANY_TRANSLATIONS_WINDOW_BATCHES * batching_config['max_batch_size']
+    pending = deque()
+    remaining_queries = iter(queries)
+
+    def submit_next():
+        query = next(remaining_queries, None)
+        if query is None:
+            return
+
+        cached_translation = get_cached_translation(query, pretrained_model_dir, column_data_dict, endpoint)
+        if cached_translation is not None:
+            pending.append((query, cached_translation))
+            return
+
+        try:
+            pending.append((query, submit_translation(query, pretrained_model_dir, column_data_dict, endpoint)))
+        except Exception as exception:
+            pending.append((query, exception))
+
+    for _ in range(window_size):
+        submit_next()
+
+    while pending:
+        query, future = pending.popleft()
+        submit_next()
+
+        if isinstance(future, Exception):
+            yield None, future
+            continue
+        if not isinstance(future, Future):
+            yield future, None
+            continue
+
+        try:
+            translation = future.result()
+        except Exception as exception:
+            yield None, exception
+            continue
+
+        translation_cache.put(pretrained_model_dir, query, column_data_dict, translation)
+        yield translation, None
+
+
+def translate_to_sql_stream(query, pretrained_model_dir, column_data_dict, endpoint='', priority=PRIORITY_LOW, deadline=None):
+    # the translation is submitted right away, so that a shed translation raises an OverloadedError before any fragment is sent, the
+    # returned generator yields the fragments and closing it early cancels the translation
+    cached_translation = get_cached_translation(query, pretrained_model_dir, column_data_dict, endpoint)
+    if cached_translation is not None:
+        return iter_cached_translation(cached_translation)
+
+    stream = TranslationStream()
+    future = submit_translation(query, pretrained_model_dir, column_data_dict, endpoint, priority, deadline, stream)
+    return iter_streamed_translation(query, pretrained_model_dir, column_data_dict, stream, future)
+
+
+def iter_cached_translation(translation):
+    yield translation
+
+
+def iter_streamed_translation(query, pretrained_model_dir, column_data_dict, stream, future):
+    translation = yield from stream.follow(future)
+    if not stream.cancel_event.is_set():
+        translation_cache.put(pretrained_model_dir, query, column_data_dict, translation)
+
+
+async def translate_to_sql_async(query, pretrained_model_dir, column_data_dict, endpoint='', priority=PRIORITY_LOW, deadline=None):
+    # cached translations are answered on the event loop, the others wait in the bounded queue of the batch scheduler without holding a thread
+    cached_translation = get_cached_translation(query, pretrained_model_dir, column_data_dict, endpoint)
+    if cached_translation is not None:
+        return cached_translation
+
+    future = submit_translation(query, pretrained_model_dir, column_data_dict, endpoint, priority, deadline)
+    translation = await asyncio.wrap_future(future)
+    translation_cache.put(pretrained_model_dir, query, column_data_dict, translation)
+    return translation
+
+
+# the loader state is read when the metrics are scraped, nothing is recorded for it while serving
+metrics_registry.gauge('sqlgen_resident_model_bytes', 'Bytes of the model weights resident in memory.', [],
+                       lambda: [({}, get_model_registry_stats()['resident_bytes'])])
+metrics_registry.gauge('sqlgen_translation_cache_entries', 'Translations held by the translation cache.', [],
+                       lambda: [({}, get_translation_cache_stats()['entries'])])
+metrics_registry.gauge('sqlgen_batch_queue_depth', 'Translations waiting for the batch scheduler of a model.', ['model', 'priority'],
+                       lambda: [({'model': model_dir, 'priority': priority}, queue_depth) for model_dir, stats in get_batching_stats().items()
+                                for priority, queue_depth in stats['queue_depths'].items()])
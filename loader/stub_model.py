@@ -0,0 +1,96 @@
+import json
+import os
+import string
+
+from tokenizers import Tokenizer, decoders, models, pre_tokenizers, processors, trainers
+from transformers import PreTrainedTokenizerFast, T5Config, T5ForConditionalGeneration
+
+
+METADATA_FILE_NAME = 'metadata.json'
+
+SPECIAL_TOKENS = {
+    't5': ['<pad>', '</s>', '<unk>'],
+    'code-t5': ['<pad>', '<s>', '</s>', '<unk>'],
+}
+STUB_VOCAB_SIZE = 400
+
+STUB_TRAINING_CORPUS = [
+    'translate to SQL the following natural language query:',
+    'where the table is Table(',
+    'SELECT COUNT MAX MIN SUM AVG FROM table WHERE AND',
+    'How many employees are older than 30?',
+    'What is the salary of the employee named John?',
+    'ID: int, Last name: text, First name: text, Age: int, Company: text, Salary: real',
+]
+
+
+def create_stub_tokenizer(base_model='t5'):
+    tokenizer = Tokenizer(models.BPE(unk_token='<unk>'))
+
+    # mirrors the pre-tokenization of the real tokenizers: sentencepiece-like for T5, byte-level BPE for CodeT5
+    if base_model == 't5':
+        tokenizer.pre_tokenizer = pre_tokenizers.Metaspace()
+        tokenizer.decoder = decoders.Metaspace()
+        initial_alphabet = list(string.printable.strip()) + ['▁']
+        template = '$A </s>'
+    else:
+        tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+        tokenizer.decoder = decoders.ByteLevel()
+        initial_alphabet = pre_tokenizers.ByteLevel.alphabet()
+        template = '<s> $A </s>'
+
+    # every character is part of the alphabet, so any prompt can be tokenized
+    trainer = trainers.BpeTrainer(vocab_size=STUB_VOCAB_SIZE, special_tokens=SPECIAL_TOKENS[base_model], initial_alphabet=initial_alphabet)
+    tokenizer.train_from_iterator(STUB_TRAINING_CORPUS, trainer=trainer)
+
+    special_tokens = [(token, tokenizer.token_to_id(token)) for token in ['<s>', '</s>'] if token in template]
+    tokenizer.post_processor = processors.TemplateProcessing(single=template, special_tokens=special_tokens)
+
+    return PreTrainedTokenizerFast(tokenizer_object=tokenizer, pad_token='<pad>', eos_token='</s>', unk_token='<unk>',
+                                   bos_token='<s>' if base_model == 'code-t5' else None, model_input_names=['input_ids', 'attention_mask'])
+
+
+def create_stub_model(tokenizer, seed=0):
+    import torch
+    torch.manual_seed(seed)
+
+    config = T5Config(
+        vocab_size=len(tokenizer),
+        d_model=32,
+        d_kv=8,
+        d_ff=64,
+        num_layers=2,
+        num_heads=4,
+        pad_token_id=tokenizer.pad_token_id,
+        eos_token_id=tokenizer.eos_token_id,
+        decoder_start_token_id=tokenizer.pad_token_id,
+        # an untied output layer keeps the random model from predicting padding at every step
+        tie_word_embeddings=False,
+    )
+    model = T5ForConditionalGeneration(config)
+    model.eval()
+    return model
+
+
+def create_stub_pretrained_model(path, class_name='SQLT5Baseline', seed=0, metadata=None):
+    os.makedirs(path, exist_ok=True)
+
+    tokenizer = create_stub_tokenizer('code-t5' if class_name.startswith('SQLCodeT5') else 't5')
+    model = create_stub_model(tokenizer, seed)
+    tokenizer.save_pretrained(path)
+    model.save_pretrained(path)
+
+    model_metadata = {
+        'name': 'StubPretrainedModel',
+        'version': '1.0',
+        'class_name': class_name,
+        'base_mode': 'NOT DEFINED',
+        'results': {'wikisql_acc': {}, 'rouge': {}},
+        'other_information': 'Randomly initialized model, only meant for testing.'
+    }
+    model_metadata.update(metadata or {})
+
+    with open(os.path.join(path, METADATA_FILE_NAME), 'w') as file:
+        json.dump(model_metadata, file)
+
+    return tokenizer, model
@@ -0,0 +1,157 @@
+import threading
+import time
+from unittest import TestCase
+
+from loader.batch_scheduler import PRIORITY_HIGH, PRIORITY_LOW, SHED_DEADLINE, SHED_EXPIRED, SHED_QUEUE_FULL, BatchScheduler, OverloadedError
+
+
+class TestBatchScheduler(TestCase):
+    def setUp(self):
+        self.batches = []
+
+    def run_batch(self, items):
+        self.batches.append(list(items))
+        return [item * 2 for item in items]
+
+    def submit_concurrently(self, scheduler, items):
+        results = {}
+
+        def submit(item):
+            results[item] = scheduler.submit(item)
+
+        threads = [threading.Thread(target=submit, args=(item,)) for item in items]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return results
+
+    def test_each_caller_gets_its_own_result(self):
+        scheduler = BatchScheduler(self.run_batch, max_batch_size=4, max_wait_ms=50)
+        results = self.submit_concurrently(scheduler, list(range(10)))
+
+        assert results == {item: item * 2 for item in range(10)}
+        assert sum(len(batch) for batch in self.batches) == 10
+        assert all(len(batch) <= 4 for batch in self.batches)
+
+    def test_concurrent_requests_are_coalesced(self):
+        scheduler = BatchScheduler(self.run_batch, max_batch_size=8, max_wait_ms=200)
+        self.submit_concurrently(scheduler, list(range(8)))
+
+        assert len(self.batches) < 8
+        assert scheduler.stats()['batch_size']['count'] == len(self.batches)
+
+    def test_single_request_is_flushed_after_max_wait(self):
+        scheduler = BatchScheduler(self.run_batch, max_batch_size=8, max_wait_ms=20)
+
+        start = time.perf_counter()
+        assert scheduler.submit(21) == 42
+        assert time.perf_counter() - start < 1
+
+        stats = scheduler.stats()
+        assert stats['batch_size']['buckets'][1] == 1
+        assert stats['queue_wait_ms']['count'] == 1
+
+    def test_batch_errors_are_propagated(self):
+        def failing_batch(items):
+            raise RuntimeError('generation failed')
+
+        scheduler = BatchScheduler(failing_batch, max_batch_size=2, max_wait_ms=1)
+        with self.assertRaises(RuntimeError):
+            scheduler.submit(1)
+
+    def test_enqueued_requests_are_batched_together(self):
+        scheduler = BatchScheduler(self.run_batch, max_batch_size=4, max_wait_ms=200)
+        futures = [scheduler.enqueue(item) for item in range(6)]
+
+        assert [future.result() for future in futures] == [item * 2 for item in range(6)]
+        assert self.batches[0] == [0, 1, 2, 3]
+
+    def start_blocked_scheduler(self, **kwargs):
+        # the first request is held in a running batch until the release event is set, so that the next ones stay queued
+        running, release = threading.Event(), threading.Event()
+
+        def blocking_batch(items):
+            running.set()
+            release.wait()
+            return self.run_batch(items)
+
+        scheduler = BatchScheduler(blocking_batch, max_batch_size=1, max_wait_ms=0, **kwargs)
+        first_future = scheduler.enqueue(0, PRIORITY_HIGH)
+        running.wait()
+        return scheduler, release, first_future
+
+    def test_low_priority_requests_are_shed_first_when_the_queue_is_full(self):
+        scheduler, release, first_future = self.start_blocked_scheduler(max_queue_depth=4, high_priority_reserved_fraction=0.25)
+        try:
+            low_futures = [scheduler.enqueue(item, PRIORITY_LOW) for item in [1, 2, 3]]
+            with self.assertRaises(OverloadedError) as context:
+                scheduler.enqueue(4, PRIORITY_LOW)
+            assert context.exception.reason == SHED_QUEUE_FULL
+
+            high_future = scheduler.enqueue(5, PRIORITY_HIGH)
+            with self.assertRaises(OverloadedError):
+                scheduler.enqueue(6, PRIORITY_HIGH)
+
+            stats = scheduler.stats()
+            assert stats['queue_depths'] == {PRIORITY_HIGH: 1, PRIORITY_LOW: 3}
+            assert stats['shed'][SHED_QUEUE_FULL] == 2
+        finally:
+            release.set()
+
+        assert first_future.result() == 0
+        assert high_future.result() == 10
+        assert [future.result() for future in low_futures] == [2, 4, 6]
+
+        # the high priority request went before the low priority ones queued earlier
+        assert self.batches == [[0], [5], [1], [2], [3]]
+
+    def test_requests_that_cannot_meet_their_deadline_are_rejected(self):
+        def slow_batch(items):
+            time.sleep(0.05)
+            return self.run_batch(items)
+
+        scheduler = BatchScheduler(slow_batch, max_batch_size=1, max_wait_ms=0)
+        assert scheduler.submit(1) == 2
+
+        with self.assertRaises(OverloadedError) as context:
+            scheduler.enqueue(2, deadline=time.perf_counter() + 0.01)
+        assert context.exception.reason == SHED_DEADLINE
+        assert context.exception.retry_after_seconds >= 0.05
+
+        assert scheduler.submit(3, deadline=time.perf_counter() + 10) == 6
+        assert scheduler.stats()['shed'][SHED_DEADLINE] == 1
+
+    def test_requests_expired_in_the_queue_are_dropped(self):
+        scheduler, release, _ = self.start_blocked_scheduler()
+        future = scheduler.enqueue(1, deadline=time.perf_counter() + 0.01)
+        time.sleep(0.05)
+        release.set()
+
+        with self.assertRaises(OverloadedError) as context:
+            future.result()
+        assert context.exception.reason == SHED_EXPIRED
+        assert self.batches == [[0]]
+        assert scheduler.stats()['shed'][SHED_EXPIRED] == 1
+
+    def test_cancelled_requests_do_not_stop_the_scheduler(self):
+        scheduler = BatchScheduler(self.run_batch, max_batch_size=4, max_wait_ms=20)
+        future = scheduler.enqueue(1)
+        assert future.cancel()
+        assert scheduler.enqueue(2).result(timeout=2) == 4
+
+        # the cancelled request is dropped from the batch it was queued for
+        scheduler, release, first_future = self.start_blocked_scheduler()
+        cancelled_future = scheduler.enqueue(1)
+        expired_future = scheduler.enqueue(2, deadline=time.perf_counter() + 0.01)
+        next_future = scheduler.enqueue(3)
+        assert cancelled_future.cancel()
+        assert expired_future.cancel()
+        time.sleep(0.05)
+        release.set()
+
+        assert first_future.result(timeout=2) == 0
+        assert next_future.result(timeout=2) == 6
+        assert scheduler.submit(4) == 8
+        assert self.batches[-3:] == [[0], [3], [4]]
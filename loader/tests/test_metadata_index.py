@@ -0,0 +1,122 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+from unittest import TestCase, mock
+
+from loader.metadata_index import MetadataIndex
+from model_inputs.model_inputs import SQLCodeT5Baseline, SQLT5ColNameAware
+
+
+class TestMetadataIndex(TestCase):
+    METADATA_FILE_NAME = 'metadata.json'
+    MODEL_INPUTS_MODULE_NAME = 'model_inputs.model_inputs'
+
+    def setUp(self):
+        self.pretrained_path = tempfile.mkdtemp()
+        self.write_metadata('model_a', 'SQLCodeT5Baseline')
+        self.write_metadata('model_b', 'SQLT5ColNameAware')
+        self.metadata_index = MetadataIndex(self.pretrained_path, self.METADATA_FILE_NAME, self.MODEL_INPUTS_MODULE_NAME)
+
+    def tearDown(self):
+        shutil.rmtree(self.pretrained_path)
+
+    def write_metadata(self, dir_name, class_name, mtime=None):
+        model_path = os.path.join(self.pretrained_path, dir_name)
+        os.makedirs(model_path, exist_ok=True)
+
+        metadata_path = os.path.join(model_path, self.METADATA_FILE_NAME)
+        with open(metadata_path, 'w') as file:
+            json.dump({'name': dir_name, 'class_name': class_name}, file)
+
+        if mtime is not None:
+            os.utime(metadata_path, (mtime, mtime))
+
+    def test_refresh_builds_the_index(self):
+        self.metadata_index.refresh()
+
+        assert self.metadata_index.get_all_metadata() == {
+            'model_a': {'name': 'model_a', 'class_name': 'SQLCodeT5Baseline'},
+            'model_b': {'name': 'model_b', 'class_name': 'SQLT5ColNameAware'},
+        }
+        assert self.metadata_index.get_model_class('model_a') is SQLCodeT5Baseline
+        assert self.metadata_index.get_model_class('model_b') is SQLT5ColNameAware
+
+    def test_lookups_do_not_touch_the_filesystem(self):
+        self.metadata_index.refresh()
+
+        with mock.patch('loader.metadata_index.os.stat', side_effect=AssertionError), mock.patch('builtins.open', side_effect=AssertionError):
+            assert self.metadata_index.get_model_class('model_a') is SQLCodeT5Baseline
+            assert self.metadata_index.get_metadata('model_b')['class_name'] == 'SQLT5ColNameAware'
+
+    def test_refresh_only_reloads_changed_entries(self):
+        self.metadata_index.refresh()
+        self.write_metadata('model_b', 'SQLCodeT5Baseline', mtime=1)
+
+        with mock.patch('loader.metadata_index.json.load', wraps=json.load) as json_load:
+            assert self.metadata_index.refresh() == ['model_b']
+            assert json_load.call_count == 1
+
+        assert self.metadata_index.get_model_class('model_b') is SQLCodeT5Baseline
+        assert self.metadata_index.refresh() == []
+
+    def test_refresh_detects_added_and_removed_models(self):
+        self.metadata_index.refresh()
+        shutil.rmtree(os.path.join(self.pretrained_path, 'model_a'))
+        self.write_metadata('model_c', 'SQLT5ColNameAware')
+
+        assert self.metadata_index.refresh() == ['model_a']
+        assert sorted(self.metadata_index.get_all_metadata().keys()) == ['model_b', 'model_c']
+
+    def test_unknown_models_are_indexed_on_first_use(self):
+        assert self.metadata_index.get_model_class('model_a') is SQLCodeT5Baseline
+        assert list(self.metadata_index.get_all_metadata().keys()) == ['model_a']
+
+    def test_broken_model_directories_are_skipped(self):
+        os.makedirs(os.path.join(self.pretrained_path, 'no_metadata'))
+        self.write_metadata('unknown_class', 'MissingModelClass')
+        with open(os.path.join(self.pretrained_path, 'model_b', self.METADATA_FILE_NAME), 'w') as file:
+            file.write('{"name": ')
+
+        assert self.metadata_index.refresh() == []
+        assert sorted(self.metadata_index.get_all_metadata().keys()) == ['model_a']
+        with self.assertRaises(Exception):
+            self.metadata_index.get_model_class('no_metadata')
+
+    def test_broken_model_directories_keep_their_last_good_entry(self):
+        self.metadata_index.refresh()
+        os.remove(os.path.join(self.pretrained_path, 'model_b', self.METADATA_FILE_NAME))
+
+        assert self.metadata_index.refresh() == []
+        assert self.metadata_index.get_model_class('model_b') is SQLT5ColNameAware
+        assert sorted(self.metadata_index.get_all_metadata().keys()) == ['model_a', 'model_b']
+
+    def write_weights(self, dir_name, weights, mtime=None):
+        weights_path = os.path.join(self.pretrained_path, dir_name, 'model.safetensors')
+        with open(weights_path, 'wb') as file:
+            file.write(weights)
+
+        if mtime is not None:
+            os.utime(weights_path, (mtime, mtime))
+
+    def test_refresh_detects_weights_overwritten_in_place(self):
+        self.write_weights('model_a', b'weights', mtime=1)
+        self.metadata_index.refresh()
+
+        # the directory and the metadata file keep their mtimes, only the size of the weights changes
+        self.write_weights('model_a', b'other weights', mtime=1)
+        assert self.metadata_index.refresh() == ['model_a']
+
+    def test_lookup_checks_are_rate_limited(self):
+        metadata_index = MetadataIndex(self.pretrained_path, self.METADATA_FILE_NAME, self.MODEL_INPUTS_MODULE_NAME, refresh_interval_seconds=60)
+        metadata_index.refresh()
+        self.write_weights('model_a', b'weights')
+
+        assert not metadata_index.refresh_entry_if_stale('model_a')
+        with mock.patch('loader.metadata_index.time.monotonic', return_value=time.monotonic() + 60):
+            assert metadata_index.refresh_entry_if_stale('model_a')
+            assert not metadata_index.refresh_entry_if_stale('model_a')
+
+        # the models that were never indexed are left to their first use
+        assert not metadata_index.refresh_entry_if_stale('missing')
@@ -0,0 +1,88 @@
+import threading
+import time
+from unittest import TestCase
+
+from loader.model_registry import ModelRegistry
+
+
+MODEL_SIZES = {'small': 10, 'medium': 20, 'large': 40}
+
+
+class TestModelRegistry(TestCase):
+    def setUp(self):
+        self.loaded_keys = []
+
+    def load_model(self, key):
+        self.loaded_keys.append(key)
+        time.sleep(0.05)
+        return 'tokenizer-{}'.format(key), 'model-{}'.format(key)
+
+    def create_registry(self, memory_budget_bytes=None):
+        return ModelRegistry(self.load_model, memory_budget_bytes=memory_budget_bytes, model_size=lambda loaded_model: MODEL_SIZES[loaded_model[1][len('model-'):]])
+
+    def test_concurrent_first_requests_load_the_model_once(self):
+        registry = self.create_registry()
+        results = []
+
+        threads = [threading.Thread(target=lambda: results.append(registry.get('small'))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert self.loaded_keys == ['small']
+        assert results == [('tokenizer-small', 'model-small')] * 8
+
+        stats = registry.stats()
+        assert stats['loads'] == 1
+        assert stats['hits'] + stats['misses'] == 8
+        assert stats['load_seconds'] > 0
+
+    def test_least_recently_used_model_is_evicted(self):
+        registry = self.create_registry(memory_budget_bytes=35)
+        registry.get('small')
+        registry.get('medium')
+        assert registry.resident_bytes() == 30
+
+        # loading 'large' requires evicting both models, but 'large' itself is kept
+        registry.get('large')
+        assert registry.stats()['resident_models'] == ['large']
+        assert registry.stats()['evictions'] == 2
+
+    def test_eviction_order_follows_usage(self):
+        registry = self.create_registry(memory_budget_bytes=30)
+        registry.get('small')
+        registry.get('medium')
+        registry.get('small')
+
+        registry.memory_budget_bytes = 15
+        assert registry.stats()['resident_models'] == ['small']
+
+    def test_pinned_models_are_not_evicted(self):
+        registry = self.create_registry(memory_budget_bytes=50)
+        registry.pin('medium')
+        registry.get('medium')
+        registry.get('small')
+        registry.get('large')
+
+        assert registry.stats()['resident_models'] == ['medium', 'large']
+
+        registry.unpin('medium')
+        assert registry.stats()['resident_models'] == ['large']
+
+    def test_hits_and_misses_are_counted(self):
+        registry = self.create_registry()
+        registry.get('small')
+        registry.get('small')
+        registry.get('medium')
+
+        stats = registry.stats()
+        assert (stats['hits'], stats['misses'], stats['loads']) == (1, 2, 2)
+
+    def test_evict(self):
+        registry = self.create_registry()
+        registry.get('small')
+
+        assert registry.evict('small')
+        assert not registry.evict('small')
+        assert not registry.contains('small')
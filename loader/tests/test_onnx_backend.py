@@ -0,0 +1,68 @@
+import importlib.util
+import os
+import shutil
+import tempfile
+import unittest
+
+from loader.stub_model import create_stub_pretrained_model
+from model_inputs import model_inputs
+
+
+QUERIES = ['How many employees are older than 30?', 'Who?', 'What is the salary of the employee with the last name Smith?']
+COLUMN_DATA_DICT = {'column_names': ['Name', 'Age', 'Salary'], 'column_types': ['text', 'real', 'real']}
+
+
+@unittest.skipUnless(importlib.util.find_spec('onnxruntime'), 'onnxruntime is not installed')
+class TestOnnxBackend(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        from loader.onnx_backend import OnnxSeq2SeqModel
+        from loader.onnx_export import export_to_onnx
+
+        cls.pretrained_path = tempfile.mkdtemp()
+        cls.tokenizer, cls.model = {}, {}
+        cls.onnx_model = {}
+
+        for class_name in ['SQLT5Baseline', 'SQLCodeT5Baseline']:
+            path = os.path.join(cls.pretrained_path, class_name)
+            cls.tokenizer[class_name], cls.model[class_name] = create_stub_pretrained_model(path, class_name)
+            export_to_onnx(path)
+            cls.onnx_model[class_name] = OnnxSeq2SeqModel(path)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.pretrained_path)
+
+    def generate(self, class_name, model, **kwargs):
+        tokenizer = self.tokenizer[class_name]
+        inputs = tokenizer(QUERIES, padding='longest', return_tensors='pt')
+        output = model.generate(inputs.input_ids, attention_mask=inputs.attention_mask, max_length=32, **kwargs)
+        return tokenizer.batch_decode(output, skip_special_tokens=True)
+
+    def test_greedy_search_matches_torch(self):
+        for class_name in self.onnx_model:
+            assert self.generate(class_name, self.onnx_model[class_name]) == self.generate(class_name, self.model[class_name])
+
+    def test_beam_search_matches_torch(self):
+        for class_name in self.onnx_model:
+            assert self.generate(class_name, self.onnx_model[class_name], num_beams=3) == self.generate(class_name, self.model[class_name], num_beams=3)
+
+    def test_translate_to_sql_is_backend_agnostic(self):
+        for class_name in self.onnx_model:
+            model_class = getattr(model_inputs, class_name)
+            column_data_dicts = [COLUMN_DATA_DICT] * len(QUERIES)
+
+            for constrained in [False, True]:
+                expected = model_class.translate_to_sql_batch(self.model[class_name], self.tokenizer[class_name], QUERIES, column_data_dicts, constrained=constrained)
+                actual = model_class.translate_to_sql_batch(self.onnx_model[class_name], self.tokenizer[class_name], QUERIES, column_data_dicts, constrained=constrained)
+                assert actual == expected
+
+    def test_size_is_the_size_of_the_graphs(self):
+        for class_name in self.onnx_model:
+            assert self.onnx_model[class_name].get_size_bytes() > 0
+
+    def test_translate_to_sql_stream_is_backend_agnostic(self):
+        for class_name in self.onnx_model:
+            model_class = getattr(model_inputs, class_name)
+            fragments = list(model_class.translate_to_sql_stream(self.onnx_model[class_name], self.tokenizer[class_name], QUERIES[0], COLUMN_DATA_DICT))
+            assert ''.join(fragments) == model_class.translate_to_sql(self.model[class_name], self.tokenizer[class_name], QUERIES[0], COLUMN_DATA_DICT)
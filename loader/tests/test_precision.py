@@ -0,0 +1,38 @@
+import unittest
+
+import torch
+
+from loader.model_registry import get_model_size_bytes
+from loader.precision import apply_precision
+from loader.stub_model import create_stub_model, create_stub_tokenizer
+
+
+class TestPrecision(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tokenizer = create_stub_tokenizer()
+        cls.inputs = cls.tokenizer(['How many employees are older than 30?'], return_tensors='pt')
+
+    def test_fp32_keeps_the_model(self):
+        model = create_stub_model(self.tokenizer)
+        assert apply_precision(model, 'fp32') is model
+
+    def test_bf16_halves_the_model_size(self):
+        fp32_size = get_model_size_bytes((self.tokenizer, create_stub_model(self.tokenizer)))
+        model = apply_precision(create_stub_model(self.tokenizer), 'bf16')
+
+        assert model.dtype == torch.bfloat16
+        assert get_model_size_bytes((self.tokenizer, model)) * 2 == fp32_size
+        model.generate(**self.inputs, max_length=8)
+
+    def test_int8_dynamic_quantizes_linear_layers(self):
+        fp32_size = get_model_size_bytes((self.tokenizer, create_stub_model(self.tokenizer)))
+        model = apply_precision(create_stub_model(self.tokenizer), 'int8-dynamic')
+
+        assert not any(type(module) is torch.nn.Linear for module in model.modules())
+        assert get_model_size_bytes((self.tokenizer, model)) < fp32_size
+        model.generate(**self.inputs, max_length=8)
+
+    def test_unknown_precision(self):
+        with self.assertRaises(Exception):
+            apply_precision(create_stub_model(self.tokenizer), 'fp8')
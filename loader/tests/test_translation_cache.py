@@ -0,0 +1,78 @@
+from unittest import TestCase
+
+from loader.translation_cache import TranslationCache
+
+
+COLUMN_DATA_DICT = {'table_name': 'table_swe_employees', 'column_names': ['Name', 'Age'], 'column_types': ['text', 'int']}
+OTHER_COLUMN_DATA_DICT = {'table_name': 'table_swe_employees', 'column_names': ['Name', 'Age'], 'column_types': ['text', 'real']}
+
+
+class FakeClock:
+    def __init__(self):
+        self.time = 0.0
+
+    def __call__(self):
+        return self.time
+
+
+class TestTranslationCache(TestCase):
+    def test_questions_are_normalized(self):
+        cache = TranslationCache()
+        cache.put('model', 'How many  employees?', COLUMN_DATA_DICT, 'SELECT COUNT Name FROM table')
+
+        assert cache.get('model', '  how MANY employees? ', COLUMN_DATA_DICT) == 'SELECT COUNT Name FROM table'
+        assert cache.get('model', 'How many employees', COLUMN_DATA_DICT) is None
+
+    def test_key_contains_model_and_schema(self):
+        cache = TranslationCache()
+        cache.put('model', 'How many employees?', COLUMN_DATA_DICT, 'SELECT COUNT Name FROM table')
+
+        assert cache.get('other_model', 'How many employees?', COLUMN_DATA_DICT) is None
+        assert cache.get('model', 'How many employees?', OTHER_COLUMN_DATA_DICT) is None
+
+        renamed_table = dict(COLUMN_DATA_DICT, table_name='table_renamed')
+        assert cache.get('model', 'How many employees?', renamed_table) == 'SELECT COUNT Name FROM table'
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = TranslationCache(max_entries=2)
+        cache.put('model', 'q1', COLUMN_DATA_DICT, 'a1')
+        cache.put('model', 'q2', COLUMN_DATA_DICT, 'a2')
+        cache.get('model', 'q1', COLUMN_DATA_DICT)
+        cache.put('model', 'q3', COLUMN_DATA_DICT, 'a3')
+
+        assert cache.get('model', 'q2', COLUMN_DATA_DICT) is None
+        assert cache.get('model', 'q1', COLUMN_DATA_DICT) == 'a1'
+        assert cache.stats()['evictions'] == 1
+
+    def test_entries_expire_after_ttl(self):
+        clock = FakeClock()
+        cache = TranslationCache(ttl_seconds=10, clock=clock)
+        cache.put('model', 'q1', COLUMN_DATA_DICT, 'a1')
+
+        clock.time = 10
+        assert cache.get('model', 'q1', COLUMN_DATA_DICT) == 'a1'
+
+        clock.time = 10.5
+        assert cache.get('model', 'q1', COLUMN_DATA_DICT) is None
+        assert cache.stats()['expirations'] == 1
+
+    def test_invalidate_model(self):
+        cache = TranslationCache()
+        cache.put('model', 'q1', COLUMN_DATA_DICT, 'a1')
+        cache.put('model', 'q2', COLUMN_DATA_DICT, 'a2')
+        cache.put('other_model', 'q1', COLUMN_DATA_DICT, 'b1')
+
+        assert cache.invalidate_model('model') == 2
+        assert cache.get('model', 'q1', COLUMN_DATA_DICT) is None
+        assert cache.get('other_model', 'q1', COLUMN_DATA_DICT) == 'b1'
+
+    def test_hit_rate(self):
+        cache = TranslationCache()
+        cache.put('model', 'q1', COLUMN_DATA_DICT, 'a1')
+        cache.get('model', 'q1', COLUMN_DATA_DICT)
+        cache.get('model', 'q1', COLUMN_DATA_DICT)
+        cache.get('model', 'q2', COLUMN_DATA_DICT)
+
+        stats = cache.stats()
+        assert (stats['hits'], stats['misses'], stats['entries']) == (2, 1, 1)
+        assert abs(stats['hit_rate'] - 2 / 3) < 1e-9
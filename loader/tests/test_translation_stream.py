@@ -0,0 +1,42 @@
+import unittest
+
+from concurrent.futures import Future
+
+from loader.translation_stream import TranslationStream
+
+
+class TestTranslationStream(unittest.TestCase):
+    def test_fragments_are_followed_until_the_translation_is_done(self):
+        stream, future = TranslationStream(), Future()
+        stream.put('SELECT ')
+        stream.put('Name')
+        future.set_result('SELECT Name')
+
+        assert list(stream.follow(future)) == ['SELECT ', 'Name']
+
+    def test_errors_are_raised_after_the_fragments(self):
+        stream, future = TranslationStream(), Future()
+        stream.put('SELECT ')
+        future.set_exception(Exception('The generation failed.'))
+
+        fragments = stream.follow(future)
+        assert next(fragments) == 'SELECT '
+        with self.assertRaises(Exception):
+            next(fragments)
+
+    def test_closing_early_cancels_the_translation(self):
+        stream, future = TranslationStream(), Future()
+        cancelled = []
+        stream.add_cancel_callback(lambda: cancelled.append(True))
+        stream.put('SELECT ')
+
+        fragments = stream.follow(future)
+        next(fragments)
+        fragments.close()
+
+        assert future.cancelled() and stream.cancel_event.is_set()
+        assert cancelled == [True]
+
+        # callbacks added once the stream is cancelled run right away
+        stream.add_cancel_callback(lambda: cancelled.append(True))
+        assert cancelled == [True, True]
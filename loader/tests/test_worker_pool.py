@@ -0,0 +1,163 @@
+import os
+import time
+import unittest
+
+from concurrent.futures import ThreadPoolExecutor
+
+from loader import pretrained_loader
+from loader.batch_scheduler import PRIORITY_HIGH, SHED_DEADLINE, SHED_QUEUE_FULL, OverloadedError
+from loader.translation_stream import TranslationStream
+from loader.worker_pool import InferenceWorkerPool, partition_cores
+from monitoring.serving_metrics import metrics_registry
+from web.sqlgen_server.tests.stub_model_test_case import StubModelTestCase
+
+
+QUERIES = ['How many employees are older than 30?', 'Who?', 'What is the salary of the employee with the last name Smith?', 'List all the names']
+COLUMN_DATA_DICT = {'column_names': ['Name', 'Age', 'Salary'], 'column_types': ['text', 'real', 'real']}
+
+
+class TestPartitionCores(unittest.TestCase):
+    def test_cores_are_split_in_contiguous_slices(self):
+        assert partition_cores([0, 1, 2, 3, 4, 5, 6, 7], 4) == [[0, 1], [2, 3], [4, 5], [6, 7]]
+
+    def test_remaining_cores_go_to_the_first_workers(self):
+        assert partition_cores([0, 1, 2, 3, 4], 2) == [[0, 1, 2], [3, 4]]
+
+    def test_more_workers_than_cores(self):
+        assert partition_cores([0, 1], 3) == [[0], [1], [0]]
+
+    def test_no_workers(self):
+        with self.assertRaises(Exception):
+            partition_cores([0, 1], 0)
+
+
+class TestInferenceWorkerPool(StubModelTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.expected = [pretrained_loader.translate_to_sql(query, 'stub', COLUMN_DATA_DICT) for query in QUERIES]
+
+        cls.pool = InferenceWorkerPool(2, cls.pretrained_path, {'max_batch_size': 4, 'max_wait_ms': 5.0}, threads_per_worker=4, warmup_model_dirs=['stub'])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.close()
+        super().tearDownClass()
+
+    def test_workers_translate_like_the_web_process(self):
+        with ThreadPoolExecutor(8) as executor:
+            translations = list(executor.map(lambda query: self.pool.translate_to_sql(query, 'stub', COLUMN_DATA_DICT), QUERIES * 4))
+        assert translations == self.expected * 4
+
+    @unittest.skipUnless(hasattr(os, 'sched_getaffinity'), 'core affinity is not supported on this platform')
+    def test_workers_are_pinned_to_their_cores(self):
+        # a worker pins itself once it starts, which is at the latest when it takes its first task
+        deadline = time.monotonic() + 60
+        for worker in self.pool.stats()['workers']:
+            while os.sched_getaffinity(worker['pid']) != set(worker['cores']) and time.monotonic() < deadline:
+                time.sleep(0.1)
+            assert os.sched_getaffinity(worker['pid']) == set(worker['cores'])
+
+    def test_every_worker_warms_up_its_models(self):
+        warmup_results = self.pool.wait_until_ready()
+        assert len(warmup_results) == 2
+        assert all(worker_warmup_results['stub']['warmup_seconds'] > 0 for worker_warmup_results in warmup_results)
+
+    def test_worker_metrics_are_served_by_the_web_process(self):
+        assert self.pool.submit(QUERIES[0], 'stub', COLUMN_DATA_DICT, endpoint='worker_pool_test').result(timeout=60)
+
+        lines = metrics_registry.render_prometheus().splitlines()
+        for stage in ['prompt_formatting', 'tokenization', 'generate', 'decoding']:
+            prefix = 'sqlgen_stage_seconds_count{{model="stub",endpoint="worker_pool_test",stage="{}"}} '.format(stage)
+            assert any(line.startswith(prefix) and float(line.rsplit(' ', 1)[1]) >= 1 for line in lines), stage
+
+    def test_streamed_translations_are_forwarded_by_the_workers(self):
+        stream = TranslationStream()
+        future = self.pool.submit(QUERIES[2], 'stub', COLUMN_DATA_DICT, stream=stream)
+
+        fragments = list(stream.follow(future))
+        assert len(fragments) > 1
+        assert ''.join(fragments) == future.result() == self.expected[2]
+
+    def test_closing_a_streamed_translation_cancels_it_in_the_worker(self):
+        stream = TranslationStream()
+        future = self.pool.submit(QUERIES[0], 'stub', COLUMN_DATA_DICT, stream=stream)
+
+        fragments = stream.follow(future)
+        next(fragments)
+        fragments.close()
+
+        # the worker stops at its next generation step, with the fragments generated so far
+        assert stream.cancel_event.is_set()
+        assert self.expected[0].startswith(future.result(timeout=60))
+
+    def test_errors_are_raised_in_the_web_process(self):
+        with self.assertRaises(Exception):
+            self.pool.translate_to_sql(QUERIES[0], 'missing', COLUMN_DATA_DICT)
+
+    def test_cancelled_translations_do_not_stop_the_pool(self):
+        # the translations beyond the threads of the workers are queued, and can still be cancelled
+        futures = [self.pool.submit(query, 'stub', COLUMN_DATA_DICT) for query in QUERIES * 4]
+        assert any([future.cancel() for future in futures])
+
+        # the collector outlives the results of the cancelled translations
+        assert [self.pool.submit(query, 'stub', COLUMN_DATA_DICT).result(timeout=60) for query in QUERIES] == self.expected
+
+
+class TestWorkerPoolAdmissionControl(StubModelTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.original_batching_config = dict(pretrained_loader.batching_config)
+        pretrained_loader.configure_batching(max_queue_depth=4)
+
+        # a single worker thread, so that the next translations queue in the web process
+        pretrained_loader.start_worker_pool(1, threads_per_worker=1, warmup_model_dirs=['stub'])
+        pretrained_loader.worker_pool.wait_until_ready()
+
+    @classmethod
+    def tearDownClass(cls):
+        pretrained_loader.stop_worker_pool()
+        pretrained_loader.batching_config.update(cls.original_batching_config)
+        super().tearDownClass()
+
+    def test_translations_that_cannot_meet_their_deadline_are_shed(self):
+        with self.assertRaises(OverloadedError) as context:
+            pretrained_loader.submit_translation(QUERIES[0], 'stub', COLUMN_DATA_DICT, deadline=time.perf_counter() - 1)
+        assert context.exception.reason == SHED_DEADLINE
+
+    def test_low_priority_translations_are_shed_when_the_queue_is_full(self):
+        futures, shed = [], []
+        for query in QUERIES * 5:
+            try:
+                futures.append(pretrained_loader.submit_translation(query, 'stub', COLUMN_DATA_DICT))
+            except OverloadedError as exception:
+                shed.append(exception.reason)
+
+        # the high priority translations can still use the reserved part of the queue
+        high_priority_future = pretrained_loader.submit_translation(QUERIES[0], 'stub', COLUMN_DATA_DICT, priority=PRIORITY_HIGH)
+
+        assert shed and set(shed) == {SHED_QUEUE_FULL}
+        assert all(future.result(timeout=60) for future in futures)
+        assert high_priority_future.result(timeout=60)
+        assert pretrained_loader.get_worker_pool_stats()['shed'][SHED_QUEUE_FULL] >= len(shed)
+
+    def test_translations_shed_by_a_worker_are_overloaded_errors(self):
+        # the worker queues a single translation, which waits for a batch that never fills, so the other one finds its queue full
+        pool = InferenceWorkerPool(1, self.pretrained_path, {'max_batch_size': 8, 'max_wait_ms': 2000.0, 'max_queue_depth': 1}, threads_per_worker=2,
+                                   warmup_model_dirs=['stub'])
+        try:
+            pool.wait_until_ready()
+            futures = [pool.submit(query, 'stub', COLUMN_DATA_DICT) for query in QUERIES[:2]]
+
+            shed = []
+            for future in futures:
+                try:
+                    future.result(timeout=60)
+                except OverloadedError as exception:
+                    shed.append(exception)
+        finally:
+            pool.close()
+
+        assert len(shed) == 1
+        assert shed[0].reason == SHED_QUEUE_FULL and shed[0].retry_after_seconds >= 0
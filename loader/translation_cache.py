@@ -0,0 +1,56 @@
+import threading
+import time
+
+from lib.lru_cache import LRUCache
+from schema_parser.json_schema_parser import get_table_schema_fingerprint
+
+
+DEFAULT_MAX_ENTRIES = 4096
+
+
+def normalize_query(query):
+    return ' '.join(query.split()).lower()
+
+
+class TranslationCache:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=None, clock=time.monotonic):
+        self.__entries = LRUCache(max_entries, ttl_seconds, clock, on_remove=lambda key, _: self.__forget_model_key(key))
+        self.__model_keys = {}
+        # the model index is kept in step with the entries, so every change to both goes through this lock
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def get_key(pretrained_model_dir, query, column_data_dict):
+        return pretrained_model_dir, normalize_query(query), get_table_schema_fingerprint(column_data_dict)
+
+    def get(self, pretrained_model_dir, query, column_data_dict):
+        with self.__lock:
+            return self.__entries.get(self.get_key(pretrained_model_dir, query, column_data_dict))
+
+    def put(self, pretrained_model_dir, query, column_data_dict, translation):
+        key = self.get_key(pretrained_model_dir, query, column_data_dict)
+
+        with self.__lock:
+            self.__model_keys.setdefault(pretrained_model_dir, set()).add(key)
+            self.__entries.put(key, translation)
+
+    def invalidate_model(self, pretrained_model_dir):
+        with self.__lock:
+            keys = self.__model_keys.pop(pretrained_model_dir, set())
+            for key in keys:
+                self.__entries.invalidate(key)
+            return len(keys)
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.__model_keys.clear()
+
+    def stats(self):
+        return self.__entries.stats()
+
+    def __forget_model_key(self, key):
+        model_keys = self.__model_keys[key[0]]
+        model_keys.discard(key)
+        if not model_keys:
+            del self.__model_keys[key[0]]
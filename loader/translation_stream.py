@@ -0,0 +1,52 @@
+import queue
+import threading
+
+
+class TranslationStream:
+    def __init__(self):
+        # the fragments of a streamed translation, in generation order, followed by None once the translation is done
+        self.__fragments = queue.Queue()
+        self.__cancel_event = threading.Event()
+        self.__cancel_callbacks = []
+        self.__lock = threading.Lock()
+
+    @property
+    def cancel_event(self):
+        return self.__cancel_event
+
+    def put(self, fragment):
+        self.__fragments.put(fragment)
+
+    def cancel(self):
+        with self.__lock:
+            self.__cancel_event.set()
+            callbacks, self.__cancel_callbacks = self.__cancel_callbacks, []
+
+        for callback in callbacks:
+            callback()
+
+    def add_cancel_callback(self, callback):
+        with self.__lock:
+            if not self.__cancel_event.is_set():
+                self.__cancel_callbacks.append(callback)
+                return
+        callback()
+
+    def follow(self, future):
+        # yields the fragments until the translation of the future is done, then raises its error if it failed, stopping early cancels it
+        future.add_done_callback(lambda _: self.__fragments.put(None))
+
+        completed = False
+        try:
+            while True:
+                fragment = self.__fragments.get()
+                if fragment is None:
+                    break
+                yield fragment
+            completed = True
+        finally:
+            if not completed:
+                future.cancel()
+                self.cancel()
+
+        return future.result()
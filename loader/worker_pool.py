@@ -0,0 +1,352 @@
+import itertools
+import math
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+from collections import deque
+from concurrent.futures import Future
+
+from loader.batch_scheduler import (BATCH_SECONDS_SMOOTHING, DEFAULT_HIGH_PRIORITY_RESERVED_FRACTION, PRIORITIES, PRIORITY_HIGH, PRIORITY_LOW, SHED_DEADLINE,
+                                    SHED_EXPIRED, SHED_QUEUE_FULL, OverloadedError, resolve_future)
+from monitoring.serving_metrics import metrics_registry
+
+
+# translations a worker runs concurrently, so that its batch scheduler has requests to group
+DEFAULT_THREADS_PER_WORKER = 8
+
+RESULT_POLL_INTERVAL_SECONDS = 1.0
+
+# messages sent back by the workers, the fragments of a streamed translation come before its result
+MESSAGE_FRAGMENT = 'fragment'
+MESSAGE_RESULT = 'result'
+
+
+def get_available_cores():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def partition_cores(cores, num_workers):
+    if num_workers < 1:
+        raise Exception('At least one inference worker is needed')
+
+    # workers only share cores when there are more workers than cores
+    if num_workers > len(cores):
+        return [[cores[worker % len(cores)]] for worker in range(num_workers)]
+
+    slice_size, remainder = divmod(len(cores), num_workers)
+    partitions, start = [], 0
+    for worker in range(num_workers):
+        end = start + slice_size + (1 if worker < remainder else 0)
+        partitions.append(list(cores[start:end]))
+        start = end
+    return partitions
+
+
+def run_worker(cores, pretrained_models_path, batching_config, threads_per_worker, warmup_model_dirs, task_queue, result_queue, warmup_queue, cancel_queue):
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+
+    # the intra-op threads of the worker match its cores, so that workers do not compete for them
+    import torch
+    torch.set_num_threads(len(cores))
+
+    from loader import pretrained_loader
+    from loader.translation_stream import TranslationStream
+    pretrained_loader.PRETRAINED_MODELS_PATH = pretrained_models_path
+    pretrained_loader.configure_batching(**batching_config)
+
+    warmup_results = {}
+    for pretrained_model_dir in warmup_model_dirs:
+        try:
+            warmup_results[pretrained_model_dir] = pretrained_loader.warm_up_pretrained_model(pretrained_model_dir)
+        except Exception as exception:
+            warmup_results[pretrained_model_dir] = {'error': str(exception)}
+    warmup_queue.put(warmup_results)
+
+    # streamed translations running in this worker, by task id, so that the web process can cancel them
+    streams = {}
+    streams_lock = threading.Lock()
+
+    def translate(task_id, query, pretrained_model_dir, column_data_dict, endpoint, priority, deadline, streamed):
+        pretrained_loader.refresh_pretrained_model_metadata(pretrained_model_dir)
+
+        # the web process looked the translation up in its translation cache already
+        if not streamed:
+            return pretrained_loader.submit_translation(query, pretrained_model_dir, column_data_dict, endpoint, priority, deadline).result()
+
+        stream = TranslationStream()
+        with streams_lock:
+            streams[task_id] = stream
+        try:
+            future = pretrained_loader.submit_translation(query, pretrained_model_dir, column_data_dict, endpoint, priority, deadline, stream)
+            for fragment in stream.follow(future):
+                result_queue.put((MESSAGE_FRAGMENT, task_id, fragment))
+            return future.result()
+        finally:
+            with streams_lock:
+                del streams[task_id]
+
+    def consume_tasks():
+        while True:
+            task = task_queue.get()
+            if task is None:
+                return
+
+            task_id, query, pretrained_model_dir, column_data_dict, endpoint, priority, streamed, deadline_seconds = task
+            # the deadline is sent as the seconds left, since the perf_counter() clocks of two processes are not comparable
+            deadline = time.perf_counter() + deadline_seconds if deadline_seconds is not None else None
+            translation, error = None, None
+            try:
+                translation = translate(task_id, query, pretrained_model_dir, column_data_dict, endpoint, priority, deadline, streamed)
+            except OverloadedError as exception:
+                error = exception
+            except Exception as exception:
+                # other exceptions may not be picklable, only their message is sent
+                error = '{}: {}'.format(type(exception).__name__, exception)
+
+            # the metrics recorded by the worker are served by the /metrics endpoint of the web process
+            result_queue.put((MESSAGE_RESULT, task_id, (translation, error, os.getpid(), metrics_registry.snapshot())))
+
+    def consume_cancellations():
+        # every worker is told about every cancelled stream, only the one running it cancels it
+        while True:
+            task_id = cancel_queue.get()
+            if task_id is None:
+                return
+
+            with streams_lock:
+                stream = streams.get(task_id)
+            if stream is not None:
+                stream.cancel()
+
+    threading.Thread(target=consume_cancellations, daemon=True).start()
+    threads = [threading.Thread(target=consume_tasks, daemon=True) for _ in range(threads_per_worker)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+class InferenceWorkerPool:
+    def __init__(self, num_workers, pretrained_models_path, batching_config, cores=None, threads_per_worker=DEFAULT_THREADS_PER_WORKER, warmup_model_dirs=(),
+                 high_priority_reserved_fraction=DEFAULT_HIGH_PRIORITY_RESERVED_FRACTION):
+        self.__cores = partition_cores(cores if cores is not None else get_available_cores(), num_workers)
+        self.__threads_per_worker = threads_per_worker
+
+        # the workers take as many tasks as they have threads, the other tasks are queued here with the admission control of the batch scheduler
+        self.__capacity = len(self.__cores) * threads_per_worker
+        max_queue_depth = batching_config.get('max_queue_depth')
+        self.__max_queue_depth = max_queue_depth
+        self.__max_low_priority_queue_depth = None if max_queue_depth is None else max(1, int(max_queue_depth * (1 - high_priority_reserved_fraction)))
+        self.__queued = {priority: deque() for priority in PRIORITIES}
+        self.__in_flight = 0
+        self.__task_seconds = None
+        self.__shed_counts = {SHED_QUEUE_FULL: 0, SHED_DEADLINE: 0, SHED_EXPIRED: 0}
+
+        # spawned workers do not inherit the torch thread pools and locks of the web process
+        context = multiprocessing.get_context('spawn')
+        self.__task_queue = context.Queue()
+        self.__result_queue = context.Queue()
+        self.__warmup_queue = context.Queue()
+        self.__cancel_queues = [context.Queue() for _ in self.__cores]
+        self.__warmup_results = None
+        self.__warmup_lock = threading.Lock()
+
+        self.__task_ids = itertools.count()
+        self.__pending = {}
+        self.__lock = threading.Lock()
+        self.__closed = False
+
+        self.__workers = [
+            context.Process(target=run_worker, args=(cores, pretrained_models_path, batching_config, threads_per_worker, list(warmup_model_dirs),
+                                                     self.__task_queue, self.__result_queue, self.__warmup_queue, cancel_queue), daemon=True)
+            for cores, cancel_queue in zip(self.__cores, self.__cancel_queues)
+        ]
+        for worker in self.__workers:
+            worker.start()
+
+        self.__collector = threading.Thread(target=self.__collect_results, daemon=True)
+        self.__collector.start()
+
+    def submit(self, query, pretrained_model_dir, column_data_dict, priority=PRIORITY_LOW, deadline=None, endpoint='', stream=None):
+        # the deadline is a time.perf_counter() timestamp, translations that cannot be done in time are rejected right away, the fragments of a
+        # streamed translation are put into its TranslationStream as the worker generates them
+        future = Future()
+        with self.__lock:
+            if self.__closed:
+                raise Exception('The inference worker pool is closed')
+
+            queue_depth = self.__get_queue_depth()
+            max_queue_depth = self.__max_queue_depth if priority == PRIORITY_HIGH else self.__max_low_priority_queue_depth
+            if max_queue_depth is not None and queue_depth >= max_queue_depth:
+                self.__shed_counts[SHED_QUEUE_FULL] += 1
+                raise OverloadedError('The translation queue is full.', SHED_QUEUE_FULL, self.__estimate_wait_seconds(queue_depth))
+
+            requests_ahead = len(self.__queued[PRIORITY_HIGH]) if priority == PRIORITY_HIGH else queue_depth
+            estimated_wait_seconds = self.__estimate_wait_seconds(requests_ahead + 1)
+            if deadline is not None and time.perf_counter() + estimated_wait_seconds > deadline:
+                self.__shed_counts[SHED_DEADLINE] += 1
+                raise OverloadedError('The translation cannot be done before its deadline.', SHED_DEADLINE, estimated_wait_seconds)
+
+            self.__queued[priority].append(((query, pretrained_model_dir, column_data_dict, endpoint, priority), future, deadline, stream))
+            tasks, expired = self.__take_tasks()
+
+        self.__dispatch(tasks, expired)
+        return future
+
+    def translate_to_sql(self, query, pretrained_model_dir, column_data_dict, priority=PRIORITY_LOW, deadline=None):
+        return self.submit(query, pretrained_model_dir, column_data_dict, priority, deadline).result()
+
+    def wait_until_ready(self):
+        # every worker reports once, after warming up its models and before taking any task
+        with self.__warmup_lock:
+            if self.__warmup_results is None:
+                warmup_results = []
+                while len(warmup_results) < len(self.__workers):
+                    try:
+                        warmup_results.append(self.__warmup_queue.get(timeout=RESULT_POLL_INTERVAL_SECONDS))
+                    except queue.Empty:
+                        if not all(worker.is_alive() for worker in self.__workers):
+                            raise Exception('An inference worker exited unexpectedly')
+                self.__warmup_results = warmup_results
+            return self.__warmup_results
+
+    def stats(self):
+        with self.__lock:
+            pending_tasks = len(self.__pending)
+            queue_depths = {priority: len(queued) for priority, queued in self.__queued.items()}
+            shed_counts = dict(self.__shed_counts)
+            task_seconds = self.__task_seconds
+
+        return {
+            'workers': [{'pid': worker.pid, 'cores': cores, 'alive': worker.is_alive()} for worker, cores in zip(self.__workers, self.__cores)],
+            'threads_per_worker': self.__threads_per_worker,
+            'pending_tasks': pending_tasks,
+            'max_queue_depth': self.__max_queue_depth,
+            'queue_depth': sum(queue_depths.values()),
+            'queue_depths': queue_depths,
+            'shed': shed_counts,
+            'task_seconds': task_seconds,
+        }
+
+    def close(self):
+        with self.__lock:
+            if self.__closed:
+                return
+            self.__closed = True
+            queued = self.__take_queued()
+
+        for _, future, _, _ in queued:
+            resolve_future(future, exception=Exception('The inference worker pool is closed'))
+        for _ in range(len(self.__workers) * self.__threads_per_worker):
+            self.__task_queue.put(None)
+        for cancel_queue in self.__cancel_queues:
+            cancel_queue.put(None)
+        for worker in self.__workers:
+            worker.join()
+        self.__collector.join()
+
+    def __collect_results(self):
+        while True:
+            try:
+                message_type, task_id, message = self.__result_queue.get(timeout=RESULT_POLL_INTERVAL_SECONDS)
+            except queue.Empty:
+                with self.__lock:
+                    if self.__closed and not self.__pending:
+                        return
+                if not self.__closed and not all(worker.is_alive() for worker in self.__workers):
+                    self.__fail_pending_tasks(Exception('An inference worker exited unexpectedly'))
+                    return
+                continue
+
+            if message_type == MESSAGE_FRAGMENT:
+                with self.__lock:
+                    pending = self.__pending.get(task_id)
+                if pending is not None:
+                    pending[2].put(message)
+                continue
+
+            translation, error, worker_pid, metrics_snapshot = message
+            metrics_registry.set_remote_snapshot(worker_pid, metrics_snapshot)
+            with self.__lock:
+                future, dispatch_time, _ = self.__pending.pop(task_id)
+                self.__in_flight -= 1
+
+                task_seconds = time.perf_counter() - dispatch_time
+                if self.__task_seconds is None:
+                    self.__task_seconds = task_seconds
+                else:
+                    self.__task_seconds += BATCH_SECONDS_SMOOTHING * (task_seconds - self.__task_seconds)
+                tasks, expired = self.__take_tasks()
+
+            self.__dispatch(tasks, expired)
+            # the caller may have cancelled the future, which must not stop the collector
+            if error is not None and not isinstance(error, Exception):
+                error = Exception(error)
+            resolve_future(future, translation, error)
+
+    def __fail_pending_tasks(self, exception):
+        with self.__lock:
+            self.__closed = True
+            pending, self.__pending = self.__pending, {}
+            queued = self.__take_queued()
+
+        for future, _, _ in pending.values():
+            resolve_future(future, exception=exception)
+        for _, future, _, _ in queued:
+            resolve_future(future, exception=exception)
+
+    def __cancel_task(self, task_id):
+        for cancel_queue in self.__cancel_queues:
+            cancel_queue.put(task_id)
+
+    def __get_queue_depth(self):
+        return sum(len(queued) for queued in self.__queued.values())
+
+    def __estimate_wait_seconds(self, num_requests):
+        # nothing is known about the translation duration before the first translation
+        if self.__task_seconds is None:
+            return 0.0
+        return math.ceil(num_requests / self.__capacity) * self.__task_seconds
+
+    def __take_queued(self):
+        queued = []
+        for priority in PRIORITIES:
+            queued += self.__queued[priority]
+            self.__queued[priority].clear()
+        return queued
+
+    def __take_tasks(self):
+        # called with the lock held, high priority tasks go to the workers first, cancelled ones are dropped and expired ones rejected
+        tasks, expired = [], []
+        dispatch_time = time.perf_counter()
+        for priority in PRIORITIES:
+            queued = self.__queued[priority]
+            while queued and self.__in_flight < self.__capacity:
+                item, future, deadline, stream = queued.popleft()
+                if not future.set_running_or_notify_cancel():
+                    continue
+                if deadline is not None and deadline < dispatch_time:
+                    expired.append(future)
+                    continue
+
+                task_id = next(self.__task_ids)
+                self.__pending[task_id] = (future, dispatch_time, stream)
+                self.__in_flight += 1
+                tasks.append(((task_id,) + item + (stream is not None, deadline - dispatch_time if deadline is not None else None), stream))
+
+        self.__shed_counts[SHED_EXPIRED] += len(expired)
+        return tasks, expired
+
+    def __dispatch(self, tasks, expired):
+        for task, stream in tasks:
+            self.__task_queue.put(task)
+            if stream is not None:
+                stream.add_cancel_callback(lambda task_id=task[0]: self.__cancel_task(task_id))
+        for future in expired:
+            resolve_future(future, exception=OverloadedError('The translation deadline passed while it was queued.', SHED_EXPIRED, self.__task_seconds or 0.0))
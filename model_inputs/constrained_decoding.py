@@ -0,0 +1,186 @@
+import threading
+import weakref
+
+from transformers import LogitsProcessor
+
+from formatter.wikisql_formatter import AGGREGATORS, COND_OPS
+
+
+SEGMENT_SELECT = 'select'
+SEGMENT_AGG_OR_COLUMN = 'agg_or_column'
+SEGMENT_COLUMN = 'column'
+SEGMENT_FROM = 'from'
+SEGMENT_WHERE = 'where'
+SEGMENT_CONDITION_COLUMN = 'condition_column'
+SEGMENT_OPERATOR = 'operator'
+SEGMENT_AND = 'and'
+
+HYPOTHESIS_TRIE = 'trie'
+HYPOTHESIS_VALUE = 'value'
+
+# markers of the tokens that start a new word, for sentencepiece (T5) and byte-level BPE (CodeT5) vocabularies
+WORD_START_MARKERS = ('▁', 'Ġ')
+
+
+class TrieNode:
+    def __init__(self):
+        self.children = {}
+        self.next_segments = []
+
+
+class WikiSQLGrammar:
+    # SELECT [AGG] col FROM table [WHERE col op val (AND col op val)*], tokenized with the tokenizer of the model
+    def __init__(self, tokenizer, column_names, word_start_token_ids=None):
+        self.__eos_token_id = tokenizer.eos_token_id
+        self.__word_start_token_ids = word_start_token_ids if word_start_token_ids is not None else get_word_start_token_ids(tokenizer)
+        self.__tries = {}
+
+        # every segment is a set of (text, next segment) options, the texts after the first one starting with a space
+        columns = [' ' + column for column in column_names]
+        self.__add_segment(tokenizer, SEGMENT_SELECT, [('SELECT', SEGMENT_AGG_OR_COLUMN)])
+        self.__add_segment(tokenizer, SEGMENT_AGG_OR_COLUMN, [(' ' + aggregator, SEGMENT_COLUMN) for aggregator in AGGREGATORS] +
+                           [(column, SEGMENT_FROM) for column in columns])
+        self.__add_segment(tokenizer, SEGMENT_COLUMN, [(column, SEGMENT_FROM) for column in columns])
+        self.__add_segment(tokenizer, SEGMENT_FROM, [(' FROM table', SEGMENT_WHERE)])
+        self.__add_segment(tokenizer, SEGMENT_WHERE, [(' WHERE', SEGMENT_CONDITION_COLUMN)])
+        self.__add_segment(tokenizer, SEGMENT_CONDITION_COLUMN, [(column, SEGMENT_OPERATOR) for column in columns])
+        self.__add_segment(tokenizer, SEGMENT_OPERATOR, [(' ' + operator, HYPOTHESIS_VALUE) for operator in COND_OPS])
+        self.__add_segment(tokenizer, SEGMENT_AND, [(' AND', SEGMENT_CONDITION_COLUMN)])
+
+        self.__initial_state = self.__close([(HYPOTHESIS_TRIE, SEGMENT_SELECT, self.__tries[SEGMENT_SELECT])])
+
+    @property
+    def initial_state(self):
+        return self.__initial_state
+
+    def advance(self, state, token_id):
+        hypotheses = []
+        for hypothesis in state:
+            if hypothesis[0] == HYPOTHESIS_TRIE:
+                child = hypothesis[2].children.get(token_id)
+                if child is not None:
+                    hypotheses.append((HYPOTHESIS_TRIE, hypothesis[1], child))
+            elif token_id != self.__eos_token_id:
+                # a condition value is free text, which may end with the first token of a following ' AND'
+                hypotheses.append((HYPOTHESIS_VALUE, hypothesis[1] + 1))
+                child = self.__tries[SEGMENT_AND].children.get(token_id)
+                if child is not None:
+                    hypotheses.append((HYPOTHESIS_TRIE, SEGMENT_AND, child))
+
+        return self.__close(hypotheses)
+
+    def allowed_token_ids(self, state):
+        # None means that any token, except possibly EOS, is allowed
+        allowed_token_ids = set()
+        for hypothesis in state:
+            if hypothesis[0] == HYPOTHESIS_TRIE:
+                allowed_token_ids.update(hypothesis[2].children.keys())
+            elif hypothesis[1] > 0 or not self.__word_start_token_ids:
+                return None
+            else:
+                # the value is separated from the operator by a space, as the formatter expects
+                allowed_token_ids.update(self.__word_start_token_ids)
+        return allowed_token_ids
+
+    def allows_eos(self, state):
+        for hypothesis in state:
+            if hypothesis[0] == HYPOTHESIS_VALUE and hypothesis[1] > 0:
+                return True
+            if hypothesis[0] == HYPOTHESIS_TRIE and hypothesis[1] == SEGMENT_WHERE and hypothesis[2] is self.__tries[SEGMENT_WHERE]:
+                return True
+        return False
+
+    def __add_segment(self, tokenizer, segment, options):
+        root = self.__tries.setdefault(segment, TrieNode())
+        for text, next_segment in options:
+            node = root
+            for token_id in tokenizer(text, add_special_tokens=False).input_ids:
+                node = node.children.setdefault(token_id, TrieNode())
+            node.next_segments.append(next_segment)
+
+    def __close(self, hypotheses):
+        # a completed option also starts its following segment
+        closed = []
+        pending = list(hypotheses)
+        while pending:
+            hypothesis = pending.pop()
+            if hypothesis in closed:
+                continue
+            closed.append(hypothesis)
+
+            if hypothesis[0] == HYPOTHESIS_TRIE:
+                for next_segment in hypothesis[2].next_segments:
+                    if next_segment == HYPOTHESIS_VALUE:
+                        pending.append((HYPOTHESIS_VALUE, 0))
+                    else:
+                        pending.append((HYPOTHESIS_TRIE, next_segment, self.__tries[next_segment]))
+
+        return tuple(closed)
+
+
+grammars_cache = weakref.WeakKeyDictionary()
+grammars_cache_lock = threading.Lock()
+
+
+def get_word_start_token_ids(tokenizer):
+    tokens = tokenizer.convert_ids_to_tokens(list(range(len(tokenizer))))
+    return frozenset(token_id for token_id, token in enumerate(tokens) if token and token.startswith(WORD_START_MARKERS))
+
+
+def get_wikisql_grammar(tokenizer, column_names):
+    with grammars_cache_lock:
+        tokenizer_cache = grammars_cache.setdefault(tokenizer, {'word_start_token_ids': get_word_start_token_ids(tokenizer), 'grammars': {}})
+        key = tuple(column_names)
+        if key not in tokenizer_cache['grammars']:
+            tokenizer_cache['grammars'][key] = WikiSQLGrammar(tokenizer, column_names, tokenizer_cache['word_start_token_ids'])
+        return tokenizer_cache['grammars'][key]
+
+
+class WikiSQLGrammarLogitsProcessor(LogitsProcessor):
+    def __init__(self, grammars, eos_token_id, num_beams=1):
+        self.__grammars = grammars
+        self.__eos_token_id = eos_token_id
+        self.__num_beams = num_beams
+
+        # grammar states by generated prefix, so that every step only advances the automaton by one token
+        self.__states = {}
+
+    def __call__(self, input_ids, scores):
+        for row, row_input_ids in enumerate(input_ids.tolist()):
+            grammar = self.__grammars[row // self.__num_beams]
+
+            # the first token is the decoder start token
+            generated_ids = row_input_ids[1:]
+            if self.__eos_token_id in generated_ids:
+                continue
+
+            state = self.__get_state(grammar, generated_ids)
+            allowed_token_ids = grammar.allowed_token_ids(state)
+
+            # an empty state can only come from a prefix the grammar never allowed, such a row is ended right away
+            if not state:
+                allowed_token_ids = set()
+
+            if allowed_token_ids is None:
+                if not grammar.allows_eos(state):
+                    scores[row, self.__eos_token_id] = -float('inf')
+                continue
+
+            if not state or grammar.allows_eos(state):
+                allowed_token_ids.add(self.__eos_token_id)
+
+            allowed_token_ids = list(allowed_token_ids)
+            allowed_scores = scores[row, allowed_token_ids]
+            scores[row, :] = -float('inf')
+            scores[row, allowed_token_ids] = allowed_scores
+
+        return scores
+
+    def __get_state(self, grammar, generated_ids):
+        key = (id(grammar), tuple(generated_ids))
+        if key not in self.__states:
+            if generated_ids:
+                self.__states[key] = grammar.advance(self.__get_state(grammar, generated_ids[:-1]), generated_ids[-1])
+            else:
+                self.__states[key] = grammar.initial_state
+        return self.__states[key]
@@ -1,10 +1,24 @@
+import time
+
 from abc import ABCMeta, abstractmethod
 
+from model_inputs.prompt_segment_cache import PromptSegmentCache
+
+
+prompt_segment_cache = PromptSegmentCache()
+
 
 class PretrainedModel(metaclass=ABCMeta):
+    PROMPT_PREFIX = 'translate to SQL the following natural language query:'
+
+    @staticmethod
+    @abstractmethod
+    def format_question_segment(query):
+        pass
+
     @classmethod
     @abstractmethod
-    def format_natural_language_query(cls, query, column_data_dict):
+    def format_schema_segment(cls, column_data_dict):
         pass
 
     @staticmethod
@@ -13,23 +27,95 @@ class PretrainedModel(metaclass=ABCMeta):
         pass
 
     @classmethod
-    def translate_to_sql(cls, model, tokenizer, query, column_data_dict, device='cpu'):
-        inputs = tokenizer(cls.format_natural_language_query(query, column_data_dict), padding='longest', max_length=64, return_tensors='pt')
-        input_ids = inputs.input_ids.to(device)
-        attention_mask = inputs.attention_mask.to(device)
-        output = model.generate(input_ids, attention_mask=attention_mask, max_length=64)
+    def format_natural_language_query(cls, query, column_data_dict):
+        return cls.PROMPT_PREFIX + cls.format_question_segment(query) + cls.format_schema_segment(column_data_dict)
+
+    @classmethod
+    def get_input_ids(cls, tokenizer, query, column_data_dict, stage_timings=None):
+        # same ids as tokenizing format_natural_language_query(), but only the question is tokenized for every request
+        return prompt_segment_cache.get_input_ids(cls, tokenizer, query, column_data_dict, stage_timings)
+
+    @staticmethod
+    def get_constrained_logits_processor(model, tokenizer, column_data_dicts):
+        from transformers import LogitsProcessorList
+        from model_inputs.constrained_decoding import WikiSQLGrammarLogitsProcessor, get_wikisql_grammar
+
+        # the generated queries follow the WikiSQL grammar, with the columns of each query's own table
+        grammars = [get_wikisql_grammar(tokenizer, column_data_dict['column_names']) for column_data_dict in column_data_dicts]
+        return LogitsProcessorList([WikiSQLGrammarLogitsProcessor(grammars, tokenizer.eos_token_id, model.generation_config.num_beams)])
+
+    @classmethod
+    def translate_to_sql(cls, model, tokenizer, query, column_data_dict, device='cpu', constrained=False, speculative=False):
+        return cls.translate_to_sql_batch(model, tokenizer, [query], [column_data_dict], device, constrained=constrained, speculative=speculative)[0]
 
-        return tokenizer.decode(output[0], skip_special_tokens=True)
+    @classmethod
+    def translate_to_sql_stream(cls, model, tokenizer, query, column_data_dict, device='cpu', constrained=False, cancel_event=None):
+        from model_inputs.streaming import stream_generation
+
+        inputs = tokenizer.pad({'input_ids': [cls.get_input_ids(tokenizer, query, column_data_dict)]}, padding='longest', return_tensors='pt')
+        logits_processor = cls.get_constrained_logits_processor(model, tokenizer, [column_data_dict]) if constrained else None
+        return stream_generation(model, tokenizer, inputs.input_ids.to(device), inputs.attention_mask.to(device), cancel_event, max_length=64, logits_processor=logits_processor)
+
+    @classmethod
+    def translate_to_sql_batch(cls, model, tokenizer, queries, column_data_dicts, device='cpu', batch_size=16, constrained=False, speculative=False,
+                               stage_timings=None):
+        if speculative:
+            # speculative decoding accepts a different number of drafted tokens for every query, so queries are translated one at a time
+            from model_inputs.speculative_decoding import prompt_lookup_generate
+            batch_size = 1
+
+        # seconds spent in each stage are added to stage_timings
+        stage_timings = stage_timings if stage_timings is not None else {}
+        for stage in ['prompt_formatting', 'tokenization', 'generate', 'decoding']:
+            stage_timings.setdefault(stage, 0.0)
+
+        start_time = time.perf_counter()
+        prompt_formatting_seconds = stage_timings['prompt_formatting']
+        input_ids = [cls.get_input_ids(tokenizer, query, column_data_dict, stage_timings) for query, column_data_dict in zip(queries, column_data_dicts)]
+        prompt_formatting_seconds = stage_timings['prompt_formatting'] - prompt_formatting_seconds
+        stage_timings['tokenization'] += time.perf_counter() - start_time - prompt_formatting_seconds
+
+        # inputs of similar lengths are batched together, so that little padding is needed
+        order = sorted(range(len(input_ids)), key=lambda index: len(input_ids[index]))
+        translations = [None] * len(input_ids)
+
+        for start in range(0, len(order), batch_size):
+            batch_indices = order[start:start + batch_size]
+
+            start_time = time.perf_counter()
+            inputs = tokenizer.pad({'input_ids': [input_ids[index] for index in batch_indices]}, padding='longest', return_tensors='pt')
+            stage_timings['tokenization'] += time.perf_counter() - start_time
+
+            start_time = time.perf_counter()
+            logits_processor = cls.get_constrained_logits_processor(model, tokenizer, [column_data_dicts[index] for index in batch_indices]) if constrained else None
+            if speculative:
+                output = prompt_lookup_generate(model, inputs.input_ids.to(device), inputs.attention_mask.to(device), max_length=64, logits_processor=logits_processor)
+            else:
+                output = model.generate(inputs.input_ids.to(device), attention_mask=inputs.attention_mask.to(device), max_length=64, logits_processor=logits_processor)
+            stage_timings['generate'] += time.perf_counter() - start_time
+
+            start_time = time.perf_counter()
+            for index, translation in zip(batch_indices, tokenizer.batch_decode(output, skip_special_tokens=True)):
+                translations[index] = translation
+            stage_timings['decoding'] += time.perf_counter() - start_time
+
+        return translations
 
 
 class PretrainedModel1(PretrainedModel):
+    PROMPT_PREFIX = 'translate to SQL:'
+
     @staticmethod
     def get_table_str(column_data_dict):
         pass
 
+    @staticmethod
+    def format_question_segment(query):
+        return ' {}'.format(query)
+
     @classmethod
-    def format_natural_language_query(cls, query, column_data_dict):
-        return 'translate to SQL: {}'.format(query)
+    def format_schema_segment(cls, column_data_dict):
+        return ''
 
 
 class PretrainedModel5(PretrainedModel):
@@ -39,9 +125,13 @@ class PretrainedModel5(PretrainedModel):
         table_str = "Table(" + ", ".join([f"\'{h}\'" for h in header]) + ")"
         return table_str
 
+    @staticmethod
+    def format_question_segment(query):
+        return ' \'{}\','.format(query)
+
     @classmethod
-    def format_natural_language_query(cls, query, column_data_dict):
-        return 'translate to SQL the following natural language query: \'{}\', where the table is \'{}\''.format(query, cls.get_table_str(column_data_dict))
+    def format_schema_segment(cls, column_data_dict):
+        return ' where the table is \'{}\''.format(cls.get_table_str(column_data_dict))
 
 
 class SQLT5Baseline(PretrainedModel):
@@ -49,9 +139,13 @@ class SQLT5Baseline(PretrainedModel):
     def get_table_str(column_data_dict):
         pass
 
+    @staticmethod
+    def format_question_segment(query):
+        return ' \'{}\''.format(query)
+
     @classmethod
-    def format_natural_language_query(cls, query, column_data_dict):
-        return 'translate to SQL the following natural language query: \'{}\''.format(query)
+    def format_schema_segment(cls, column_data_dict):
+        return ''
 
 
 class SQLCodeT5Baseline(PretrainedModel):
@@ -59,9 +153,13 @@ class SQLCodeT5Baseline(PretrainedModel):
     def get_table_str(column_data_dict):
         pass
 
+    @staticmethod
+    def format_question_segment(query):
+        return ' \'{}\''.format(query)
+
     @classmethod
-    def format_natural_language_query(cls, query, column_data_dict):
-        return 'translate to SQL the following natural language query: \'{}\''.format(query)
+    def format_schema_segment(cls, column_data_dict):
+        return ''
 
 
 class SQLT5ColNameAware(PretrainedModel):
@@ -71,9 +169,13 @@ class SQLT5ColNameAware(PretrainedModel):
         table_str = "Table(" + ", ".join([f"\'{h}\'" for h in header]) + ")"
         return table_str
 
+    @staticmethod
+    def format_question_segment(query):
+        return ' \'{}\','.format(query)
+
     @classmethod
-    def format_natural_language_query(cls, query, column_data_dict):
-        return 'translate to SQL the following natural language query: \'{}\', where the table is \'{}\''.format(query, cls.get_table_str(column_data_dict))
+    def format_schema_segment(cls, column_data_dict):
+        return ' where the table is \'{}\''.format(cls.get_table_str(column_data_dict))
 
 
 class SQLCodeT5ColNameAware(PretrainedModel):
@@ -83,9 +185,13 @@ class SQLCodeT5ColNameAware(PretrainedModel):
         table_str = "Table(" + ", ".join([f"\'{h}\'" for h in header]) + ")"
         return table_str
 
+    @staticmethod
+    def format_question_segment(query):
+        return ' \'{}\','.format(query)
+
     @classmethod
-    def format_natural_language_query(cls, query, column_data_dict):
-        return 'translate to SQL the following natural language query: \'{}\', where the table is \'{}\''.format(query, cls.get_table_str(column_data_dict))
+    def format_schema_segment(cls, column_data_dict):
+        return ' where the table is \'{}\''.format(cls.get_table_str(column_data_dict))
 
 
 class SQLT5ColNameTypeAware(PretrainedModel):
@@ -97,9 +203,13 @@ class SQLT5ColNameTypeAware(PretrainedModel):
         table_str = "Table(" + ", ".join([f"{h}: {t}" for h, t in zip(header, data_types)]) + ")"
         return table_str
 
+    @staticmethod
+    def format_question_segment(query):
+        return ' \'{}\','.format(query)
+
     @classmethod
-    def format_natural_language_query(cls, query, column_data_dict):
-        return 'translate to SQL the following natural language query: \'{}\', where the table is \'{}\''.format(query, cls.get_table_str(column_data_dict))
+    def format_schema_segment(cls, column_data_dict):
+        return ' where the table is \'{}\''.format(cls.get_table_str(column_data_dict))
 
 
 class SQLCodeT5ColNameTypeAware(PretrainedModel):
@@ -111,6 +221,10 @@ class SQLCodeT5ColNameTypeAware(PretrainedModel):
         table_str = "Table(" + ", ".join([f"{h}: {t}" for h, t in zip(header, data_types)]) + ")"
         return table_str
 
+    @staticmethod
+    def format_question_segment(query):
+        return ' \'{}\','.format(query)
+
     @classmethod
-    def format_natural_language_query(cls, query, column_data_dict):
-        return 'translate to SQL the following natural language query: \'{}\', where the table is \'{}\''.format(query, cls.get_table_str(column_data_dict))
+    def format_schema_segment(cls, column_data_dict):
+        return ' where the table is \'{}\''.format(cls.get_table_str(column_data_dict))
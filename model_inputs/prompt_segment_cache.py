@@ -0,0 +1,81 @@
+import threading
+import time
+import weakref
+
+from lib.lru_cache import LRUCache
+from schema_parser.json_schema_parser import get_table_schema_fingerprint
+
+
+DEFAULT_MAX_SCHEMAS = 1024
+
+
+class PromptSegmentCache:
+    def __init__(self, max_schemas=DEFAULT_MAX_SCHEMAS):
+        self.__max_schemas = max_schemas
+        self.__tokenizer_caches = weakref.WeakKeyDictionary()
+        self.__lock = threading.Lock()
+
+    def get_input_ids(self, model_class, tokenizer, query, column_data_dict, stage_timings=None):
+        # the seconds spent formatting the segments are added to stage_timings['prompt_formatting']
+        stage_timings = stage_timings if stage_timings is not None else {}
+        stage_timings.setdefault('prompt_formatting', 0.0)
+        tokenizer_cache = self.__get_tokenizer_cache(tokenizer)
+
+        # the prompt is split right before whitespace, where the tokenizers pre-tokenize, so the segments can be tokenized on their own
+        prefix_ids = self.__get_prefix_ids(tokenizer_cache, model_class, tokenizer)
+        schema_ids = self.__get_schema_ids(tokenizer_cache, model_class, tokenizer, column_data_dict, stage_timings)
+
+        start_time = time.perf_counter()
+        question_segment = model_class.format_question_segment(query)
+        stage_timings['prompt_formatting'] += time.perf_counter() - start_time
+        question_ids = self.__tokenize(tokenizer, question_segment)
+
+        leading_special_ids, trailing_special_ids = self.__get_special_ids(tokenizer_cache, tokenizer)
+        return leading_special_ids + prefix_ids + question_ids + schema_ids + trailing_special_ids
+
+    def __get_tokenizer_cache(self, tokenizer):
+        with self.__lock:
+            if tokenizer not in self.__tokenizer_caches:
+                self.__tokenizer_caches[tokenizer] = {'special_ids': None, 'prefixes': {}, 'schemas': LRUCache(self.__max_schemas)}
+            return self.__tokenizer_caches[tokenizer]
+
+    def __get_prefix_ids(self, tokenizer_cache, model_class, tokenizer):
+        prefixes = tokenizer_cache['prefixes']
+        if model_class not in prefixes:
+            prefixes[model_class] = self.__tokenize(tokenizer, model_class.PROMPT_PREFIX)
+        return prefixes[model_class]
+
+    def __get_schema_ids(self, tokenizer_cache, model_class, tokenizer, column_data_dict, stage_timings):
+        schemas = tokenizer_cache['schemas']
+        key = model_class, get_table_schema_fingerprint(column_data_dict)
+
+        schema_ids = schemas.get(key)
+        if schema_ids is None:
+            start_time = time.perf_counter()
+            schema_segment = model_class.format_schema_segment(column_data_dict)
+            stage_timings['prompt_formatting'] += time.perf_counter() - start_time
+
+            schema_ids = self.__tokenize(tokenizer, schema_segment)
+            schemas.put(key, schema_ids)
+        return schema_ids
+
+    def __get_special_ids(self, tokenizer_cache, tokenizer):
+        if tokenizer_cache['special_ids'] is None:
+            # the special tokens added around a text (e.g. '</s>' for T5, '<s>' and '</s>' for CodeT5) are found by comparing both encodings of a probe text
+            probe_ids = self.__tokenize(tokenizer, 'translate')
+            probe_ids_with_special_tokens = tokenizer('translate').input_ids
+
+            for start in range(len(probe_ids_with_special_tokens) - len(probe_ids) + 1):
+                if probe_ids_with_special_tokens[start:start + len(probe_ids)] == probe_ids:
+                    tokenizer_cache['special_ids'] = (probe_ids_with_special_tokens[:start], probe_ids_with_special_tokens[start + len(probe_ids):])
+                    break
+            else:
+                raise Exception('Could not find the special tokens added by the tokenizer.')
+
+        return tokenizer_cache['special_ids']
+
+    @staticmethod
+    def __tokenize(tokenizer, text):
+        if not text:
+            return []
+        return tokenizer(text, add_special_tokens=False).input_ids
@@ -0,0 +1,112 @@
+import torch
+
+
+# longest suffix of the generated tokens looked up in the input, and most tokens drafted after a match
+DEFAULT_MAX_NGRAM_SIZE = 3
+DEFAULT_NUM_DRAFT_TOKENS = 10
+
+# generation config settings that model.generate turns into logits processors or sampling, with their values when unset
+GENERATION_CONFIG_PROCESSOR_DEFAULTS = {
+    'do_sample': False,
+    'forced_bos_token_id': None,
+    'forced_eos_token_id': None,
+    'forced_decoder_ids': None,
+    'bad_words_ids': None,
+    'suppress_tokens': None,
+    'begin_suppress_tokens': None,
+    'sequence_bias': None,
+    'no_repeat_ngram_size': 0,
+    'encoder_no_repeat_ngram_size': 0,
+    'repetition_penalty': 1.0,
+    'encoder_repetition_penalty': 1.0,
+    'min_length': 0,
+    'min_new_tokens': None,
+    'exponential_decay_length_penalty': None,
+}
+
+
+def find_draft(source_ids, generated_ids, max_ngram_size=DEFAULT_MAX_NGRAM_SIZE, num_draft_tokens=DEFAULT_NUM_DRAFT_TOKENS):
+    # the tokens following the latest occurrence in the input of the longest matching suffix of the generated tokens
+    for ngram_size in range(min(max_ngram_size, len(generated_ids)), 0, -1):
+        suffix = generated_ids[-ngram_size:]
+        for start in range(len(source_ids) - ngram_size - 1, -1, -1):
+            if source_ids[start:start + ngram_size] == suffix:
+                return source_ids[start + ngram_size:start + ngram_size + num_draft_tokens]
+    return []
+
+
+def get_generation_config_processors(generation_config):
+    # the settings of the generation config that change the next token chosen by model.generate
+    return [name for name, default in GENERATION_CONFIG_PROCESSOR_DEFAULTS.items() if getattr(generation_config, name, default) not in (default, None, [])]
+
+
+def crop_cache(past_key_values, length):
+    if hasattr(past_key_values, 'crop'):
+        past_key_values.crop(length)
+        return past_key_values
+
+    # legacy caches hold (self key, self value, cross key, cross value) per layer, only the self attention grows
+    return tuple((layer[0][:, :, :length], layer[1][:, :, :length]) + tuple(layer[2:]) for layer in past_key_values)
+
+
+@torch.no_grad()
+def prompt_lookup_generate_row(model, input_ids, attention_mask, max_length, logits_processor, max_ngram_size, num_draft_tokens, stats):
+    config = model.config
+    source_ids = input_ids[0][attention_mask[0].bool()].tolist()
+    encoder_outputs = model.get_encoder()(input_ids=input_ids, attention_mask=attention_mask, return_dict=True)
+
+    decoder_ids = [config.decoder_start_token_id]
+    past_key_values = None
+    cached_length = 0
+
+    while len(decoder_ids) < max_length and decoder_ids[-1] != config.eos_token_id:
+        draft = find_draft(source_ids, decoder_ids[1:], max_ngram_size, num_draft_tokens)[:max_length - len(decoder_ids) - 1]
+        fed_ids = decoder_ids[cached_length:] + draft
+
+        # a single decoder pass scores the next token after every drafted one
+        outputs = model(encoder_outputs=encoder_outputs, attention_mask=attention_mask, decoder_input_ids=torch.tensor([fed_ids], device=input_ids.device),
+                        past_key_values=past_key_values, use_cache=True, return_dict=True)
+        logits = outputs.logits[0, len(fed_ids) - len(draft) - 1:]
+
+        accepted_ids = []
+        for position in range(len(draft) + 1):
+            scores = logits[position:position + 1]
+            if logits_processor:
+                scores = logits_processor(torch.tensor([decoder_ids + accepted_ids], device=input_ids.device), scores)
+            accepted_ids.append(int(scores.argmax(dim=-1)[0]))
+
+            if accepted_ids[-1] == config.eos_token_id or position == len(draft) or accepted_ids[-1] != draft[position]:
+                break
+
+        stats['steps'] += 1
+        stats['drafted_tokens'] += len(draft)
+        stats['accepted_tokens'] += len(accepted_ids) - 1
+        stats['generated_tokens'] += len(accepted_ids)
+
+        # the cache stays valid for every token up to the last accepted one, which is fed at the next step
+        decoder_ids += accepted_ids
+        cached_length = len(decoder_ids) - 1
+        past_key_values = crop_cache(outputs.past_key_values, cached_length)
+
+    return decoder_ids
+
+
+def prompt_lookup_generate(model, input_ids, attention_mask, max_length=64, logits_processor=None, max_ngram_size=DEFAULT_MAX_NGRAM_SIZE,
+                           num_draft_tokens=DEFAULT_NUM_DRAFT_TOKENS, stats=None):
+    # drafts are only checked against the greedy choice, with the given logits processors only, so other models and backends, and generation
+    # configs that add logits processors of their own, generate as usual
+    if model.generation_config.num_beams > 1 or not hasattr(model, 'get_encoder') or get_generation_config_processors(model.generation_config):
+        return model.generate(input_ids, attention_mask=attention_mask, max_length=max_length, logits_processor=logits_processor)
+
+    if logits_processor and input_ids.shape[0] > 1:
+        raise Exception('Logits processors are built for a batch, speculative decoding translates one query at a time')
+
+    stats = stats if stats is not None else {}
+    for key in ['steps', 'drafted_tokens', 'accepted_tokens', 'generated_tokens']:
+        stats.setdefault(key, 0)
+
+    outputs = [prompt_lookup_generate_row(model, input_ids[row:row + 1], attention_mask[row:row + 1], max_length, logits_processor, max_ngram_size,
+                                          num_draft_tokens, stats) for row in range(input_ids.shape[0])]
+
+    output_length = max(len(output) for output in outputs)
+    return torch.tensor([output + [model.config.pad_token_id] * (output_length - len(output)) for output in outputs], device=input_ids.device)
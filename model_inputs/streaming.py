@@ -0,0 +1,52 @@
+import threading
+
+import torch
+
+from transformers import StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+
+
+class CancellationStoppingCriteria(StoppingCriteria):
+    def __init__(self, cancel_event):
+        self.__cancel_event = cancel_event
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full((input_ids.shape[0],), self.__cancel_event.is_set(), dtype=torch.bool)
+
+
+def stream_generation(model, tokenizer, input_ids, attention_mask, cancel_event=None, **generate_kwargs):
+    cancel_event = cancel_event or threading.Event()
+
+    # streamers only follow a single hypothesis, beam search models yield their translation at once
+    if model.generation_config.num_beams > 1:
+        output = model.generate(input_ids, attention_mask=attention_mask, **generate_kwargs)
+        yield tokenizer.batch_decode(output, skip_special_tokens=True)[0]
+        return
+
+    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+    errors = []
+
+    def generate():
+        try:
+            model.generate(input_ids, attention_mask=attention_mask, streamer=streamer,
+                           stopping_criteria=StoppingCriteriaList([CancellationStoppingCriteria(cancel_event)]), **generate_kwargs)
+        except Exception as exception:
+            errors.append(exception)
+            streamer.end()
+
+    thread = threading.Thread(target=generate, daemon=True)
+    thread.start()
+
+    completed = False
+    try:
+        for fragment in streamer:
+            if fragment:
+                yield fragment
+        completed = True
+    finally:
+        # the consumer stopping early, e.g. a disconnected client, cancels the generation at its next step
+        if not completed:
+            cancel_event.set()
+        thread.join()
+
+    if errors:
+        raise errors[0]
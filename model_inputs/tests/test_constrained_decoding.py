@@ -0,0 +1,76 @@
+import unittest
+
+from formatter.wikisql_formatter import WikiSQLFormatter
+from loader.stub_model import create_stub_model, create_stub_tokenizer
+from model_inputs.constrained_decoding import WikiSQLGrammar
+from model_inputs.model_inputs import SQLT5ColNameTypeAware, SQLCodeT5ColNameAware
+
+
+COLUMN_DATA_DICT = {
+    'table_name': 'table_swe_employees',
+    'column_names': ['ID', 'Last name', 'First name', 'Age', 'Age group', 'Company', 'Salary'],
+    'column_types': ['int', 'text', 'text', 'int', 'text', 'text', 'real']
+}
+
+VALID_QUERIES = [
+    'SELECT Company FROM table',
+    'SELECT COUNT Last name FROM table WHERE Age > 30',
+    'SELECT Age group FROM table WHERE Age = 30 AND Company = Black Mesa AND Salary < 1000.5',
+    'SELECT MAX Salary FROM table WHERE Company = AND ANDERSON',
+]
+
+INVALID_QUERIES = [
+    'SELECT Country FROM table',
+    'SELECT Company FROM employees',
+    'SELECT COUNT FROM table',
+    'SELECT Company FROM table WHERE Age >= 30',
+    'SELECT Company FROM table WHERE',
+]
+
+
+class TestWikiSQLGrammar(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tokenizers = [create_stub_tokenizer('t5'), create_stub_tokenizer('code-t5')]
+
+    def is_accepted(self, grammar, tokenizer, query):
+        state = grammar.initial_state
+        for token_id in tokenizer(query, add_special_tokens=False).input_ids:
+            allowed_token_ids = grammar.allowed_token_ids(state)
+            if allowed_token_ids is not None and token_id not in allowed_token_ids:
+                return False
+            state = grammar.advance(state, token_id)
+        return grammar.allows_eos(state)
+
+    def test_valid_queries_are_accepted(self):
+        for tokenizer in self.tokenizers:
+            grammar = WikiSQLGrammar(tokenizer, COLUMN_DATA_DICT['column_names'])
+            for query in VALID_QUERIES:
+                assert self.is_accepted(grammar, tokenizer, query), query
+
+    def test_invalid_queries_are_rejected(self):
+        for tokenizer in self.tokenizers:
+            grammar = WikiSQLGrammar(tokenizer, COLUMN_DATA_DICT['column_names'])
+            for query in INVALID_QUERIES:
+                assert not self.is_accepted(grammar, tokenizer, query), query
+
+    def test_generation_starts_with_select(self):
+        tokenizer = self.tokenizers[0]
+        grammar = WikiSQLGrammar(tokenizer, COLUMN_DATA_DICT['column_names'])
+
+        assert grammar.allowed_token_ids(grammar.initial_state) == {tokenizer('SELECT', add_special_tokens=False).input_ids[0]}
+        assert not grammar.allows_eos(grammar.initial_state)
+
+
+class TestConstrainedTranslation(unittest.TestCase):
+    def test_constrained_translations_can_be_encoded(self):
+        queries = ['How many employees are older than 30?', 'What is the salary of Smith?', 'Who works at Black Mesa?']
+
+        for model_class, base_model in [(SQLT5ColNameTypeAware, 't5'), (SQLCodeT5ColNameAware, 'code-t5')]:
+            tokenizer = create_stub_tokenizer(base_model)
+            model = create_stub_model(tokenizer)
+
+            translations = model_class.translate_to_sql_batch(model, tokenizer, queries, [COLUMN_DATA_DICT] * len(queries), constrained=True)
+            for translation in translations:
+                assert translation.startswith('SELECT ')
+                WikiSQLFormatter.sql_get_select_and_agg_index(translation, COLUMN_DATA_DICT['column_names'])
@@ -0,0 +1,79 @@
+import unittest
+
+from loader.stub_model import create_stub_model, create_stub_tokenizer
+from model_inputs.model_inputs import SQLT5Baseline, SQLCodeT5Baseline, SQLT5ColNameAware, SQLCodeT5ColNameAware, SQLT5ColNameTypeAware, \
+    SQLCodeT5ColNameTypeAware
+
+
+INPUT_FORMAT_CLASSES = [SQLT5Baseline, SQLCodeT5Baseline, SQLT5ColNameAware, SQLCodeT5ColNameAware, SQLT5ColNameTypeAware, SQLCodeT5ColNameTypeAware]
+
+COLUMN_DATA_DICT = {
+    'table_name': 'table_swe_employees',
+    'column_names': ['ID', 'Last name', 'First name', 'Age', 'Company', 'Salary'],
+    'column_types': ['int', 'text', 'text', 'int', 'text', 'real']
+}
+
+OTHER_COLUMN_DATA_DICT = {
+    'table_name': 'table_players',
+    'column_names': ['Player', 'Position'],
+    'column_types': ['text', 'text']
+}
+
+QUERIES = [
+    'How many employees are older than 30?',
+    'Who?',
+    'What is the salary of the employee with the last name Smith working at Company X?',
+    'What is the position of Jordan?',
+]
+
+TOKENIZATION_EDGE_CASE_QUERIES = [
+    '',
+    ' ',
+    '  leading and trailing spaces  ',
+    "what's the 'quoted' name, where the table is X?",
+    'Ünïcode café — naïve?',
+    'tabs\tand\nnewlines',
+]
+
+
+class TestModelInputs(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tokenizer = create_stub_tokenizer()
+        cls.model = create_stub_model(cls.tokenizer)
+
+    def translate_one_by_one(self, model_class, queries, column_data_dicts):
+        translations = []
+        for query, column_data_dict in zip(queries, column_data_dicts):
+            inputs = self.tokenizer(model_class.format_natural_language_query(query, column_data_dict), padding='longest', max_length=64, return_tensors='pt')
+            output = self.model.generate(inputs.input_ids, attention_mask=inputs.attention_mask, max_length=64)
+            translations.append(self.tokenizer.decode(output[0], skip_special_tokens=True))
+        return translations
+
+    def test_translate_to_sql_batch_matches_single_translations(self):
+        column_data_dicts = [COLUMN_DATA_DICT, COLUMN_DATA_DICT, COLUMN_DATA_DICT, OTHER_COLUMN_DATA_DICT]
+
+        for model_class in INPUT_FORMAT_CLASSES:
+            expected = self.translate_one_by_one(model_class, QUERIES, column_data_dicts)
+            for batch_size in [1, 3, 16]:
+                translations = model_class.translate_to_sql_batch(self.model, self.tokenizer, QUERIES, column_data_dicts, batch_size=batch_size)
+                assert translations == expected, model_class.__name__
+
+    def test_translate_to_sql_uses_a_single_input_batch(self):
+        for model_class in INPUT_FORMAT_CLASSES:
+            expected = self.translate_one_by_one(model_class, QUERIES[:1], [COLUMN_DATA_DICT])
+            assert model_class.translate_to_sql(self.model, self.tokenizer, QUERIES[0], COLUMN_DATA_DICT) == expected[0]
+
+    def test_get_input_ids_matches_string_tokenization(self):
+        tokenizers = {'t5': self.tokenizer, 'code-t5': create_stub_tokenizer('code-t5')}
+        column_data_dicts = [COLUMN_DATA_DICT, OTHER_COLUMN_DATA_DICT, {'table_name': 'empty', 'column_names': [], 'column_types': []}]
+
+        for model_class in INPUT_FORMAT_CLASSES:
+            for tokenizer in tokenizers.values():
+                for column_data_dict in column_data_dicts:
+                    for query in QUERIES + TOKENIZATION_EDGE_CASE_QUERIES:
+                        expected = tokenizer(model_class.format_natural_language_query(query, column_data_dict)).input_ids
+                        assert model_class.get_input_ids(tokenizer, query, column_data_dict) == expected, (model_class.__name__, query)
+
+    def test_translate_to_sql_batch_with_no_queries(self):
+        assert SQLT5Baseline.translate_to_sql_batch(self.model, self.tokenizer, [], []) == []
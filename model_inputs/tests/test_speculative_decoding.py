@@ -0,0 +1,102 @@
+import copy
+import unittest
+
+from unittest import mock
+
+from loader.stub_model import create_stub_model, create_stub_tokenizer
+from model_inputs import speculative_decoding
+from model_inputs.model_inputs import SQLT5Baseline, SQLCodeT5Baseline, SQLT5ColNameAware, SQLCodeT5ColNameAware, SQLT5ColNameTypeAware, \
+    SQLCodeT5ColNameTypeAware
+from model_inputs.speculative_decoding import find_draft, get_generation_config_processors, prompt_lookup_generate
+
+
+INPUT_FORMAT_CLASSES = [SQLT5Baseline, SQLCodeT5Baseline, SQLT5ColNameAware, SQLCodeT5ColNameAware, SQLT5ColNameTypeAware, SQLCodeT5ColNameTypeAware]
+
+COLUMN_DATA_DICT = {
+    'table_name': 'table_swe_employees',
+    'column_names': ['ID', 'Last name', 'First name', 'Age', 'Company', 'Salary'],
+    'column_types': ['int', 'text', 'text', 'int', 'text', 'real']
+}
+
+QUERIES = [
+    'How many employees are older than 30?',
+    'Who?',
+    'What is the salary of the employee with the last name Smith working at Company X?',
+]
+
+
+class TestSpeculativeDecoding(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.models = {}
+        for base_model in ['t5', 'code-t5']:
+            tokenizer = create_stub_tokenizer(base_model)
+            cls.models[base_model] = (tokenizer, create_stub_model(tokenizer))
+
+    def get_model(self, input_format_class):
+        return self.models['code-t5' if input_format_class.__name__.startswith('SQLCodeT5') else 't5']
+
+    def test_find_draft(self):
+        source_ids = [7, 1, 2, 3, 4, 5, 1, 2, 9]
+        assert find_draft(source_ids, [8, 1, 2], num_draft_tokens=3) == [9]
+        assert find_draft(source_ids, [8, 2, 3], num_draft_tokens=3) == [4, 5, 1]
+        assert find_draft(source_ids, [3, 4, 6], num_draft_tokens=3) == []
+        assert find_draft(source_ids, [], num_draft_tokens=3) == []
+
+    def test_find_draft_prefers_the_longest_match(self):
+        source_ids = [1, 2, 3, 9, 2, 3, 4]
+        assert find_draft(source_ids, [1, 2, 3], num_draft_tokens=1) == [9]
+        assert find_draft(source_ids, [5, 2, 3], num_draft_tokens=1) == [4]
+
+    def test_translations_match_greedy_decoding(self):
+        for input_format_class in INPUT_FORMAT_CLASSES:
+            tokenizer, model = self.get_model(input_format_class)
+            for constrained in [False, True]:
+                column_data_dicts = [COLUMN_DATA_DICT] * len(QUERIES)
+                expected = input_format_class.translate_to_sql_batch(model, tokenizer, QUERIES, column_data_dicts, constrained=constrained)
+                assert input_format_class.translate_to_sql_batch(model, tokenizer, QUERIES, column_data_dicts, constrained=constrained, speculative=True) == expected
+
+    def test_accepted_and_rejected_drafts_keep_the_greedy_output(self):
+        tokenizer, model = self.models['t5']
+        inputs = tokenizer([QUERIES[2]], return_tensors='pt')
+        expected = model.generate(**inputs, max_length=64)[0].tolist()
+
+        drafts = []
+
+        def draft_from_greedy_output(source_ids, generated_ids, *args):
+            # the greedy continuation, with a wrong token in every other draft
+            continuation = expected[len(generated_ids) + 1:len(generated_ids) + 6]
+            if len(drafts) % 2 and len(continuation) > 3:
+                continuation[3] += 1
+            drafts.append(continuation)
+            return continuation
+
+        stats = {}
+        with mock.patch.object(speculative_decoding, 'find_draft', draft_from_greedy_output):
+            output = prompt_lookup_generate(model, inputs.input_ids, inputs.attention_mask, stats=stats)
+
+        assert output[0].tolist() == expected
+        assert 0 < stats['accepted_tokens'] < stats['drafted_tokens']
+        assert stats['steps'] < stats['generated_tokens'] == len(expected) - 1
+
+    def test_generation_configs_with_logits_processors_generate_as_usual(self):
+        tokenizer, model = self.models['t5']
+        inputs = tokenizer([QUERIES[0]], return_tensors='pt')
+        greedy_output = model.generate(**inputs, max_length=64)[0].tolist()
+
+        # the first greedy token is banned by the generation config, which the drafts are not checked against
+        original_generation_config = model.generation_config
+        model.generation_config = copy.deepcopy(original_generation_config)
+        model.generation_config.bad_words_ids = [[greedy_output[1]]]
+        try:
+            assert get_generation_config_processors(model.generation_config) == ['bad_words_ids']
+            expected = model.generate(**inputs, max_length=64)[0].tolist()
+
+            stats = {}
+            output = prompt_lookup_generate(model, inputs.input_ids, inputs.attention_mask, stats=stats)
+        finally:
+            model.generation_config = original_generation_config
+
+        assert expected != greedy_output
+        assert output[0].tolist() == expected and stats == {}
+        assert get_generation_config_processors(model.generation_config) == []
@@ -0,0 +1,53 @@
+import threading
+import unittest
+
+from loader.stub_model import create_stub_model, create_stub_tokenizer
+from model_inputs.model_inputs import SQLT5Baseline, SQLCodeT5ColNameAware
+
+
+COLUMN_DATA_DICT = {
+    'table_name': 'table_swe_employees',
+    'column_names': ['ID', 'Last name', 'First name', 'Age', 'Company', 'Salary'],
+    'column_types': ['int', 'text', 'text', 'int', 'text', 'real']
+}
+
+QUERIES = ['How many employees are older than 30?', 'What is the salary of the employee with the last name Smith working at Company X?']
+
+
+class TestStreaming(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.models = {}
+        for input_format_class, base_model in [(SQLT5Baseline, 't5'), (SQLCodeT5ColNameAware, 'code-t5')]:
+            tokenizer = create_stub_tokenizer(base_model)
+            cls.models[input_format_class] = (tokenizer, create_stub_model(tokenizer))
+
+    def test_fragments_add_up_to_the_translation(self):
+        for input_format_class, (tokenizer, model) in self.models.items():
+            for query in QUERIES:
+                for constrained in [False, True]:
+                    fragments = list(input_format_class.translate_to_sql_stream(model, tokenizer, query, COLUMN_DATA_DICT, constrained=constrained))
+                    assert ''.join(fragments) == input_format_class.translate_to_sql(model, tokenizer, query, COLUMN_DATA_DICT, constrained=constrained)
+
+    def test_cancelled_generation_stops_early(self):
+        for input_format_class, (tokenizer, model) in self.models.items():
+            full_translation = input_format_class.translate_to_sql(model, tokenizer, QUERIES[0], COLUMN_DATA_DICT)
+
+            cancel_event = threading.Event()
+            cancel_event.set()
+            translation = ''.join(input_format_class.translate_to_sql_stream(model, tokenizer, QUERIES[0], COLUMN_DATA_DICT, cancel_event=cancel_event))
+            assert len(translation) < len(full_translation)
+
+    def test_closing_the_stream_cancels_the_generation(self):
+        tokenizer, model = self.models[SQLT5Baseline]
+        cancel_event = threading.Event()
+
+        stream = SQLT5Baseline.translate_to_sql_stream(model, tokenizer, QUERIES[1], COLUMN_DATA_DICT, cancel_event=cancel_event)
+        next(stream)
+        stream.close()
+        assert cancel_event.is_set()
+
+        # a stream consumed to its end leaves the event untouched
+        cancel_event = threading.Event()
+        list(SQLT5Baseline.translate_to_sql_stream(model, tokenizer, QUERIES[1], COLUMN_DATA_DICT, cancel_event=cancel_event))
+        assert not cancel_event.is_set()
@@ -0,0 +1,172 @@
+import bisect
+import threading
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.__buckets = tuple(sorted(buckets))
+        self.__bucket_counts = [0] * (len(self.__buckets) + 1)
+        self.__sum = 0.0
+        self.__count = 0
+        self.__lock = threading.Lock()
+
+    @property
+    def buckets(self):
+        return self.__buckets
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.__buckets, value)
+        with self.__lock:
+            self.__bucket_counts[index] += 1
+            self.__sum += value
+            self.__count += 1
+
+    def snapshot(self):
+        with self.__lock:
+            bucket_counts = list(self.__bucket_counts)
+            total, count = self.__sum, self.__count
+
+        # cumulative counts, keyed by the upper bound of each bucket
+        cumulative = {}
+        running_count = 0
+        for upper_bound, bucket_count in zip(self.__buckets + (float('inf'),), bucket_counts):
+            running_count += bucket_count
+            cumulative[upper_bound] = running_count
+
+        return {'buckets': cumulative, 'sum': total, 'count': count}
+
+
+class Counter:
+    def __init__(self):
+        self.__value = 0
+        self.__lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.__lock:
+            self.__value += amount
+
+    def snapshot(self):
+        with self.__lock:
+            return self.__value
+
+
+class MetricFamily:
+    def __init__(self, name, documentation, metric_type, label_names, create_metric):
+        self.name = name
+        self.documentation = documentation
+        self.metric_type = metric_type
+        self.label_names = tuple(label_names)
+
+        self.__create_metric = create_metric
+        self.__metrics = {}
+        self.__lock = threading.Lock()
+
+    def labels(self, **labels):
+        key = tuple(str(labels[label_name]) for label_name in self.label_names)
+
+        # the lock is only taken the first time a combination of labels is seen
+        metric = self.__metrics.get(key)
+        if metric is None:
+            with self.__lock:
+                metric = self.__metrics.setdefault(key, self.__create_metric())
+        return metric
+
+    def collect(self):
+        with self.__lock:
+            metrics = dict(self.__metrics)
+        return [(dict(zip(self.label_names, key)), metric.snapshot()) for key, metric in sorted(metrics.items())]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.__families = []
+        self.__gauges = []
+
+        # latest snapshot of the registry of each other process, e.g. the inference workers, added to the local metrics when rendered
+        self.__remote_snapshots = {}
+        self.__lock = threading.Lock()
+
+    def counter(self, name, documentation, label_names=()):
+        return self.__add_family(MetricFamily(name, documentation, 'counter', label_names, Counter))
+
+    def histogram(self, name, documentation, label_names=(), buckets=()):
+        return self.__add_family(MetricFamily(name, documentation, 'histogram', label_names, lambda: Histogram(buckets)))
+
+    def gauge(self, name, documentation, label_names, collect):
+        # gauges are read from their source when rendered, collect returns a (labels dict, value) list
+        self.__gauges.append((name, documentation, tuple(label_names), collect))
+
+    def snapshot(self):
+        return {family.name: family.collect() for family in self.__families}
+
+    def set_remote_snapshot(self, source, snapshot):
+        # the snapshots are cumulative, so the latest one of a source replaces the previous one
+        with self.__lock:
+            self.__remote_snapshots[source] = snapshot
+
+    def render_prometheus(self):
+        with self.__lock:
+            remote_snapshots = list(self.__remote_snapshots.values())
+
+        lines = []
+        for family in self.__families:
+            lines += ['# HELP {} {}'.format(family.name, family.documentation), '# TYPE {} {}'.format(family.name, family.metric_type)]
+            collected = family.collect()
+            for remote_snapshot in remote_snapshots:
+                collected = merge_collected(family, collected, remote_snapshot.get(family.name, []))
+
+            for labels, snapshot in collected:
+                if family.metric_type == 'histogram':
+                    for upper_bound, count in snapshot['buckets'].items():
+                        lines.append('{}_bucket{} {}'.format(family.name, format_labels(dict(labels, le=format_value(upper_bound))), count))
+                    lines.append('{}_sum{} {}'.format(family.name, format_labels(labels), format_value(snapshot['sum'])))
+                    lines.append('{}_count{} {}'.format(family.name, format_labels(labels), snapshot['count']))
+                else:
+                    lines.append('{}{} {}'.format(family.name, format_labels(labels), format_value(snapshot)))
+
+        for name, documentation, label_names, collect in self.__gauges:
+            lines += ['# HELP {} {}'.format(name, documentation), '# TYPE {} gauge'.format(name)]
+            for labels, value in collect():
+                lines.append('{}{} {}'.format(name, format_labels({label_name: labels[label_name] for label_name in label_names}), format_value(value)))
+
+        return '\n'.join(lines) + '\n'
+
+    def __add_family(self, family):
+        self.__families.append(family)
+        return family
+
+
+def merge_collected(family, collected, other_collected):
+    merged = {tuple(labels[label_name] for label_name in family.label_names): (labels, snapshot) for labels, snapshot in collected}
+    for labels, snapshot in other_collected:
+        key = tuple(labels[label_name] for label_name in family.label_names)
+        if key not in merged:
+            merged[key] = (labels, snapshot)
+            continue
+
+        merged_snapshot = merged[key][1]
+        if family.metric_type == 'histogram':
+            merged_snapshot = {
+                'buckets': {upper_bound: count + snapshot['buckets'].get(upper_bound, 0) for upper_bound, count in merged_snapshot['buckets'].items()},
+                'sum': merged_snapshot['sum'] + snapshot['sum'],
+                'count': merged_snapshot['count'] + snapshot['count'],
+            }
+        else:
+            merged_snapshot += snapshot
+        merged[key] = (labels, merged_snapshot)
+
+    return [merged[key] for key in sorted(merged)]
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+
+    escaped_labels = ['{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for name, value in labels.items()]
+    return '{' + ','.join(escaped_labels) + '}'
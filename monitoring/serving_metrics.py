@@ -0,0 +1,46 @@
+import time
+
+from contextlib import contextmanager
+
+from monitoring.metrics import MetricsRegistry
+
+
+STAGE_SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+STAGE_SCHEMA_PARSING = 'schema_parsing'
+STAGE_SCHEMA_LOOKUP = 'schema_lookup'
+STAGE_MODEL_LOAD = 'model_load'
+STAGE_PROMPT_FORMATTING = 'prompt_formatting'
+STAGE_TOKENIZATION = 'tokenization'
+STAGE_GENERATE = 'generate'
+STAGE_DECODING = 'decoding'
+
+# label of the requests for models that are not in the pretrained models metadata index
+MODEL_LABEL_UNKNOWN = 'unknown'
+
+
+metrics_registry = MetricsRegistry()
+
+stage_seconds = metrics_registry.histogram('sqlgen_stage_seconds', 'Time spent in each stage of a translation request.', ['model', 'endpoint', 'stage'],
+                                           STAGE_SECONDS_BUCKETS)
+request_seconds = metrics_registry.histogram('sqlgen_request_seconds', 'Time spent translating a request, end to end.', ['model', 'endpoint'],
+                                             STAGE_SECONDS_BUCKETS)
+
+translation_cache_hits = metrics_registry.counter('sqlgen_translation_cache_hits_total', 'Translations answered from the translation cache.', ['model', 'endpoint'])
+translation_cache_misses = metrics_registry.counter('sqlgen_translation_cache_misses_total', 'Translations that had to be generated.', ['model', 'endpoint'])
+model_loads = metrics_registry.counter('sqlgen_model_loads_total', 'Pretrained models loaded from disk.', ['model'])
+formatter_failures = metrics_registry.counter('sqlgen_formatter_failures_total', 'Inputs that could not be formatted.', ['formatter', 'endpoint'])
+shed_requests = metrics_registry.counter('sqlgen_shed_requests_total', 'Translations rejected by the admission control.', ['model', 'endpoint', 'reason'])
+
+
+def observe_stage(model, endpoint, stage, seconds):
+    stage_seconds.labels(model=model, endpoint=endpoint, stage=stage).observe(seconds)
+
+
+@contextmanager
+def timed_stage(model, endpoint, stage):
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(model, endpoint, stage, time.perf_counter() - start_time)
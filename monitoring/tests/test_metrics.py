@@ -0,0 +1,70 @@
+import unittest
+
+from monitoring.metrics import MetricsRegistry
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    def test_render_counters_per_label_combination(self):
+        registry = MetricsRegistry()
+        counter = registry.counter('requests_total', 'Requests.', ['endpoint'])
+        counter.labels(endpoint='a').inc()
+        counter.labels(endpoint='a').inc(2)
+        counter.labels(endpoint='b').inc()
+
+        lines = registry.render_prometheus().splitlines()
+        assert lines[:2] == ['# HELP requests_total Requests.', '# TYPE requests_total counter']
+        assert 'requests_total{endpoint="a"} 3' in lines
+        assert 'requests_total{endpoint="b"} 1' in lines
+
+    def test_render_cumulative_histogram_buckets(self):
+        registry = MetricsRegistry()
+        histogram = registry.histogram('latency_seconds', 'Latency.', ['stage'], [0.1, 1.0])
+        for value in [0.05, 0.5, 0.7, 5.0]:
+            histogram.labels(stage='generate').observe(value)
+
+        lines = registry.render_prometheus().splitlines()
+        assert 'latency_seconds_bucket{stage="generate",le="0.1"} 1' in lines
+        assert 'latency_seconds_bucket{stage="generate",le="1.0"} 3' in lines
+        assert 'latency_seconds_bucket{stage="generate",le="+Inf"} 4' in lines
+        assert 'latency_seconds_count{stage="generate"} 4' in lines
+        assert 'latency_seconds_sum{stage="generate"} 6.25' in lines
+
+    def test_render_gauges_from_their_source(self):
+        registry = MetricsRegistry()
+        values = {'stub': 1}
+        registry.gauge('entries', 'Entries.', ['model'], lambda: [({'model': model}, value) for model, value in values.items()])
+
+        assert 'entries{model="stub"} 1' in registry.render_prometheus().splitlines()
+        values['stub'] = 5
+        assert 'entries{model="stub"} 5' in registry.render_prometheus().splitlines()
+
+    def test_label_values_are_escaped(self):
+        registry = MetricsRegistry()
+        registry.counter('errors_total', 'Errors.', ['message']).labels(message='a "quoted"\nvalue\\').inc()
+
+        assert 'errors_total{message="a \\"quoted\\"\\nvalue\\\\"} 1' in registry.render_prometheus().splitlines()
+
+    def test_remote_snapshots_are_added_to_the_local_metrics(self):
+        registry = MetricsRegistry()
+        counter = registry.counter('requests_total', 'Requests.', ['endpoint'])
+        histogram = registry.histogram('latency_seconds', 'Latency.', ['stage'], [0.1, 1.0])
+        counter.labels(endpoint='a').inc()
+        histogram.labels(stage='generate').observe(0.05)
+
+        remote_registry = MetricsRegistry()
+        remote_counter = remote_registry.counter('requests_total', 'Requests.', ['endpoint'])
+        remote_counter.labels(endpoint='a').inc(2)
+        remote_counter.labels(endpoint='b').inc()
+        remote_registry.histogram('latency_seconds', 'Latency.', ['stage'], [0.1, 1.0]).labels(stage='generate').observe(0.5)
+
+        registry.set_remote_snapshot('worker', remote_registry.snapshot())
+        # a newer snapshot of the same source replaces the previous one
+        registry.set_remote_snapshot('worker', remote_registry.snapshot())
+
+        lines = registry.render_prometheus().splitlines()
+        assert 'requests_total{endpoint="a"} 3' in lines
+        assert 'requests_total{endpoint="b"} 1' in lines
+        assert 'latency_seconds_bucket{stage="generate",le="0.1"} 1' in lines
+        assert 'latency_seconds_bucket{stage="generate",le="1.0"} 2' in lines
+        assert 'latency_seconds_count{stage="generate"} 2' in lines
+        assert 'latency_seconds_sum{stage="generate"} 0.55' in lines
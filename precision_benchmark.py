@@ -0,0 +1,120 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+import psutil
+from datasets import load_dataset
+from transformers import AutoTokenizer, T5ForConditionalGeneration
+
+from lib.dbengine import DBEngine
+from loader.model_registry import get_model_size_bytes
+from loader.precision import PRECISIONS, apply_precision
+from loader.pretrained_loader import METADATA_FILE_NAME
+from model_inputs import model_inputs
+from wikisql_eval import evaluate_predictions
+
+
+class PrecisionBenchmark:
+    @staticmethod
+    def percentile(values, percent):
+        ordered_values = sorted(values)
+        index = min(len(ordered_values) - 1, int(round(percent / 100 * (len(ordered_values) - 1))))
+        return ordered_values[index]
+
+    @staticmethod
+    def load_test_data(limit=None):
+        test_data = load_dataset('wikisql', split='test')
+        if limit is not None:
+            test_data = test_data.select(range(min(limit, len(test_data))))
+        return test_data
+
+    @staticmethod
+    def run_in_subprocess(pretrained_path, model_inputs_class_name, precision, limit, db_path, batch_size):
+        # every precision is measured in a new process, so that its resident memory does not include the models of the previous ones
+        with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as executor:
+            return executor.submit(run_precision, pretrained_path, model_inputs_class_name, precision, limit, db_path, batch_size).result()
+
+    @staticmethod
+    def run(pretrained_path, model_inputs_class, precision, test_data, engine, batch_size):
+        process = psutil.Process()
+        rss_before = process.memory_info().rss
+
+        tokenizer = AutoTokenizer.from_pretrained(pretrained_path)
+        model = apply_precision(T5ForConditionalGeneration.from_pretrained(pretrained_path), precision)
+        rss_after_load = process.memory_info().rss
+
+        predictions = []
+        latencies_ms = []
+        for start in range(0, len(test_data), batch_size):
+            rows = test_data[start:start + batch_size]
+            column_data_dicts = [{'table_name': table['name'], 'column_names': table['header'], 'column_types': table['types']} for table in rows['table']]
+
+            start_time = time.perf_counter()
+            predictions += model_inputs_class.translate_to_sql_batch(model, tokenizer, rows['question'], column_data_dicts, batch_size=batch_size)
+            latencies_ms.append((time.perf_counter() - start_time) * 1000 / len(column_data_dicts))
+
+        metrics = evaluate_predictions(test_data, predictions, engine, verbose=False)
+
+        return {
+            'precision': precision,
+            'ex_accuracy': metrics['full_ex_accuracy'],
+            'lf_accuracy': metrics['full_lf_accuracy'],
+            'mean_latency_ms': sum(latencies_ms) / len(latencies_ms),
+            'p50_latency_ms': PrecisionBenchmark.percentile(latencies_ms, 50),
+            'p95_latency_ms': PrecisionBenchmark.percentile(latencies_ms, 95),
+            # the int8 precision is quantized from the fp32 weights, so its resident memory also holds what the allocator kept of them, while the
+            # model size only counts the parameters and buffers of the quantized model
+            'model_size_bytes': get_model_size_bytes((tokenizer, model)),
+            'rss_increase_bytes': rss_after_load - rss_before,
+        }
+
+
+def run_precision(pretrained_path, model_inputs_class_name, precision, limit, db_path, batch_size):
+    test_data = PrecisionBenchmark.load_test_data(limit)
+    return PrecisionBenchmark.run(pretrained_path, getattr(model_inputs, model_inputs_class_name), precision, test_data, DBEngine(db_path), batch_size)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)s : %(name)s - %(levelname)s : %(message)s')
+    logger = logging.getLogger('root')
+    logger.setLevel(logging.INFO)
+
+    parser = argparse.ArgumentParser(
+        prog='Text-to-SQL Precision Benchmark',
+        description='Compares the WikiSQL accuracy, latency and memory of a pretrained model in each CPU inference precision',
+    )
+
+    parser.add_argument('--pretrained-path', type=str, required=True, help='Specify the path to the pretrained model to benchmark')
+    parser.add_argument('--precisions', type=str, nargs='+', default=PRECISIONS, choices=PRECISIONS, help='Specify the precisions to compare')
+    parser.add_argument('--limit', type=int, default=None, help='Specify how many rows of the WikiSQL test split to use (all of them by default)')
+    parser.add_argument('--batch-size', type=int, default=1, help='Specify how many queries are translated in a single generation call')
+    parser.add_argument('--db-path', type=str, default='data/test.db', help='Specify the path to the WikiSQL test database')
+    parser.add_argument('--output-path', type=str, default=None, help='Specify a file where to store the results as JSON')
+    args = parser.parse_args()
+
+    with open('{}/{}'.format(args.pretrained_path, METADATA_FILE_NAME), 'r') as file:
+        model_inputs_class_name = json.load(file)['class_name']
+
+    # the test split is downloaded once, before the subprocesses load it from the cache
+    num_rows = len(PrecisionBenchmark.load_test_data(args.limit))
+
+    results = []
+    for precision in args.precisions:
+        logger.info('Benchmarking the \'%s\' precision on %d rows.', precision, num_rows)
+        result = PrecisionBenchmark.run_in_subprocess(args.pretrained_path, model_inputs_class_name, precision, args.limit, args.db_path, args.batch_size)
+        logger.info('Results: %s', result)
+        results.append(result)
+
+    print('\n{:<14}{:>10}{:>10}{:>14}{:>14}{:>14}{:>16}{:>16}'.format('precision', 'acc_ex', 'acc_lf', 'mean_ms', 'p50_ms', 'p95_ms', 'size_MB', 'rss_MB'))
+    for result in results:
+        print('{:<14}{:>10.4f}{:>10.4f}{:>14.2f}{:>14.2f}{:>14.2f}{:>16.2f}{:>16.2f}'.format(
+            result['precision'], result['ex_accuracy'], result['lf_accuracy'], result['mean_latency_ms'], result['p50_latency_ms'],
+            result['p95_latency_ms'], result['model_size_bytes'] / 2 ** 20, result['rss_increase_bytes'] / 2 ** 20))
+
+    if args.output_path:
+        with open(args.output_path, 'w') as file:
+            json.dump(results, file, indent=4)
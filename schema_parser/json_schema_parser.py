@@ -1,3 +1,4 @@
+import hashlib
 import json
 import chardet
 
@@ -15,3 +16,9 @@ def get_table_schema_from_json(file_storage):
         column_types.append(column_dict['type'])
 
     return {'table_name': table_name, 'column_names': column_names, 'column_types': column_types}
+
+
+def get_table_schema_fingerprint(column_data_dict):
+    # stable across processes, unlike hash(), and independent of the table name
+    schema_str = json.dumps([list(column_data_dict['column_names']), list(column_data_dict['column_types'])], ensure_ascii=False)
+    return hashlib.sha256(schema_str.encode('utf-8')).hexdigest()
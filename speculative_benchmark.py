@@ -0,0 +1,96 @@
+import argparse
+import json
+import logging
+import time
+
+import torch
+from datasets import load_dataset
+from transformers import AutoTokenizer, T5ForConditionalGeneration
+
+from loader.pretrained_loader import METADATA_FILE_NAME
+from model_inputs import model_inputs
+from model_inputs.speculative_decoding import DEFAULT_MAX_NGRAM_SIZE, DEFAULT_NUM_DRAFT_TOKENS, get_generation_config_processors, prompt_lookup_generate
+
+
+class SpeculativeBenchmark:
+    @staticmethod
+    def run(pretrained_path, model_inputs_class, test_data, max_ngram_size, num_draft_tokens):
+        tokenizer = AutoTokenizer.from_pretrained(pretrained_path)
+        model = T5ForConditionalGeneration.from_pretrained(pretrained_path)
+        model.eval()
+
+        generation_config_processors = get_generation_config_processors(model.generation_config)
+        if generation_config_processors:
+            raise Exception('Speculative decoding is not run for generation configs with logits processors: {}'.format(', '.join(generation_config_processors)))
+
+        stats = {}
+        greedy_seconds, speculative_seconds, greedy_steps, mismatches = 0, 0, 0, 0
+        for row in test_data:
+            column_data_dict = {'table_name': row['table']['name'], 'column_names': row['table']['header'], 'column_types': row['table']['types']}
+            input_ids = torch.tensor([model_inputs_class.get_input_ids(tokenizer, row['question'], column_data_dict)])
+            attention_mask = torch.ones_like(input_ids)
+
+            start_time = time.perf_counter()
+            with torch.no_grad():
+                greedy_output = model.generate(input_ids, attention_mask=attention_mask, max_length=64)
+            greedy_seconds += time.perf_counter() - start_time
+
+            # greedy decoding runs one decoder step for every generated token
+            greedy_steps += greedy_output.shape[1] - 1
+
+            start_time = time.perf_counter()
+            speculative_output = prompt_lookup_generate(model, input_ids, attention_mask, max_length=64, max_ngram_size=max_ngram_size,
+                                                        num_draft_tokens=num_draft_tokens, stats=stats)
+            speculative_seconds += time.perf_counter() - start_time
+
+            mismatches += tokenizer.decode(greedy_output[0], skip_special_tokens=True) != tokenizer.decode(speculative_output[0], skip_special_tokens=True)
+
+        return {
+            'rows': len(test_data),
+            'greedy_steps': greedy_steps,
+            'speculative_steps': stats['steps'],
+            'tokens_per_step': stats['generated_tokens'] / stats['steps'],
+            'accepted_tokens_per_step': stats['accepted_tokens'] / stats['steps'],
+            'draft_acceptance_rate': stats['accepted_tokens'] / stats['drafted_tokens'] if stats['drafted_tokens'] else 0.0,
+            'greedy_seconds': greedy_seconds,
+            'speculative_seconds': speculative_seconds,
+            'speedup': greedy_seconds / speculative_seconds,
+            'mismatches': mismatches
+        }
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)s : %(name)s - %(levelname)s : %(message)s')
+    logger = logging.getLogger('root')
+    logger.setLevel(logging.INFO)
+
+    parser = argparse.ArgumentParser(
+        prog='Text-to-SQL Speculative Decoding Benchmark',
+        description='Compares greedy decoding with prompt lookup speculative decoding on the WikiSQL test split',
+    )
+
+    parser.add_argument('--pretrained-path', type=str, required=True, help='Specify the path to the pretrained model to benchmark')
+    parser.add_argument('--limit', type=int, default=None, help='Specify how many rows of the WikiSQL test split to use (all of them by default)')
+    parser.add_argument('--max-ngram-size', type=int, default=DEFAULT_MAX_NGRAM_SIZE, help='Specify the longest n-gram looked up in the input')
+    parser.add_argument('--num-draft-tokens', type=int, default=DEFAULT_NUM_DRAFT_TOKENS, help='Specify the maximum number of drafted tokens')
+    parser.add_argument('--output-path', type=str, default=None, help='Specify a file where to store the results as JSON')
+    args = parser.parse_args()
+
+    with open('{}/{}'.format(args.pretrained_path, METADATA_FILE_NAME), 'r') as file:
+        model_inputs_class = getattr(model_inputs, json.load(file)['class_name'])
+
+    test_data = load_dataset('wikisql', split='test')
+    if args.limit is not None:
+        test_data = test_data.select(range(min(args.limit, len(test_data))))
+
+    logger.info('Benchmarking speculative decoding on %d rows.', len(test_data))
+    result = SpeculativeBenchmark.run(args.pretrained_path, model_inputs_class, test_data, args.max_ngram_size, args.num_draft_tokens)
+    logger.info('Results: %s', result)
+
+    print('\n{:<28}{:>12}'.format('metric', 'value'))
+    for key, value in result.items():
+        print('{:<28}{:>12.4f}'.format(key, value) if isinstance(value, float) else '{:<28}{:>12}'.format(key, value))
+
+    if args.output_path:
+        with open(args.output_path, 'w') as file:
+            json.dump(result, file, indent=4)
@@ -9,22 +9,24 @@ from transformers import AutoTokenizer, T5ForConditionalGeneration
 
 MODEL_INPUTS_MODULE_NAME = 'model_inputs.model_inputs'
 
+# number of rows translated between two progress logs; each chunk is split again into generation batches
+CHUNK_SIZE = 1024
+
 
 class WikiSQLPredictionsStorage:
     @staticmethod
-    def store_predictions_in_file(model_inputs_class, model, tokenizer, evaluated_data, file_path, device):
+    def store_predictions_in_file(model_inputs_class, model, tokenizer, evaluated_data, file_path, device, batch_size=32):
         with open(file_path, 'w', encoding='utf-8') as file:
-            index = 0
+            for start in range(0, len(evaluated_data), CHUNK_SIZE):
+                rows = evaluated_data[start:start + CHUNK_SIZE]
 
-            for row in evaluated_data:
-                column_data_dict = {'table_name': row['table']['name'], 'column_names': row['table']['header'], 'column_types': row['table']['types']}
+                queries = rows['question']
+                column_data_dicts = [{'table_name': table['name'], 'column_names': table['header'], 'column_types': table['types']} for table in rows['table']]
 
-                predicted_query = model_inputs_class.translate_to_sql(model, tokenizer, row['question'], column_data_dict, device)
-                file.write(predicted_query + '\n')
+                predicted_queries = model_inputs_class.translate_to_sql_batch(model, tokenizer, queries, column_data_dicts, device, batch_size)
+                file.writelines(predicted_query + '\n' for predicted_query in predicted_queries)
 
-                if index % 100 == 0:
-                    logger.info('Storing predictions in file, row = {}'.format(index))
-                index += 1
+                logger.info('Storing predictions in file, row = {}'.format(start + len(queries)))
 
 
 if __name__ == '__main__':
@@ -40,6 +42,7 @@ if __name__ == '__main__':
     parser.add_argument('--input-format-class', type=str, required=True, help='Specify the model input format, defined in a class from the model_inputs module')
     parser.add_argument('--file-path', type=str, required=True, help='Specify the path of the file where to store the model predictions')
     parser.add_argument('--pretrained-path', type=str, required=True, help='Specify the path to the pretrained model to evaluate')
+    parser.add_argument('--batch-size', type=int, default=32, help='Specify how many queries are translated in a single generation call')
     args = parser.parse_args()
 
     model_inputs_class_str = args.input_format_class
@@ -57,4 +60,4 @@ if __name__ == '__main__':
     model.to(device)
 
     test_data = load_dataset('wikisql', split='test')
-    WikiSQLPredictionsStorage.store_predictions_in_file(model_inputs_class, model, tokenizer, test_data, FILE_PATH, device)
+    WikiSQLPredictionsStorage.store_predictions_in_file(model_inputs_class, model, tokenizer, test_data, FILE_PATH, device, args.batch_size)
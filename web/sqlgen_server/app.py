@@ -1,15 +1,25 @@
 import json
 import jwt
+import math
+import threading
+import time
 
 
 from datetime import datetime, timedelta
-from flask import Flask, request, make_response, jsonify
+from flask import Flask, Response, request, make_response, jsonify, stream_with_context
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import inspect, text
 from werkzeug.security import generate_password_hash, check_password_hash
 
 
-from loader.pretrained_loader import get_all_pretrained_models_metadata, translate_to_sql
+from lib.lru_cache import LRUCache
+from loader.batch_scheduler import PRIORITY_HIGH, PRIORITY_LOW, OverloadedError
+from loader.pretrained_loader import WARMUP_READY, get_all_pretrained_models_dir_names, get_all_pretrained_models_metadata, get_model_label, \
+    get_warmup_status, refresh_pretrained_models_metadata, start_worker_pool, translate_many_to_sql, translate_to_sql_async, translate_to_sql_stream, \
+    warm_up_pretrained_models
+from monitoring.serving_metrics import STAGE_SCHEMA_LOOKUP, STAGE_SCHEMA_PARSING, formatter_failures, metrics_registry, request_seconds, shed_requests, \
+    timed_stage
 from schema_parser.json_schema_parser import get_table_schema_from_json
 
 
@@ -21,9 +31,32 @@ app.config['SECRET_KEY'] = 'test_secret_key'
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///TextToSQLDb.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = True
 
+# number of inference worker processes, each pinned to its own slice of cores; 0 runs the translations in the request threads
+app.config['INFERENCE_WORKERS'] = 0
+
+# model directories loaded and warmed up at startup, None meaning all the pretrained models
+app.config['PRELOAD_MODELS'] = None
+
+# largest number of questions translated by a single /submit/batch request
+app.config['MAX_BATCH_QUESTIONS'] = 256
+
+# time within which a translation request has to be answered, requests that cannot make it are rejected with a 503
+app.config['TRANSLATION_DEADLINE_SECONDS'] = 30.0
+
 db = SQLAlchemy(app)
 # app.app_context().push()
 
+# parsed user table schemas, keyed by username and table name
+app.config['SCHEMA_CACHE_MAX_ENTRIES'] = 1024
+schema_cache = LRUCache(app.config['SCHEMA_CACHE_MAX_ENTRIES'])
+
+# the pretrained models metadata is indexed once at startup, translations then look it up in memory
+refresh_pretrained_models_metadata(force=True)
+
+# the models are preloaded and warmed up once per process, by the first call to start_serving
+serving_started = False
+serving_lock = threading.Lock()
+
 
 # Database ORMs
 class User(db.Model):
@@ -34,10 +67,44 @@ class User(db.Model):
 
 
 class UserTableSchema(db.Model):
+    # the primary key doubles as the (username, table_name) index
+    username = db.Column(db.String(50), primary_key=True)
     table_name = db.Column(db.String(50), primary_key=True)
+    columns = db.relationship('UserTableColumn', order_by='UserTableColumn.position', lazy='selectin', cascade='all, delete-orphan')
+
+
+class UserTableColumn(db.Model):
     username = db.Column(db.String(50), primary_key=True)
-    column_names = db.Column(db.String(100))
-    column_types = db.Column(db.String(100))
+    table_name = db.Column(db.String(50), primary_key=True)
+    position = db.Column(db.Integer, primary_key=True)
+    column_name = db.Column(db.Text, nullable=False)
+    column_type = db.Column(db.String(50), nullable=False)
+
+    __table_args__ = (db.ForeignKeyConstraint(['username', 'table_name'], ['user_table_schema.username', 'user_table_schema.table_name']),)
+
+
+def get_user_table_schema(username, table_name):
+    column_data_dict = schema_cache.get((username, table_name))
+    if column_data_dict is not None:
+        return column_data_dict
+
+    table = UserTableSchema.query.filter_by(username=username, table_name=table_name).first()
+    if not table:
+        return None
+
+    column_data_dict = {
+        'table_name': table.table_name,
+        'column_names': [column.column_name for column in table.columns],
+        'column_types': [column.column_type for column in table.columns]
+    }
+    schema_cache.put((username, table_name), column_data_dict)
+    return column_data_dict
+
+
+@app.route('/health')
+def health():
+    warmup_status = get_warmup_status()
+    return make_response(jsonify(warmup_status), 200 if warmup_status['status'] == WARMUP_READY else 503)
 
 
 @app.route('/pretrained_models_metadata')
@@ -52,8 +119,37 @@ def get_user_table_schemas(username):
     return table_schemas
 
 
+def parse_table_schema(file_storage, pretrained_model_dir=''):
+    with timed_stage(get_model_label(pretrained_model_dir), request.endpoint, STAGE_SCHEMA_PARSING):
+        try:
+            return get_table_schema_from_json(file_storage)
+        except Exception:
+            formatter_failures.labels(formatter='table_schema', endpoint=request.endpoint).inc()
+            raise
+
+
+def observe_request(pretrained_model_dir, endpoint, start_time):
+    request_seconds.labels(model=get_model_label(pretrained_model_dir), endpoint=endpoint).observe(time.perf_counter() - start_time)
+
+
+@app.errorhandler(OverloadedError)
+def handle_overloaded_error(error):
+    shed_requests.labels(model=get_model_label(request.form.get('pretrained_model', '')), endpoint=request.endpoint, reason=error.reason).inc()
+
+    json_response = jsonify({
+        'status': 'overloaded',
+        'message': str(error)
+    })
+    return make_response(json_response, 503, {'Retry-After': str(max(1, math.ceil(error.retry_after_seconds)))})
+
+
+@app.route('/metrics')
+def metrics():
+    return Response(metrics_registry.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 @app.route('/submit/guest_query', methods=['POST'])
-def submit_guest_query():
+async def submit_guest_query():
     if 'file' not in request.files or 'natural_language_query' not in request.form or 'pretrained_model' not in request.form:
         return 'Invalid request: file, query, or pretrained model was not correctly specified.', 400
 
@@ -61,8 +157,11 @@ def submit_guest_query():
     natural_language_query = request.form.get('natural_language_query')
     pretrained_model_dir = request.form.get('pretrained_model')
 
-    table_data_dict = get_table_schema_from_json(file_storage)
-    query = translate_to_sql(natural_language_query, pretrained_model_dir, table_data_dict)
+    start_time = time.perf_counter()
+    table_data_dict = parse_table_schema(file_storage, pretrained_model_dir)
+    query = await translate_to_sql_async(natural_language_query, pretrained_model_dir, table_data_dict, endpoint=request.endpoint,
+                                         priority=PRIORITY_LOW, deadline=start_time + app.config['TRANSLATION_DEADLINE_SECONDS'])
+    observe_request(pretrained_model_dir, request.endpoint, start_time)
 
     json_response = jsonify({
         'query': query,
@@ -70,18 +169,81 @@ def submit_guest_query():
     return make_response(json_response, 200)
 
 
-@app.route('/submit/home_query', methods=['POST'])
-def submit_home_query():
-    if 'natural_language_query' not in request.form or 'pretrained_model' not in request.form or 'table_schema_name' not in request.form:
+def format_server_sent_event(event, data):
+    return 'event: {}\ndata: {}\n\n'.format(event, json.dumps(data))
+
+
+@app.route('/submit/guest_query/stream', methods=['POST'])
+def submit_guest_query_stream():
+    if 'file' not in request.files or 'natural_language_query' not in request.form or 'pretrained_model' not in request.form:
         return 'Invalid request: file, query, or pretrained model was not correctly specified.', 400
 
+    file_storage = request.files.get('file')
+    natural_language_query = request.form.get('natural_language_query')
+    pretrained_model_dir = request.form.get('pretrained_model')
+
+    endpoint = request.endpoint
+    start_time = time.perf_counter()
+    table_data_dict = parse_table_schema(file_storage, pretrained_model_dir)
+
+    # the translation is admitted before the response starts, so that a shed translation is answered with a 503
+    stream = translate_to_sql_stream(natural_language_query, pretrained_model_dir, table_data_dict, endpoint=endpoint, priority=PRIORITY_LOW,
+                                     deadline=start_time + app.config['TRANSLATION_DEADLINE_SECONDS'])
+
+    def generate_events():
+        first_fragment_time = None
+        fragments = []
+
+        # the server closes this generator when the client disconnects, which cancels the generation
+        try:
+            for fragment in stream:
+                if first_fragment_time is None:
+                    first_fragment_time = time.perf_counter()
+                fragments.append(fragment)
+                yield format_server_sent_event('fragment', {'text': fragment})
+        except Exception as exception:
+            yield format_server_sent_event('error', {'message': str(exception)})
+            return
+        finally:
+            stream.close()
+
+        end_time = time.perf_counter()
+        observe_request(pretrained_model_dir, endpoint, start_time)
+        yield format_server_sent_event('done', {
+            'query': ''.join(fragments),
+            'time_to_first_token_ms': ((first_fragment_time or end_time) - start_time) * 1000,
+            'total_ms': (end_time - start_time) * 1000
+        })
+
+    return Response(stream_with_context(generate_events()), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+
+@app.route('/submit/home_query', methods=['POST'])
+async def submit_home_query():
+    if 'natural_language_query' not in request.form or 'pretrained_model' not in request.form or 'table_schema_name' not in request.form or \
+            'username' not in request.form:
+        return 'Invalid request: query, pretrained model, table schema, or username was not correctly specified.', 400
+
     natural_language_query = request.form.get('natural_language_query')
     pretrained_model_dir = request.form.get('pretrained_model')
     table_schema_name = request.form.get('table_schema_name')
+    username = request.form.get('username')
+
+    start_time = time.perf_counter()
+    with timed_stage(get_model_label(pretrained_model_dir), request.endpoint, STAGE_SCHEMA_LOOKUP):
+        table_data_dict = get_user_table_schema(username, table_schema_name)
 
-    table = UserTableSchema.query.filter_by(table_name=table_schema_name).first()
-    table_data_dict = {'table_name': table.table_name, 'column_names': table.column_names.split(','), 'column_types': table.column_types.split(',')}
-    query = translate_to_sql(natural_language_query, pretrained_model_dir, table_data_dict)
+    if table_data_dict is None:
+        json_response = jsonify({
+            'status': 'table_schema_not_found',
+            'message': 'User \'{}\' has no table schema \'{}\'.'.format(username, table_schema_name)
+        })
+        return make_response(json_response, 404)
+
+    # authenticated requests go before the anonymous ones
+    query = await translate_to_sql_async(natural_language_query, pretrained_model_dir, table_data_dict, endpoint=request.endpoint,
+                                         priority=PRIORITY_HIGH, deadline=start_time + app.config['TRANSLATION_DEADLINE_SECONDS'])
+    observe_request(pretrained_model_dir, request.endpoint, start_time)
 
     json_response = jsonify({
         'query': query,
@@ -89,6 +251,95 @@ def submit_home_query():
     return make_response(json_response, 200)
 
 
+def parse_batch_questions(questions_jsonl):
+    # every line is either a JSON string or a JSON object with a question and an optional id, invalid lines become per-question errors
+    questions = []
+    for line in questions_jsonl.splitlines():
+        if not line.strip():
+            continue
+
+        try:
+            question = json.loads(line)
+        except ValueError:
+            questions.append({'error': 'Invalid JSON line.'})
+            continue
+
+        if isinstance(question, str):
+            question = {'question': question}
+        if not isinstance(question, dict):
+            questions.append({'error': 'A question must be a string or an object.'})
+            continue
+
+        parsed_question = {'id': question['id']} if 'id' in question else {}
+        if isinstance(question.get('question'), str):
+            parsed_question['question'] = question['question']
+        else:
+            parsed_question['error'] = 'No question was specified.'
+        questions.append(parsed_question)
+
+    return questions
+
+
+@app.route('/submit/batch', methods=['POST'])
+def submit_batch():
+    if ('questions' not in request.files and 'questions' not in request.form) or 'pretrained_model' not in request.form:
+        return 'Invalid request: questions or pretrained model was not correctly specified.', 400
+    if 'file' not in request.files and ('table_schema_name' not in request.form or 'username' not in request.form):
+        return 'Invalid request: neither a table schema file nor a stored table schema was specified.', 400
+
+    pretrained_model_dir = request.form.get('pretrained_model')
+    if 'questions' in request.files:
+        questions = parse_batch_questions(request.files.get('questions').read().decode('utf-8'))
+    else:
+        questions = parse_batch_questions(request.form.get('questions'))
+
+    if len(questions) > app.config['MAX_BATCH_QUESTIONS']:
+        return 'Invalid request: at most {} questions can be translated at once.'.format(app.config['MAX_BATCH_QUESTIONS']), 413
+
+    endpoint = request.endpoint
+    start_time = time.perf_counter()
+    if 'file' in request.files:
+        table_data_dict = parse_table_schema(request.files.get('file'), pretrained_model_dir)
+    else:
+        username = request.form.get('username')
+        table_schema_name = request.form.get('table_schema_name')
+        with timed_stage(get_model_label(pretrained_model_dir), endpoint, STAGE_SCHEMA_LOOKUP):
+            table_data_dict = get_user_table_schema(username, table_schema_name)
+
+        if table_data_dict is None:
+            json_response = jsonify({
+                'status': 'table_schema_not_found',
+                'message': 'User \'{}\' has no table schema \'{}\'.'.format(username, table_schema_name)
+            })
+            return make_response(json_response, 404)
+
+    def generate_results():
+        # the questions are translated together, and the results are sent in input order as soon as they are ready
+        translations = translate_many_to_sql([question['question'] for question in questions if 'error' not in question], pretrained_model_dir,
+                                             table_data_dict, endpoint=endpoint)
+        for index, question in enumerate(questions):
+            result = {'index': index}
+            if 'id' in question:
+                result['id'] = question['id']
+
+            if 'error' in question:
+                result['error'] = question['error']
+            else:
+                translation, exception = next(translations)
+                if exception is not None:
+                    result['error'] = str(exception)
+                    if isinstance(exception, OverloadedError):
+                        shed_requests.labels(model=get_model_label(pretrained_model_dir), endpoint=endpoint, reason=exception.reason).inc()
+                else:
+                    result['query'] = translation
+
+            yield json.dumps(result) + '\n'
+
+        observe_request(pretrained_model_dir, endpoint, start_time)
+
+    return Response(stream_with_context(generate_results()), mimetype='application/x-ndjson')
+
+
 @app.route('/submit/schema', methods=['POST'])
 def submit_schema():
     if 'file' not in request.files or 'username' not in request.form:
@@ -96,7 +347,7 @@ def submit_schema():
 
     file_storage = request.files.get('file')
     username = request.form.get('username')
-    table_data_dict = get_table_schema_from_json(file_storage)
+    table_data_dict = parse_table_schema(file_storage)
     table_name = table_data_dict['table_name']
 
     table = UserTableSchema.query.filter_by(table_name=table_name, username=username).first()
@@ -104,12 +355,15 @@ def submit_schema():
         table = UserTableSchema(
             table_name=table_name,
             username=username,
-            column_names=','.join(table_data_dict['column_names']),
-            column_types=','.join(table_data_dict['column_types'])
+            columns=[
+                UserTableColumn(position=position, column_name=column_name, column_type=column_type)
+                for position, (column_name, column_type) in enumerate(zip(table_data_dict['column_names'], table_data_dict['column_types']))
+            ]
         )
 
         db.session.add(table)
         db.session.commit()
+        schema_cache.invalidate((username, table_name))
 
         json_response = jsonify({
             'status': 'table_schema_successfully_added',
@@ -198,5 +452,62 @@ def login():
     return make_response(json_response, 403)
 
 
+def migrate_database(engine):
+    # databases created before the per-column schema store keep every table schema as comma-joined names and types
+    inspector = inspect(engine)
+    legacy = 'user_table_schema' in inspector.get_table_names() and \
+        'column_names' in [column['name'] for column in inspector.get_columns('user_table_schema')]
+
+    with engine.begin() as connection:
+        if legacy:
+            connection.execute(text('ALTER TABLE user_table_schema RENAME TO legacy_user_table_schema'))
+        db.metadata.create_all(connection)
+        if not legacy:
+            return False
+
+        rows = connection.execute(text('SELECT username, table_name, column_names, column_types FROM legacy_user_table_schema')).all()
+        tables, columns = [], []
+        for username, table_name, column_names, column_types in rows:
+            tables.append({'username': username, 'table_name': table_name})
+            column_names = column_names.split(',') if column_names else []
+            column_types = column_types.split(',') if column_types else []
+            columns += [
+                {'username': username, 'table_name': table_name, 'position': position, 'column_name': column_name, 'column_type': column_type}
+                for position, (column_name, column_type) in enumerate(zip(column_names, column_types))
+            ]
+
+        if tables:
+            connection.execute(UserTableSchema.__table__.insert(), tables)
+        if columns:
+            connection.execute(UserTableColumn.__table__.insert(), columns)
+        connection.execute(text('DROP TABLE legacy_user_table_schema'))
+    return True
+
+
+def start_serving():
+    global serving_started
+    with serving_lock:
+        if serving_started:
+            return False
+        serving_started = True
+
+    with app.app_context():
+        migrate_database(db.engine)
+
+    preload_model_dirs = app.config['PRELOAD_MODELS'] if app.config['PRELOAD_MODELS'] is not None else get_all_pretrained_models_dir_names()
+    if app.config['INFERENCE_WORKERS'] > 0:
+        start_worker_pool(app.config['INFERENCE_WORKERS'], warmup_model_dirs=preload_model_dirs)
+
+    # requests are served during the warmup, /health only reports ready once it is done
+    threading.Thread(target=warm_up_pretrained_models, args=(preload_model_dirs,), daemon=True).start()
+    return True
+
+
+def create_app():
+    # the entry point of the WSGI servers (see wsgi.py), which never run this module as __main__
+    start_serving()
+    return app
+
+
 if __name__ == '__main__':
-    app.run()
+    create_app().run()
@@ -0,0 +1,34 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from loader import pretrained_loader
+from loader.stub_model import create_stub_pretrained_model
+
+
+SCHEMA_FILE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../../table_schemas/swe_employees.json')
+
+
+class StubModelTestCase(unittest.TestCase):
+    # the stub models served during the tests, by directory name, with the arguments they are created with
+    stub_models = {'stub': {}}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.pretrained_path = tempfile.mkdtemp()
+        for dir_name, stub_model_kwargs in cls.stub_models.items():
+            create_stub_pretrained_model(os.path.join(cls.pretrained_path, dir_name), **stub_model_kwargs)
+
+        cls.original_pretrained_path = pretrained_loader.PRETRAINED_MODELS_PATH
+        pretrained_loader.PRETRAINED_MODELS_PATH = cls.pretrained_path
+        pretrained_loader.refresh_pretrained_models_metadata(force=True)
+
+        with open(SCHEMA_FILE_PATH, 'rb') as file:
+            cls.schema = file.read()
+
+    @classmethod
+    def tearDownClass(cls):
+        pretrained_loader.PRETRAINED_MODELS_PATH = cls.original_pretrained_path
+        pretrained_loader.refresh_pretrained_models_metadata(force=True)
+        shutil.rmtree(cls.pretrained_path)
@@ -0,0 +1,64 @@
+import io
+import unittest
+
+from loader import pretrained_loader
+from web.sqlgen_server.app import app
+from web.sqlgen_server.tests.stub_model_test_case import StubModelTestCase
+
+
+class TestAdmissionControl(StubModelTestCase):
+    def setUp(self):
+        app.testing = True
+        self.app = app.test_client()
+        pretrained_loader.configure_translation_cache()
+        self.original_deadline_seconds = app.config['TRANSLATION_DEADLINE_SECONDS']
+
+    def tearDown(self):
+        app.config['TRANSLATION_DEADLINE_SECONDS'] = self.original_deadline_seconds
+
+    def submit_guest_query(self, natural_language_query):
+        return self.app.post('/submit/guest_query', data={
+            'file': (io.BytesIO(self.schema), 'swe_employees.json'),
+            'natural_language_query': natural_language_query,
+            'pretrained_model': 'stub'
+        })
+
+    def get_shed_requests(self, reason):
+        prefix = 'sqlgen_shed_requests_total{{model="stub",endpoint="submit_guest_query",reason="{}"}} '.format(reason)
+        lines = [line for line in self.app.get('/metrics').data.decode().splitlines() if line.startswith(prefix)]
+        return float(lines[0][len(prefix):]) if lines else 0.0
+
+    def test_requests_that_cannot_meet_their_deadline_are_shed(self):
+        shed_requests = self.get_shed_requests('deadline')
+
+        app.config['TRANSLATION_DEADLINE_SECONDS'] = 0
+        response = self.submit_guest_query('How old is the oldest employee?')
+
+        assert response.status_code == 503
+        assert int(response.headers['Retry-After']) >= 1
+        assert response.get_json()['status'] == 'overloaded'
+        assert self.get_shed_requests('deadline') == shed_requests + 1
+
+    def test_streamed_requests_are_shed_before_streaming(self):
+        app.config['TRANSLATION_DEADLINE_SECONDS'] = 0
+        response = self.app.post('/submit/guest_query/stream', data={
+            'file': (io.BytesIO(self.schema), 'swe_employees.json'),
+            'natural_language_query': 'Who earns the most?',
+            'pretrained_model': 'stub'
+        })
+
+        assert response.status_code == 503
+        assert int(response.headers['Retry-After']) >= 1
+
+    def test_cached_translations_are_not_shed(self):
+        assert self.submit_guest_query('Who is the youngest employee?').status_code == 200
+
+        app.config['TRANSLATION_DEADLINE_SECONDS'] = 0
+        assert self.submit_guest_query('Who is the youngest employee?').status_code == 200
+
+    def test_queue_depth_is_exported_per_priority(self):
+        self.submit_guest_query('Which employees work at Company X?')
+        metrics = self.app.get('/metrics').data.decode()
+
+        assert 'sqlgen_batch_queue_depth{model="stub",priority="high"} 0' in metrics
+        assert 'sqlgen_batch_queue_depth{model="stub",priority="low"} 0' in metrics
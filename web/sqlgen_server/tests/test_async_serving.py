@@ -0,0 +1,101 @@
+import io
+import json
+import threading
+import unittest
+
+from unittest import mock
+
+from loader import pretrained_loader
+from schema_parser.json_schema_parser import get_table_schema_from_json
+from web.sqlgen_server.app import app, db, schema_cache, UserTableColumn, UserTableSchema
+from web.sqlgen_server.tests.stub_model_test_case import StubModelTestCase
+
+
+TRANSLATION_THREADS = 16
+CHEAP_REQUESTS = 5
+
+
+class TestAsyncServing(StubModelTestCase):
+    def setUp(self):
+        app.testing = True
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        db.session.add(UserTableSchema(table_name='table_swe_employees', username='johndoe', columns=[
+            UserTableColumn(position=0, column_name='Name', column_type='text'),
+            UserTableColumn(position=1, column_name='Age', column_type='int')
+        ]))
+        db.session.commit()
+        schema_cache.clear()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def submit_guest_query(self, client, natural_language_query):
+        return client.post('/submit/guest_query', data={
+            'file': (io.BytesIO(self.schema), 'swe_employees.json'),
+            'natural_language_query': natural_language_query,
+            'pretrained_model': 'stub'
+        })
+
+    def query_cheap_endpoints(self, client):
+        for path in ['/pretrained_models_metadata', '/user_table_schemas/johndoe']:
+            response = client.get(path)
+            assert response.status_code == 200
+
+    def test_submit_endpoints_translate(self):
+        client = app.test_client()
+
+        response = self.submit_guest_query(client, 'How old is John?')
+        assert response.status_code == 200
+        table_data_dict = get_table_schema_from_json(io.BytesIO(self.schema))
+        assert json.loads(response.data)['query'] == pretrained_loader.translate_to_sql('How old is John?', 'stub', table_data_dict)
+
+        response = client.post('/submit/home_query', data={
+            'natural_language_query': 'How old is John?',
+            'pretrained_model': 'stub',
+            'table_schema_name': 'table_swe_employees',
+            'username': 'johndoe'
+        })
+        assert response.status_code == 200
+        assert isinstance(json.loads(response.data)['query'], str)
+
+    def test_cheap_endpoints_stay_responsive_while_translating(self):
+        client = app.test_client()
+        self.submit_guest_query(client, 'warmup')
+
+        # the generation is held until the cheap endpoints answered, so that they are shown to overlap with the translations
+        generating, release = threading.Event(), threading.Event()
+        translate_batch_to_sql = pretrained_loader.translate_batch_to_sql
+
+        def blocked_translate_batch_to_sql(pretrained_model_dir, items):
+            generating.set()
+            assert release.wait(timeout=60)
+            return translate_batch_to_sql(pretrained_model_dir, items)
+
+        translations = []
+
+        def translate(thread_index):
+            # distinct queries, so that every request goes through generation
+            response = self.submit_guest_query(app.test_client(), 'query of thread {}'.format(thread_index))
+            translations.append(response.status_code)
+
+        threads = [threading.Thread(target=translate, args=(thread_index,)) for thread_index in range(TRANSLATION_THREADS)]
+        with mock.patch('loader.pretrained_loader.translate_batch_to_sql', side_effect=blocked_translate_batch_to_sql):
+            for thread in threads:
+                thread.start()
+
+            try:
+                assert generating.wait(timeout=60)
+                for _ in range(CHEAP_REQUESTS):
+                    self.query_cheap_endpoints(client)
+                assert translations == []
+            finally:
+                release.set()
+                for thread in threads:
+                    thread.join()
+
+        assert len(translations) == TRANSLATION_THREADS and all(status_code == 200 for status_code in translations)
@@ -0,0 +1,122 @@
+import io
+import json
+import unittest
+
+from concurrent.futures import Future
+from unittest import mock
+
+from loader import pretrained_loader
+from schema_parser.json_schema_parser import get_table_schema_from_json
+from web.sqlgen_server.app import app, db, schema_cache
+from web.sqlgen_server.tests.stub_model_test_case import StubModelTestCase
+
+
+QUESTIONS = [
+    'How old is the oldest employee?',
+    'Which employees work at Company X?',
+    'What is the salary of Smith?',
+    'How many employees are there?',
+]
+
+
+class TestBatch(StubModelTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.table_data_dict = get_table_schema_from_json(io.BytesIO(cls.schema))
+
+    def setUp(self):
+        app.testing = True
+        self.app = app.test_client()
+        pretrained_loader.configure_translation_cache()
+
+    def submit_batch(self, questions_jsonl, **fields):
+        data = {'questions': (io.BytesIO(questions_jsonl.encode()), 'questions.jsonl'), 'pretrained_model': 'stub'}
+        data.update(fields)
+        if 'table_schema_name' not in fields:
+            data['file'] = (io.BytesIO(self.schema), 'swe_employees.json')
+        return self.app.post('/submit/batch', data=data)
+
+    def parse_results(self, response):
+        assert response.status_code == 200
+        assert response.mimetype == 'application/x-ndjson'
+        return [json.loads(line) for line in response.data.decode().splitlines()]
+
+    def test_results_are_returned_in_input_order(self):
+        questions_jsonl = '\n'.join(json.dumps({'id': 'q{}'.format(index), 'question': question}) for index, question in enumerate(QUESTIONS))
+        results = self.parse_results(self.submit_batch(questions_jsonl))
+
+        assert [result['index'] for result in results] == list(range(len(QUESTIONS)))
+        assert [result['id'] for result in results] == ['q{}'.format(index) for index in range(len(QUESTIONS))]
+
+        pretrained_loader.configure_translation_cache()
+        expected = [pretrained_loader.translate_to_sql(question, 'stub', self.table_data_dict) for question in QUESTIONS]
+        assert [result['query'] for result in results] == expected
+
+    def test_questions_are_batched(self):
+        pretrained_loader.configure_batching(max_batch_size=8, max_wait_ms=200)
+        pretrained_loader.batch_schedulers.pop('stub', None)
+        try:
+            self.parse_results(self.submit_batch('\n'.join(json.dumps(question) for question in QUESTIONS)))
+            batch_size = pretrained_loader.get_batching_stats()['stub']['batch_size']
+        finally:
+            pretrained_loader.configure_batching(max_batch_size=pretrained_loader.DEFAULT_MAX_BATCH_SIZE, max_wait_ms=pretrained_loader.DEFAULT_MAX_WAIT_MS)
+            pretrained_loader.batch_schedulers.pop('stub', None)
+
+        assert batch_size['count'] < len(QUESTIONS)
+
+    def test_invalid_questions_do_not_fail_the_batch(self):
+        results = self.parse_results(self.submit_batch('"{}"\nnot json\n{{"id": 7}}\n\n42\n"{}"'.format(QUESTIONS[0], QUESTIONS[1])))
+
+        assert len(results) == 5
+        assert 'query' in results[0] and 'query' in results[4]
+        assert results[1]['error'] == 'Invalid JSON line.'
+        assert results[2] == {'index': 2, 'id': 7, 'error': 'No question was specified.'}
+        assert 'error' in results[3]
+
+    def test_failed_translations_do_not_fail_the_batch(self):
+        submit_translation = pretrained_loader.submit_translation
+
+        def failing_submit_translation(query, *args, **kwargs):
+            if query != QUESTIONS[1]:
+                return submit_translation(query, *args, **kwargs)
+            future = Future()
+            future.set_exception(RuntimeError('generation failed'))
+            return future
+
+        with mock.patch.object(pretrained_loader, 'submit_translation', failing_submit_translation):
+            results = self.parse_results(self.submit_batch('\n'.join(json.dumps(question) for question in QUESTIONS[:3])))
+
+        assert results[1] == {'index': 1, 'error': 'generation failed'}
+        assert 'query' in results[0] and 'query' in results[2]
+
+    def test_batch_size_is_capped(self):
+        original_max_batch_questions = app.config['MAX_BATCH_QUESTIONS']
+        app.config['MAX_BATCH_QUESTIONS'] = 2
+        try:
+            response = self.submit_batch('\n'.join(json.dumps(question) for question in QUESTIONS[:3]))
+        finally:
+            app.config['MAX_BATCH_QUESTIONS'] = original_max_batch_questions
+
+        assert response.status_code == 413
+
+    def test_stored_table_schemas(self):
+        with app.app_context():
+            db.create_all()
+            schema_cache.clear()
+            try:
+                self.app.post('/submit/schema', data={'file': (io.BytesIO(self.schema), 'swe_employees.json'), 'username': 'johndoe'})
+
+                results = self.parse_results(self.submit_batch(json.dumps(QUESTIONS[0]), table_schema_name=self.table_data_dict['table_name'],
+                                                               username='johndoe'))
+                assert results[0]['query'] == pretrained_loader.translate_to_sql(QUESTIONS[0], 'stub', self.table_data_dict)
+
+                response = self.submit_batch(json.dumps(QUESTIONS[0]), table_schema_name=self.table_data_dict['table_name'], username='janedoe')
+                assert response.status_code == 404
+            finally:
+                db.session.remove()
+                db.drop_all()
+
+    def test_invalid_request(self):
+        response = self.app.post('/submit/batch', data={'questions': json.dumps(QUESTIONS[0]), 'pretrained_model': 'stub'})
+        assert response.status_code == 400
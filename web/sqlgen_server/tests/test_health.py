@@ -0,0 +1,81 @@
+import importlib
+import sys
+import time
+import unittest
+
+from unittest import mock
+
+from loader import pretrained_loader
+from web.sqlgen_server import app as app_module
+from web.sqlgen_server.app import app
+from web.sqlgen_server.tests.stub_model_test_case import StubModelTestCase
+
+
+class TestHealth(StubModelTestCase):
+    stub_models = {'stub': {}, 'code_stub': {'class_name': 'SQLCodeT5ColNameAware', 'metadata': {'constrained_decoding': True}}}
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        pretrained_loader.warmup_status.update(status=pretrained_loader.WARMUP_NOT_STARTED, models={})
+
+    def setUp(self):
+        app.testing = True
+        self.app = app.test_client()
+        pretrained_loader.warmup_status.update(status=pretrained_loader.WARMUP_NOT_STARTED, models={})
+
+    def test_not_ready_before_warmup(self):
+        response = self.app.get('/health')
+        assert response.status_code == 503
+        assert response.get_json()['status'] == 'not_started'
+
+    def test_ready_after_warming_up_all_models(self):
+        pretrained_loader.warm_up_pretrained_models()
+
+        response = self.app.get('/health')
+        assert response.status_code == 200
+
+        models = response.get_json()['models']
+        assert sorted(models) == ['code_stub', 'stub']
+        assert all(model['load_seconds'] >= 0 and model['warmup_seconds'] > 0 for model in models.values())
+        assert pretrained_loader.model_registry.contains('stub') and pretrained_loader.model_registry.contains('code_stub')
+
+    def test_warmup_failures_are_reported(self):
+        pretrained_loader.warm_up_pretrained_models(['stub', 'missing'])
+
+        response = self.app.get('/health')
+        assert response.status_code == 200
+        assert 'error' in response.get_json()['models']['missing']
+        assert 'error' not in response.get_json()['models']['stub']
+
+    def test_warmup_does_not_fill_the_translation_cache(self):
+        pretrained_loader.configure_translation_cache()
+        pretrained_loader.warm_up_pretrained_models(['stub'])
+        assert pretrained_loader.get_translation_cache_stats()['entries'] == 0
+
+    def test_wsgi_entry_point_warms_up_the_models_once(self):
+        original_preload_models = app.config['PRELOAD_MODELS']
+        app.config['PRELOAD_MODELS'] = ['stub']
+        app_module.serving_started = False
+        sys.modules.pop('web.sqlgen_server.wsgi', None)
+
+        try:
+            with mock.patch('web.sqlgen_server.app.warm_up_pretrained_models', wraps=pretrained_loader.warm_up_pretrained_models) as warm_up:
+                # the server imports the module, this one is never run as __main__
+                wsgi = importlib.import_module('web.sqlgen_server.wsgi')
+                assert wsgi.app is app
+                assert app_module.create_app() is app
+
+                client = wsgi.app.test_client()
+                deadline = time.monotonic() + 60
+                while client.get('/health').status_code != 200 and time.monotonic() < deadline:
+                    time.sleep(0.05)
+
+                response = client.get('/health')
+                assert response.status_code == 200
+                assert list(response.get_json()['models']) == ['stub']
+                assert warm_up.call_count == 1
+        finally:
+            app.config['PRELOAD_MODELS'] = original_preload_models
+            app_module.serving_started = False
+            sys.modules.pop('web.sqlgen_server.wsgi', None)
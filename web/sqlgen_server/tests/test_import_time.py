@@ -0,0 +1,13 @@
+import unittest
+
+from import_time_benchmark import STARTUP_MODULES, ImportTimeBenchmark
+
+
+class TestImportTime(unittest.TestCase):
+    def test_startup_modules_do_not_import_heavy_modules(self):
+        for module_name in STARTUP_MODULES:
+            heavy_modules = ImportTimeBenchmark.get_heavy_modules(ImportTimeBenchmark.measure_import_times(module_name))
+            self.assertEqual(heavy_modules, [], '{} imports {} at startup'.format(module_name, heavy_modules))
+
+    def test_heavy_modules_are_detected(self):
+        assert ImportTimeBenchmark.get_heavy_modules(ImportTimeBenchmark.measure_import_times('loader.stub_model')) != []
@@ -0,0 +1,105 @@
+import io
+import os
+import time
+import unittest
+
+from unittest import mock
+
+from loader import pretrained_loader
+from loader.stub_model import create_stub_pretrained_model
+from web.sqlgen_server.app import app
+from web.sqlgen_server.tests.stub_model_test_case import StubModelTestCase
+
+
+class TestMetrics(StubModelTestCase):
+    def setUp(self):
+        app.testing = True
+        self.app = app.test_client()
+        pretrained_loader.configure_translation_cache()
+
+    def submit(self, natural_language_query, schema=None):
+        return self.app.post('/submit/guest_query', data={
+            'file': (io.BytesIO(schema or self.schema), 'swe_employees.json'),
+            'natural_language_query': natural_language_query,
+            'pretrained_model': 'stub'
+        })
+
+    def get_metric_lines(self):
+        response = self.app.get('/metrics')
+        assert response.status_code == 200
+        assert response.mimetype == 'text/plain'
+        return response.data.decode().splitlines()
+
+    def get_metric_value(self, lines, prefix):
+        values = [float(line.rsplit(' ', 1)[1]) for line in lines if line.startswith(prefix + ' ')]
+        return values[0] if values else 0.0
+
+    def test_stages_are_timed_per_model_and_endpoint(self):
+        assert self.submit('How old is the oldest employee?').status_code == 200
+        lines = self.get_metric_lines()
+
+        for stage in ['schema_parsing', 'prompt_formatting', 'tokenization', 'generate', 'decoding']:
+            prefix = 'sqlgen_stage_seconds_count{{model="stub",endpoint="submit_guest_query",stage="{}"}}'.format(stage)
+            assert self.get_metric_value(lines, prefix) >= 1, stage
+        assert self.get_metric_value(lines, 'sqlgen_request_seconds_count{model="stub",endpoint="submit_guest_query"}') >= 1
+        assert self.get_metric_value(lines, 'sqlgen_model_loads_total{model="stub"}') >= 1
+        assert self.get_metric_value(lines, 'sqlgen_resident_model_bytes') > 0
+
+    def test_replaced_checkpoints_are_reloaded_on_the_next_translation(self):
+        prefix = 'sqlgen_model_loads_total{model="stub"}'
+        assert self.submit('How old is the oldest employee?').status_code == 200
+        loads = self.get_metric_value(self.get_metric_lines(), prefix)
+
+        # the same weights are written again, which is enough for the checkpoint to count as replaced
+        create_stub_pretrained_model(os.path.join(self.pretrained_path, 'stub'))
+        with mock.patch('loader.metadata_index.time.monotonic', return_value=time.monotonic() + pretrained_loader.METADATA_REFRESH_INTERVAL_SECONDS):
+            assert self.submit('How old is the oldest employee?').status_code == 200
+        assert self.get_metric_value(self.get_metric_lines(), prefix) == loads + 1
+
+    def test_cache_hits_and_misses_are_counted(self):
+        hits_prefix = 'sqlgen_translation_cache_hits_total{model="stub",endpoint="submit_guest_query"}'
+        misses_prefix = 'sqlgen_translation_cache_misses_total{model="stub",endpoint="submit_guest_query"}'
+        lines = self.get_metric_lines()
+        hits, misses = self.get_metric_value(lines, hits_prefix), self.get_metric_value(lines, misses_prefix)
+
+        self.submit('Which employees work at Company X?')
+        self.submit('Which employees work at Company X?')
+
+        lines = self.get_metric_lines()
+        assert self.get_metric_value(lines, hits_prefix) == hits + 1
+        assert self.get_metric_value(lines, misses_prefix) == misses + 1
+
+    def test_schema_parsing_failures_are_counted(self):
+        prefix = 'sqlgen_formatter_failures_total{formatter="table_schema",endpoint="submit_guest_query"}'
+        failures = self.get_metric_value(self.get_metric_lines(), prefix)
+
+        with self.assertRaises(Exception):
+            self.submit('Who?', schema=b'{"columns": []}')
+
+        assert self.get_metric_value(self.get_metric_lines(), prefix) == failures + 1
+
+    def test_prompt_formatting_failures_are_counted(self):
+        prefix = 'sqlgen_formatter_failures_total{formatter="prompt",endpoint="submit_guest_query"}'
+        failures = self.get_metric_value(self.get_metric_lines(), prefix)
+
+        with mock.patch('model_inputs.model_inputs.SQLT5Baseline.format_question_segment', side_effect=Exception('Could not format the question.')):
+            with self.assertRaises(Exception):
+                self.submit('Who is the oldest employee?')
+
+        assert self.get_metric_value(self.get_metric_lines(), prefix) == failures + 1
+
+    def test_unknown_models_share_a_label(self):
+        prefix = 'sqlgen_stage_seconds_count{model="unknown",endpoint="submit_guest_query",stage="schema_parsing"}'
+        count = self.get_metric_value(self.get_metric_lines(), prefix)
+
+        for pretrained_model_dir in ['missing', 'other_missing']:
+            with self.assertRaises(Exception):
+                self.app.post('/submit/guest_query', data={
+                    'file': (io.BytesIO(self.schema), 'swe_employees.json'),
+                    'natural_language_query': 'Who?',
+                    'pretrained_model': pretrained_model_dir
+                })
+
+        lines = self.get_metric_lines()
+        assert self.get_metric_value(lines, prefix) == count + 2
+        assert not any('missing' in line for line in lines)
@@ -0,0 +1,127 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from sqlalchemy import create_engine, event, text
+
+from web.sqlgen_server.app import app, db, get_user_table_schema, migrate_database, schema_cache
+from web.sqlgen_server.tests.stub_model_test_case import StubModelTestCase
+
+
+LONG_SCHEMA = {
+    'name': 'table_long',
+    'columns': [{'name': 'A rather long column name number {}'.format(index), 'type': 'text'} for index in range(60)]
+}
+
+
+class TestSchemaStore(StubModelTestCase):
+    def setUp(self):
+        app.testing = True
+        self.app = app.test_client()
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+        schema_cache.clear()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def submit_schema(self, username, schema):
+        return self.app.post('/submit/schema', data={'file': (io.BytesIO(json.dumps(schema).encode()), 'schema.json'), 'username': username})
+
+    def submit_home_query(self, username, table_schema_name):
+        return self.app.post('/submit/home_query', data={
+            'natural_language_query': 'How many employees are there?',
+            'pretrained_model': 'stub',
+            'table_schema_name': table_schema_name,
+            'username': username
+        })
+
+    def count_sql_statements(self, function):
+        statements = []
+
+        def before_cursor_execute(*args):
+            statements.append(args[2])
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            result = function()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+        return result, len(statements)
+
+    def test_schemas_are_looked_up_per_user(self):
+        assert self.submit_schema('alice', {'name': 'employees', 'columns': [{'name': 'Name', 'type': 'text'}]}).status_code == 201
+        assert self.submit_schema('bob', {'name': 'employees', 'columns': [{'name': 'Salary', 'type': 'real'}, {'name': 'Age', 'type': 'int'}]}).status_code == 201
+
+        assert get_user_table_schema('alice', 'employees') == {'table_name': 'employees', 'column_names': ['Name'], 'column_types': ['text']}
+        assert get_user_table_schema('bob', 'employees') == {'table_name': 'employees', 'column_names': ['Salary', 'Age'], 'column_types': ['real', 'int']}
+        assert get_user_table_schema('carol', 'employees') is None
+
+        assert self.app.get('/user_table_schemas/bob').get_json() == ['employees']
+
+    def test_long_schemas_keep_their_column_order(self):
+        assert self.submit_schema('alice', LONG_SCHEMA).status_code == 201
+
+        column_data_dict = get_user_table_schema('alice', 'table_long')
+        assert column_data_dict['column_names'] == [column['name'] for column in LONG_SCHEMA['columns']]
+        assert len(','.join(column_data_dict['column_names'])) > 100
+
+    def test_cached_schemas_run_no_sql(self):
+        self.submit_schema('alice', LONG_SCHEMA)
+
+        column_data_dict, statements = self.count_sql_statements(lambda: get_user_table_schema('alice', 'table_long'))
+        assert statements > 0
+
+        cached_column_data_dict, statements = self.count_sql_statements(lambda: get_user_table_schema('alice', 'table_long'))
+        assert statements == 0
+        assert cached_column_data_dict is column_data_dict
+        assert schema_cache.stats()['hits'] == 1
+
+    def test_schema_writes_invalidate_the_cache(self):
+        schema_cache.put(('alice', 'employees'), {'table_name': 'employees', 'column_names': ['Stale'], 'column_types': ['text']})
+        self.submit_schema('alice', {'name': 'employees', 'columns': [{'name': 'Name', 'type': 'text'}]})
+
+        assert get_user_table_schema('alice', 'employees')['column_names'] == ['Name']
+        assert schema_cache.stats()['invalidations'] == 1
+
+    def test_home_query(self):
+        self.submit_schema('alice', {'name': 'employees', 'columns': [{'name': 'Name', 'type': 'text'}]})
+
+        response = self.submit_home_query('alice', 'employees')
+        assert response.status_code == 200
+        assert 'query' in response.get_json()
+
+        # another user's table is not visible
+        response = self.submit_home_query('bob', 'employees')
+        assert response.status_code == 404
+        assert response.get_json()['status'] == 'table_schema_not_found'
+
+        response = self.app.post('/submit/home_query', data={'natural_language_query': 'Who?', 'pretrained_model': 'stub', 'table_schema_name': 'employees'})
+        assert response.status_code == 400
+
+    def test_legacy_schemas_are_migrated(self):
+        database_dir = tempfile.mkdtemp()
+        engine = create_engine('sqlite:///' + os.path.join(database_dir, 'legacy.db'))
+
+        try:
+            with engine.begin() as connection:
+                connection.execute(text('CREATE TABLE user_table_schema (table_name VARCHAR(50) NOT NULL, username VARCHAR(50) NOT NULL, '
+                                        'column_names VARCHAR(100), column_types VARCHAR(100), PRIMARY KEY (table_name, username))'))
+                connection.execute(text('INSERT INTO user_table_schema VALUES (\'employees\', \'alice\', \'Name,Age\', \'text,int\')'))
+
+            assert migrate_database(engine)
+            assert not migrate_database(engine)
+
+            with engine.connect() as connection:
+                assert connection.execute(text('SELECT username, table_name FROM user_table_schema')).all() == [('alice', 'employees')]
+                columns = connection.execute(text('SELECT position, column_name, column_type FROM user_table_column ORDER BY position')).all()
+                assert columns == [(0, 'Name', 'text'), (1, 'Age', 'int')]
+        finally:
+            engine.dispose()
+            shutil.rmtree(database_dir)
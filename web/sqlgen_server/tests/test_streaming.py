@@ -0,0 +1,60 @@
+import io
+import json
+import unittest
+
+from loader import pretrained_loader
+from schema_parser.json_schema_parser import get_table_schema_from_json
+from web.sqlgen_server.app import app
+from web.sqlgen_server.tests.stub_model_test_case import StubModelTestCase
+
+
+def parse_server_sent_events(data):
+    events = []
+    for block in data.decode().split('\n\n'):
+        if block:
+            event_line, data_line = block.split('\n')
+            events.append((event_line[len('event: '):], json.loads(data_line[len('data: '):])))
+    return events
+
+
+class TestStreaming(StubModelTestCase):
+    def setUp(self):
+        app.testing = True
+        self.app = app.test_client()
+        pretrained_loader.configure_translation_cache()
+
+    def submit(self, natural_language_query, **kwargs):
+        return self.app.post('/submit/guest_query/stream', data={
+            'file': (io.BytesIO(self.schema), 'swe_employees.json'),
+            'natural_language_query': natural_language_query,
+            'pretrained_model': 'stub'
+        }, **kwargs)
+
+    def test_fragments_add_up_to_the_translation(self):
+        response = self.submit('How old is the oldest employee?')
+        assert response.status_code == 200
+        assert response.mimetype == 'text/event-stream'
+
+        events = parse_server_sent_events(response.data)
+        fragments = [data['text'] for event, data in events if event == 'fragment']
+        event, done = events[-1]
+
+        assert len(fragments) > 1
+        assert event == 'done'
+        assert done['query'] == ''.join(fragments)
+        assert 0 <= done['time_to_first_token_ms'] <= done['total_ms']
+
+        pretrained_loader.configure_translation_cache()
+        assert done['query'] == pretrained_loader.translate_to_sql('How old is the oldest employee?', 'stub', get_table_schema_from_json(io.BytesIO(self.schema)))
+
+    def test_disconnecting_cancels_the_translation(self):
+        response = self.submit('Who earns the most?', buffered=False)
+        next(response.response)
+        response.close()
+
+        # a cancelled translation is incomplete, so it is not cached
+        assert pretrained_loader.get_translation_cache_stats()['entries'] == 0
+
+    def test_invalid_request(self):
+        response = self.app.post('/submit/guest_query/stream', data={'natural_language_query': 'Who?'})
+        assert response.status_code == 400
@@ -0,0 +1,5 @@
+from web.sqlgen_server.app import create_app
+
+
+# served with e.g. gunicorn web.sqlgen_server.wsgi:app, the models are preloaded and warmed up when the server imports this module
+app = create_app()
@@ -12,7 +12,7 @@ import {ModelMetadata} from "../models";
 export class GuestPageComponent {
   private readonly SERVER_URL = 'http://127.0.0.1:5000';
   private readonly SERVER_METADATA_ROUTE = '/pretrained_models_metadata'
-  private readonly SERVER_SUBMIT_GUEST_QUERY_ROUTE = '/submit/guest_query'
+  private readonly SERVER_SUBMIT_GUEST_QUERY_ROUTE = '/submit/guest_query/stream'
 
   private metadata: Map<string, ModelMetadata> = new Map<string, ModelMetadata>();
   private selected_pretrained_model = '';
@@ -59,14 +59,44 @@ export class GuestPageComponent {
     form_data.append('natural_language_query', this.natural_language_query);
     form_data.append('pretrained_model', model_dir);
 
-    this.httpClient.post<any>(url, form_data).pipe(catchError(this.handleError<undefined>('onSubmitQueryButton', undefined))).subscribe(
-      (result) => {
-        result = result['query'];
+    const text_to_sql_result_input = document.getElementById('text_to_sql_result') as HTMLInputElement;
+    text_to_sql_result_input.value = '';
 
-        const text_to_sql_result_input = document.getElementById('text_to_sql_result') as HTMLInputElement;
-        text_to_sql_result_input.value = result;
+    // the query is shown fragment by fragment, as the server sends the translation events
+    fetch(url, {method: 'POST', body: form_data}).then(async (response) => {
+      if (!response.ok || !response.body) {
+        throw new Error(await response.text());
       }
-    );
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+
+      while (true) {
+        const {done, value} = await reader.read();
+        if (done) {
+          break;
+        }
+
+        buffer += decoder.decode(value, {stream: true});
+        const events = buffer.split('\n\n');
+        buffer = events.pop() ?? '';
+
+        for (const event of events) {
+          const [event_line, data_line] = event.split('\n');
+          const event_name = event_line.substring('event: '.length);
+          const data = JSON.parse(data_line.substring('data: '.length));
+
+          if (event_name === 'fragment') {
+            text_to_sql_result_input.value += data['text'];
+          } else if (event_name === 'done') {
+            text_to_sql_result_input.value = data['query'];
+          } else if (event_name === 'error') {
+            this.alertService.error(data['message']);
+          }
+        }
+      }
+    }).catch((error) => this.alertService.error(error));
   }
 
   private getModelDirFromName(name: string): string | null {
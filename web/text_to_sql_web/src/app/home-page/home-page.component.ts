@@ -63,16 +63,23 @@ export class HomePageComponent {
   onSubmitQueryButton(): void {
     const model_dir = this.getModelDirFromName(this.selected_pretrained_model)
     const url = this.SERVER_URL + this.SERVER_SUBMIT_HOME_QUERY_ROUTE;
+    const username = this.accountService.userValue?.username;
 
     if (!this.selected_table_schema || !model_dir || this.natural_language_query === '') {
       this.alertService.error('No query, pretrained model, or table schema selected.');
       return;
     }
 
+    if (!username) {
+      this.alertService.error('Invalid username.');
+      return;
+    }
+
     const form_data: FormData = new FormData();
     form_data.append('natural_language_query', this.natural_language_query);
     form_data.append('pretrained_model', model_dir);
     form_data.append('table_schema_name', this.selected_table_schema);
+    form_data.append('username', username);
 
     this.httpClient.post<any>(url, form_data).pipe(catchError(this.handleError<undefined>('onSubmitQueryButton', undefined))).subscribe(
       (result) => {
@@ -1,50 +1,107 @@
-import torch
 import logging
 import json
+import math
+import multiprocessing
 import re
 import random
 import argparse
 
-from datasets import load_dataset
+from concurrent.futures import ProcessPoolExecutor
 
-from lib.dbengine import DBEngine
+from eval.gold_result_cache import GoldResultCache, get_default_gold_cache_path, get_gold_result_key
+from lib.dbengine import BACKEND_RECORDS, BACKEND_SQLITE3, DB_MODE_DISK, DB_MODES, DBEngine, get_table_id
 from lib.query import Query
 from lib.common import count_lines
 
 from formatter.wikisql_formatter import WikiSQLFormatter
 
 
+# shards of the test rows per evaluation worker, more shards than workers balance the load between them
+SHARDS_PER_WORKER = 4
+
+EXCEPTION_INVALID_COLUMN = 'invalid_column'
+EXCEPTION_OTHER = 'other'
+
+
 def load_predictions_from_file(file_path):
     with open(file_path, 'r', encoding='utf-8') as file:
         predictions = file.read().splitlines()
     return predictions
 
 
-if __name__ == '__main__':
-    logging.basicConfig(format='%(asctime)s : %(name)s - %(levelname)s : %(message)s')
-    logger = logging.getLogger('root')
-    logger.setLevel(logging.INFO)
+def log_metrics(metrics):
+    print('Row no.: {}, Wrong ex. no.: {}, Wrong match no.: {}, Invalid column exceptions: {}, All exceptions: {}'.format(metrics['row_no'], metrics['wrong_ex_no'], metrics['wrong_match_no'], metrics['invalid_column_exceptions'], metrics['all_exceptions']))
+    print('Ex_accuracy: {}, Lf_accuracy: {}'.format(metrics['ex_accuracy'], metrics['lf_accuracy']))
+    print('Full_ex_accuracy: {}, Full_lf_accuracy: {}\n'.format(metrics['full_ex_accuracy'], metrics['full_lf_accuracy']))
 
-    parser = argparse.ArgumentParser(
-        prog='Text-to-SQL',
-        description='WikiSQL evaluation script',
-    )
 
-    parser.add_argument('--predictions-path', type=str, required=True, help='Specify the location of the model predictions')
-    args = parser.parse_args()
+def compute_metrics(row_no, wrong_ex_no, wrong_match_no, invalid_column_exceptions, all_exceptions, grades, exact_match):
+    return {
+        'row_no': row_no,
+        'wrong_ex_no': wrong_ex_no,
+        'wrong_match_no': wrong_match_no,
+        'invalid_column_exceptions': invalid_column_exceptions,
+        'all_exceptions': all_exceptions,
+        'ex_accuracy': sum(grades) / len(grades) if grades else 0.0,
+        'lf_accuracy': sum(exact_match) / len(exact_match) if exact_match else 0.0,
+        'full_ex_accuracy': (sum(grades)) / (len(grades) + all_exceptions) if row_no else 0.0,
+        'full_lf_accuracy': (sum(exact_match)) / (len(exact_match) + all_exceptions) if row_no else 0.0,
+    }
 
-    predictions_path = args.predictions_path
-    test_data = load_dataset('wikisql', split='test')
 
-    predictions = load_predictions_from_file(predictions_path)
-    logger.info('All predictions were stored in memory ({} predictions in total).'.format(len(predictions)))
+def get_gold_query(row, ordered=False):
+    # eliminate special char from where conditions
+    condition_lst = [cond.replace('\u2009', ' ') for cond in row['sql']['conds']['condition']]
+    column_idx_lst = row['sql']['conds']['column_index']
+    operator_idx_lst = row['sql']['conds']['operator_index']
 
-    db_file = 'data/test.db'
-    engine = DBEngine(db_file)
+    wikisql_conds_dict = []
+    for i in range(len(column_idx_lst)):
+        wikisql_conds_dict.append([column_idx_lst[i], operator_idx_lst[i], condition_lst[i]])
+
+    gold_sql = {'sel': row['sql']['sel'], 'agg': row['sql']['agg'], 'conds': wikisql_conds_dict}
+    return get_table_id(row['table']['id']), Query.from_dict(gold_sql, ordered=ordered)
+
+
+def evaluate_row(row, predicted_query, engine, ordered=False, gold_results=None):
+    human_readable = row['sql']['human_readable']
+    table_id, correct_result_repr = get_gold_query(row, ordered)
+
+    # gold results are only executed once per database, when a cache of them is given
+    gold_result_key = get_gold_result_key(table_id, correct_result_repr) if gold_results is not None else None
+    if gold_result_key is not None and gold_result_key in gold_results:
+        correct_result = gold_results[gold_result_key]
+    else:
+        correct_result = engine.execute_query(table_id, correct_result_repr, lower=True)
+        if gold_result_key is not None:
+            gold_results[gold_result_key] = correct_result
+
+    try:
+        predicted_wikisql_format = WikiSQLFormatter.encode_query_into_wikisql_sql_dict(predicted_query, row['table']['header'])
+    except Exception as e:
+        return {'correct': None, 'match': None, 'exception': EXCEPTION_INVALID_COLUMN if str(e) == 'Invalid SQL human readable query.' else EXCEPTION_OTHER}
 
+    predicted_wikisql_format.pop('human_readable')
+
+    predicted_column_idx_lst = predicted_wikisql_format['conds']['column_index']
+    predicted_operator_idx_lst = predicted_wikisql_format['conds']['operator_index']
+    predicted_condition_lst = predicted_wikisql_format['conds']['condition']
+
+    wikisql_predicted_conds_dict = []
+    for i in range(len(predicted_column_idx_lst)):
+        wikisql_predicted_conds_dict.append([predicted_column_idx_lst[i], predicted_operator_idx_lst[i], predicted_condition_lst[i]])
+
+    predicted_wikisql_format['conds'] = wikisql_predicted_conds_dict
+
+    predicted_repr = Query.from_dict(predicted_wikisql_format, ordered=ordered)
+    predicted_result = engine.execute_query(table_id, predicted_repr, lower=True)
+
+    return {'correct': correct_result == predicted_result, 'match': human_readable.lower() == predicted_query.lower(), 'exception': None}
+
+
+def merge_outcomes(outcomes, verbose=True):
     grades = []
     exact_match = []
-    ordered = False
 
     row_no = 0
     wrong_ex_no = 0
@@ -52,75 +109,122 @@ if __name__ == '__main__':
     all_exceptions = 0
     invalid_column_exceptions = 0
 
-    for row in test_data:
+    for outcome in outcomes:
         row_no += 1
 
-        if row_no % 100 == 0:
-            print('Row no.: {}, Wrong ex. no.: {}, Wrong match no.: {}, Invalid column exceptions: {}, All exceptions: {}'.format(row_no, wrong_ex_no, wrong_match_no, invalid_column_exceptions, all_exceptions))
-            print('Ex_accuracy: {}, Lf_accuracy: {}'.format(sum(grades) / len(grades), sum(exact_match) / len(exact_match)))
-            print('Full_ex_accuracy: {}, Full_lf_accuracy: {}\n'.format((sum(grades)) / (len(grades) + all_exceptions), (sum(exact_match)) / (len(exact_match) + all_exceptions)))
+        if verbose and row_no % 100 == 0:
+            log_metrics(compute_metrics(row_no, wrong_ex_no, wrong_match_no, invalid_column_exceptions, all_exceptions, grades, exact_match))
+
+        if outcome['exception'] is not None:
+            if outcome['exception'] == EXCEPTION_INVALID_COLUMN:
+                invalid_column_exceptions += 1
 
-        # eliminate special char from where conditions
-        row['sql']['conds']['condition'] = [cond.replace('\u2009', ' ') for cond in row['sql']['conds']['condition']]
-        human_readable = row['sql'].pop('human_readable')
+            all_exceptions += 1
+            continue
 
-        column_idx_lst = row['sql']['conds']['column_index']
-        operator_idx_lst = row['sql']['conds']['operator_index']
-        condition_lst = row['sql']['conds']['condition']
+        if not outcome['correct']:
+            wrong_ex_no += 1
+        if not outcome['match']:
+            wrong_match_no += 1
 
-        wikisql_conds_dict = []
-        for i in range(len(column_idx_lst)):
-            wikisql_conds_dict.append([column_idx_lst[i], operator_idx_lst[i], condition_lst[i]])
+        grades.append(outcome['correct'])
+        exact_match.append(outcome['match'])
 
-        row['sql']['conds'] = wikisql_conds_dict
+    return compute_metrics(row_no, wrong_ex_no, wrong_match_no, invalid_column_exceptions, all_exceptions, grades, exact_match)
 
-        table_id = row['table']['id']
-        if not table_id.startswith('table'):
-            table_id = 'table_{}'.format(table_id.replace('-', '_'))
 
-        correct_result_repr = Query.from_dict(row['sql'], ordered=ordered)
-        correct_result = engine.execute_query(table_id, correct_result_repr, lower=True)
+def evaluate_predictions(test_data, predictions, engine, ordered=False, verbose=True, gold_results=None):
+    # predicted_query = human_readable
+    # predicted_query = translate_to_sql(device, model, tokenizer, prepare_natural_language_query_pretrained4_5, row['question'], row['table'])
+    outcomes = (evaluate_row(row, predictions[row_index], engine, ordered, gold_results) for row_index, row in enumerate(test_data))
+    return merge_outcomes(outcomes, verbose)
 
-        # predicted_query = human_readable
-        # predicted_query = translate_to_sql(device, model, tokenizer, prepare_natural_language_query_pretrained4_5, row['question'], row['table'])
-        predicted_query = predictions[row_no - 1]
 
-        try:
-            predicted_wikisql_format = WikiSQLFormatter.encode_query_into_wikisql_sql_dict(predicted_query, row['table']['header'])
-        except Exception as e:
-            if str(e) == 'Invalid SQL human readable query.':
-                invalid_column_exceptions += 1
+def evaluate_shard(db_file, rows, predictions, ordered=False, db_backend=BACKEND_RECORDS, db_mode=DB_MODE_DISK, gold_results=None):
+    engine = DBEngine(db_file, read_only=True, preload_schemas=True, backend=db_backend, mode=db_mode)
+    gold_results = {} if gold_results is None else gold_results
+    outcomes = [evaluate_row(row, predicted_query, engine, ordered, gold_results) for row, predicted_query in zip(rows, predictions)]
+    return outcomes, gold_results
 
-            all_exceptions += 1
-            continue
 
-        predicted_wikisql_format.pop('human_readable')
+def evaluate_predictions_parallel(test_data, predictions, db_file, workers, ordered=False, verbose=True, db_backend=BACKEND_RECORDS, db_mode=DB_MODE_DISK,
+                                  gold_results=None):
+    if len(predictions) < len(test_data):
+        raise Exception('There are fewer predictions ({}) than test rows ({}).'.format(len(predictions), len(test_data)))
 
-        predicted_column_idx_lst = predicted_wikisql_format['conds']['column_index']
-        predicted_operator_idx_lst = predicted_wikisql_format['conds']['operator_index']
-        predicted_condition_lst = predicted_wikisql_format['conds']['condition']
+    # the shards are contiguous and merged back in order, so that the metrics are exactly those of the serial evaluation
+    shard_size = max(1, math.ceil(len(test_data) / (workers * SHARDS_PER_WORKER)))
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        futures = []
+        for start in range(0, len(test_data), shard_size):
+            end = min(start + shard_size, len(test_data))
+            rows = [test_data[row_index] for row_index in range(start, end)]
 
-        wikisql_predicted_conds_dict = []
-        for i in range(len(predicted_column_idx_lst)):
-            wikisql_predicted_conds_dict.append([predicted_column_idx_lst[i], predicted_operator_idx_lst[i], predicted_condition_lst[i]])
+            # each shard only gets the cached gold results of its own rows
+            shard_gold_results = {}
+            if gold_results is not None:
+                for row in rows:
+                    gold_result_key = get_gold_result_key(*get_gold_query(row, ordered))
+                    if gold_result_key in gold_results:
+                        shard_gold_results[gold_result_key] = gold_results[gold_result_key]
 
-        predicted_wikisql_format['conds'] = wikisql_predicted_conds_dict
+            futures.append(executor.submit(evaluate_shard, db_file, rows, predictions[start:end], ordered, db_backend, db_mode, shard_gold_results))
 
-        predicted_repr = Query.from_dict(predicted_wikisql_format, ordered=ordered)
-        predicted_result = engine.execute_query(table_id, predicted_repr, lower=True)
+        outcomes = []
+        for future in futures:
+            shard_outcomes, shard_gold_results = future.result()
+            outcomes += shard_outcomes
+            if gold_results is not None:
+                for gold_result_key, gold_result in shard_gold_results.items():
+                    gold_results[gold_result_key] = gold_result
 
-        correct = correct_result == predicted_result
-        match = human_readable.lower() == predicted_query.lower()
+    return merge_outcomes(outcomes, verbose)
 
-        if not correct:
-            wrong_ex_no += 1
-        if not match:
-            wrong_match_no += 1
 
-        grades.append(correct)
-        exact_match.append(match)
+if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)s : %(name)s - %(levelname)s : %(message)s')
+    logger = logging.getLogger('root')
+    logger.setLevel(logging.INFO)
+
+    parser = argparse.ArgumentParser(
+        prog='Text-to-SQL',
+        description='WikiSQL evaluation script',
+    )
+
+    parser.add_argument('--predictions-path', type=str, required=True, help='Specify the location of the model predictions')
+    parser.add_argument('--workers', type=int, default=1, help='Specify the number of evaluation worker processes (the rows are evaluated serially by default)')
+    parser.add_argument('--db-backend', type=str, default=BACKEND_RECORDS, choices=[BACKEND_RECORDS, BACKEND_SQLITE3],
+                        help='Specify the library the queries are executed with on the WikiSQL database')
+    parser.add_argument('--db-mode', type=str, default=DB_MODE_DISK, choices=DB_MODES,
+                        help='Specify whether the WikiSQL database is read from disk, memory-mapped, or copied into memory (the last two need the sqlite3 backend)')
+    parser.add_argument('--gold-cache-path', type=str, default=None, help='Specify the file where the results of the gold queries are cached (next to the database by default)')
+    parser.add_argument('--no-gold-cache', action='store_true', help='Execute the gold queries on every run instead of caching their results')
+    args = parser.parse_args()
+
+    from datasets import load_dataset
+
+    predictions_path = args.predictions_path
+    test_data = load_dataset('wikisql', split='test')
+
+    predictions = load_predictions_from_file(predictions_path)
+    logger.info('All predictions were stored in memory ({} predictions in total).'.format(len(predictions)))
+
+    db_file = 'data/test.db'
+    gold_results = None
+    if not args.no_gold_cache:
+        gold_results = GoldResultCache(args.gold_cache_path or get_default_gold_cache_path(db_file), db_file)
+        logger.info('{} gold results were loaded from {}.'.format(len(gold_results), gold_results.path))
+
+    if args.workers > 1:
+        metrics = evaluate_predictions_parallel(test_data, predictions, db_file, args.workers, db_backend=args.db_backend, db_mode=args.db_mode,
+                                                gold_results=gold_results)
+    else:
+        engine = DBEngine(db_file, preload_schemas=True, backend=args.db_backend, mode=args.db_mode)
+        metrics = evaluate_predictions(test_data, predictions, engine, gold_results=gold_results)
+
+    if gold_results is not None:
+        logger.info('{} new gold results were stored in {}.'.format(gold_results.new_results, gold_results.path))
+        gold_results.save()
 
     print('\n----- FINAL METRICS -----')
-    print('Row no.: {}, Wrong ex. no.: {}, Wrong match no.: {}, Invalid column exceptions: {}, All exceptions: {}'.format(row_no, wrong_ex_no, wrong_match_no, invalid_column_exceptions, all_exceptions))
-    print('Ex_accuracy: {}, Lf_accuracy: {}'.format(sum(grades) / len(grades), sum(exact_match) / len(exact_match)))
-    print('Full_ex_accuracy: {}, Full_lf_accuracy: {}\n'.format((sum(grades)) / (len(grades) + all_exceptions), (sum(exact_match)) / (len(exact_match) + all_exceptions)))
+    log_metrics(metrics)